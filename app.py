@@ -34,9 +34,53 @@ from settings import (
     TIME_GROUPING_FREQ,
     CACHE_TTL_SECONDS,
     ANALYTICS_MAX_ROWS,
+    ANALYTICS_BACKEND,
+    ANALYTICS_ONLINE_STATS,
+    ANALYTICS_SKETCH_ALPHA,
+    ANALYTICS_SAMPLE_STRATA,
+    ANALYTICS_CONFIDENCE,
+    SPARK_SAMPLE_SIZE,
+    MONGO_PUSHDOWN,
+    MONGO_LIVE,
+    MONGO_LIVE_POLL_S,
+    CATEGORY_COLS,
+    CATEGORY_MAX_CARD,
 )
 
-# ====== Mini "math_utils" interno (sin dependencia externa) ======
+# ====== Store local (CSV de import/export + Parquet tipado) ======
+from storage_config import (
+    columnar_enabled,
+    file_fingerprint,
+    get_store_path,
+    store_is_stale,
+    read_parquet_store,
+    write_parquet_atomic,
+    import_csv_to_store,
+    read_csv_chunked,
+    WAL_COMPACT_ROWS,
+    get_wal_path,
+    wal_append,
+    wal_read,
+    wal_count,
+    wal_clear,
+    merge_wal,
+    get_fingerprint_path,
+    get_rollup_path,
+    read_rollup,
+    write_rollup,
+)
+from dataset_cache import DatasetCache
+from rollup import MonthlyRollup
+from online_stats import ColumnStats, StatsStore
+from correlation import CorrelationStore, corr_frame
+from sampling import Sample, SampleStore, describe_ci, percentiles_ci, outlier_counts_ci, correlation_ci
+from math_utils import TimeSeriesContext, ts_context, resample_rule, batch_series
+from pk_index import PKIndex
+from mongo_query import build_filter, count_matches, find_page
+from filter_engine import FilterEngine
+from pagination import ViewCache, KeysetPager, view_signature, sorted_positions, page_slice
+
+# ====== Mini "math_utils" interno (series de tiempo: math_utils.TimeSeriesContext) ======
 class _MU:
     @staticmethod
     def _num_series(df: pd.DataFrame, col: str) -> pd.Series:
@@ -84,14 +128,20 @@ class _MU:
 
     @staticmethod
     def correlation_matrix(df: pd.DataFrame, method: str = "pearson") -> pd.DataFrame:
-        num = df.select_dtypes(include=[np.number]).copy()
+        num = df.select_dtypes(include=[np.number])
         if num.empty:
             return pd.DataFrame()
-        return num.corr(method=method)
+        cached = _correlation(df, method, list(num.columns))
+        return cached if cached is not None else corr_frame(num, method=method)
 
     # ---- Series de tiempo ----
     @staticmethod
     def _prep_ts(df: pd.DataFrame, date_col: str, val_col: str, freq: str, agg: str) -> pd.Series:
+        # serie mensual de created_at: desde el rollup materializado (sin re-agrupar el frame)
+        if freq == "M" and agg in ("sum", "mean") and date_col == "created_at":
+            roll = _monthly_rollup(df)
+            if roll is not None and val_col in roll.metrics:
+                return roll.series(val_col, agg)
         d = pd.to_datetime(df[date_col], errors="coerce")
         v = pd.to_numeric(df[val_col], errors="coerce")
         ts = pd.DataFrame({"date": d, "val": v}).dropna()
@@ -101,63 +151,51 @@ class _MU:
         if freq not in {"D", "W", "M"}:
             freq = "M"
         if agg == "sum":
-            s = ts["val"].resample(freq).sum(min_count=1)
+            s = ts["val"].resample(resample_rule(freq)).sum(min_count=1)
         else:
-            s = ts["val"].resample(freq).mean()
+            s = ts["val"].resample(resample_rule(freq)).mean()
         return s
 
+    @staticmethod
+    def _ctx(df: pd.DataFrame, date_col: str, val_col: str, freq: str, agg: str) -> TimeSeriesContext:
+        # una preparación por (frame, columnas, freq, agg): las 5 vistas del render la comparten
+        return ts_context(df, date_col, val_col, freq=freq, agg=agg, builder=_MU._prep_ts)
+
     @staticmethod
     def rolling_sma(df: pd.DataFrame, date_col: str, val_col: str, window: int = 6, freq: str = "M", agg: str = "sum") -> pd.DataFrame:
-        s = _MU._prep_ts(df, date_col, val_col, freq, agg)
-        if s.empty:
+        ctx = _MU._ctx(df, date_col, val_col, freq, agg)
+        if ctx.empty:
             return pd.DataFrame()
-        out = pd.DataFrame({val_col: s})
-        out[f"sma_{window}"] = s.rolling(window=window, min_periods=1).mean()
-        return out
+        return pd.DataFrame({val_col: ctx.series, f"sma_{window}": ctx.sma(window)})
 
     @staticmethod
     def rolling_ema(df: pd.DataFrame, date_col: str, val_col: str, span: int = 6, freq: str = "M", agg: str = "sum") -> pd.DataFrame:
-        s = _MU._prep_ts(df, date_col, val_col, freq, agg)
-        if s.empty:
+        ctx = _MU._ctx(df, date_col, val_col, freq, agg)
+        if ctx.empty:
             return pd.DataFrame()
-        out = pd.DataFrame({val_col: s})
-        out[f"ema_{span}"] = s.ewm(span=span, adjust=False, min_periods=1).mean()
-        return out
+        return pd.DataFrame({val_col: ctx.series, f"ema_{span}": ctx.ema(span)})
 
     @staticmethod
     def monthly_growth(df: pd.DataFrame, date_col: str, val_col: str, agg: str = "sum") -> pd.DataFrame:
-        s = _MU._prep_ts(df, date_col, val_col, "M", agg)
-        if s.empty:
+        ctx = _MU._ctx(df, date_col, val_col, "M", agg)
+        if ctx.empty:
             return pd.DataFrame(columns=["value", "mom_pct"])
-        out = pd.DataFrame({"value": s})
-        out["mom_pct"] = out["value"].pct_change() * 100.0
-        return out
+        return pd.DataFrame({"value": ctx.series, "mom_pct": ctx.mom_pct()})
 
     @staticmethod
     def cagr(df: pd.DataFrame, date_col: str, val_col: str, agg: str = "sum") -> Optional[float]:
-        s = _MU._prep_ts(df, date_col, val_col, "M", agg)
-        if s.empty or (s.first_valid_index() is None) or (s.last_valid_index() is None):
-            return None
-        start, end = s.iloc[0], s.iloc[-1]
-        if not (np.isfinite(start) and np.isfinite(end)) or start <= 0 or end <= 0:
-            return None
-        n_years = max((len(s) / 12.0), 0.001)  # años aprox
-        val = (end / start) ** (1.0 / n_years) - 1.0
-        return float(val * 100.0)
+        return _MU._ctx(df, date_col, val_col, "M", agg).cagr("length")
 
     @staticmethod
     def linear_trend(df: pd.DataFrame, date_col: str, val_col: str, freq: str = "M", agg: str = "sum") -> Dict[str, float]:
-        s = _MU._prep_ts(df, date_col, val_col, freq, agg).dropna()
-        if len(s) < 2:
-            return {"slope": np.nan, "r2": np.nan}
-        x = np.arange(len(s), dtype=float)
-        y = s.values.astype(float)
-        slope, intercept = np.polyfit(x, y, 1)
-        yhat = slope * x + intercept
-        ss_res = float(((y - yhat) ** 2).sum())
-        ss_tot = float(((y - y.mean()) ** 2).sum())
-        r2 = 1.0 - (ss_res / ss_tot) if ss_tot != 0 else np.nan
-        return {"slope": float(slope), "r2": float(r2)}
+        return _MU._ctx(df, date_col, val_col, freq, agg).trend()
+
+    @staticmethod
+    def batch_series(df: pd.DataFrame, date_col: str, val_cols: List[str], by: Optional[str] = None,
+                     freq: str = "M", windows: Tuple[int, ...] = (6,), spans: Tuple[int, ...] = (6,)) -> pd.DataFrame:
+        # mismo criterio que _prep_ts (sum con min_count=1) y cagr("length"), en una pasada
+        return batch_series(df, date_col, val_cols, by=by, freq=freq, agg="sum", windows=windows,
+                            spans=spans, min_count=1, cagr_years="length")
 
 mu = _MU()
 
@@ -172,6 +210,10 @@ def _rerun():
 USE_SPARK = os.getenv("USE_SPARK", "false").strip().lower() == "true"
 USE_SPARK_MONGO = os.getenv("USE_SPARK_MONGO", "false").strip().lower() == "true"
 
+# Mongo como fuente del dataset: lector directo PyMongo → Arrow (por defecto) o Spark
+MONGO_LOADER = os.getenv("MONGO_LOADER", "pymongo").strip().lower()  # pymongo|spark
+USE_MONGO_SOURCE = os.getenv("USE_MONGO_SOURCE", str(USE_SPARK and USE_SPARK_MONGO)).strip().lower() == "true"
+
 SPARK_AVAILABLE = False
 _spark_import_error = ""
 if USE_SPARK and USE_SPARK_MONGO:
@@ -189,6 +231,7 @@ st.set_page_config(page_title="Datos de Trabajadores", page_icon="🧑‍💼",
 DATA_DIR  = os.getenv("DATA_DIR", "./data")
 CSV_FILE  = os.getenv("CSV_FILE", "people-1000000.csv")
 CSV_PATH  = os.path.abspath(os.path.join(DATA_DIR, CSV_FILE))
+STORE_PATH = get_store_path()
 
 MONGO_URI  = os.getenv("MONGO_URI", "mongodb://127.0.0.1:27017")
 MONGO_DB   = os.getenv("MONGO_DB", "cruddb")
@@ -554,9 +597,15 @@ mongo_err = ""
 collection = None
 if not DISABLE_MONGO and ENABLE_MONGO_SYNC:
     try:
-        from pymongo import MongoClient, UpdateOne  # type: ignore
-        _client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=4000)
-        _client.admin.command("ping")
+        from mongo_backend import get_client, pool_stats, iter_upsert_docs, ensure_indexes  # type: ignore
+        from mongo_backend import load_frame_partitioned, CONTENT_HASH_FIELD, UPDATED_AT_FIELD  # type: ignore
+        from mongo_backend import mongo_upsert_many as _bulk_upsert_many  # type: ignore
+        from mongo_backend import mongo_delete_many as _bulk_delete_many, ensure_rollup  # type: ignore
+        from mongo_sync import diff_sync, changed_rows  # type: ignore
+        from mongo_live import ChangeFeed  # type: ignore
+        from mongo_analytics import MongoAnalytics  # type: ignore
+        # cliente compartido por proceso: no se recrea ni se hace ping en cada rerun
+        _client = get_client(MONGO_URI, timeout_ms=4000)
         collection = _client[MONGO_DB][MONGO_COLL]
         mongo_ok = True
     except Exception as e:
@@ -565,39 +614,121 @@ if not DISABLE_MONGO and ENABLE_MONGO_SYNC:
 else:
     mongo_err = "Mongo deshabilitado por DISABLE_MONGO=true o ENABLE_MONGO_SYNC=false"
 
+@st.cache_resource(show_spinner=False)
+def _ensure_mongo_indexes(uri: str, db: str, coll: str) -> bool:
+    """Índices de mongo_backend (id_num, email, created_at...) una vez por proceso."""
+    ensure_indexes(collection)
+    return True
+
+if mongo_ok and MONGO_PUSHDOWN:
+    try:
+        _ensure_mongo_indexes(MONGO_URI, MONGO_DB, MONGO_COLL)
+    except Exception as e:
+        mongo_err = f"No pude crear índices: {e}"
+
+def _mongo_doc(doc: Dict[str, Any], pk: str) -> Dict[str, Any]:
+    # PK como string + id_num (formato de mongo_backend); mongo_id es solo el _id leído
+    # (+ content_hash, para que el sync diferencial reconozca la fila como sincronizada)
+    return next(iter_upsert_docs([doc], pk=pk, exclude=("mongo_id",)), {pk: ""})
+
+def _pk_match(pk: str, key: Any) -> Dict[str, Any]:
+    """PK como string (mongo_backend) o en su forma numérica original (documentos previos)."""
+    variants: List[Any] = [str(key)]
+    try:
+        variants.append(int(float(key)))
+    except Exception:
+        pass
+    return {pk: {"$in": variants}}
+
 def mongo_upsert(doc: Dict[str, Any], pk: str):
+    # mismo camino que el masivo: mantiene el rollup mensual con el delta de la fila
     if not mongo_ok: return
-    key = doc.get(pk)
-    if key is None: return
-    collection.update_one({pk: key}, {"$set": doc}, upsert=True)
-
-def mongo_upsert_many(rows: List[Dict[str, Any]], pk: str):
-    if not mongo_ok or not rows: return
-    from pymongo import UpdateOne  # type: ignore
-    ops = []
-    for d in rows:
-        k = d.get(pk)
-        if k is None: continue
-        ops.append(UpdateOne({pk: k}, {"$set": d}, upsert=True))
-    if ops: collection.bulk_write(ops, ordered=False)
+    if doc.get(pk) is None: return
+    _bulk_upsert_many([doc], pk=pk, coll=collection, match=_pk_match, exclude=("mongo_id",))
+
+def mongo_upsert_many(rows: Any, pk: str):
+    # rows: lista de dicts o DataFrame; se normaliza por columnas (mongo_backend.normalize_frame)
+    if not mongo_ok or rows is None or len(rows) == 0: return
+    _bulk_upsert_many(rows, pk=pk, coll=collection, match=_pk_match, exclude=("mongo_id",))
 
 def mongo_delete_many(keys: List[Any], pk: str):
     if not mongo_ok or not keys: return
-    collection.delete_many({pk: {"$in": list(keys)}})
+    _bulk_delete_many(keys, pk=pk, coll=collection, match=_pk_match)
+
+def _pushdown_active() -> bool:
+    """
+    Filtros/orden/paginación de Dashboard y Registros se resuelven en Mongo; solo si
+    el dataset se lee de Mongo (si no, Mongo no es la fuente de la vista).
+    """
+    return MONGO_PUSHDOWN and mongo_ok and _mongo_source_active()
+
+def _keyset_pager(flt: Dict[str, Any], page_size: int) -> KeysetPager:
+    """Pager por id_num de esta sesión para (filtro, tamaño); se reinicia al cambiar los datos."""
+    pagers = st.session_state.setdefault("_keyset_pagers", {})
+    sig = view_signature(flt, page_size, _dataset_cache().version)
+    if sig not in pagers:
+        if len(pagers) >= 8:
+            pagers.clear()
+        pagers[sig] = KeysetPager(collection, flt, page_size, field="id_num", projection={"id_num": 0})
+    return pagers[sig]
+
+def _mongo_page_df(flt: Dict[str, Any], sort_by: Optional[str], page: int, page_size: int) -> pd.DataFrame:
+    """Una página de documentos, normalizada como el resto del dataset."""
+    if sort_by == "id":
+        # seek por rango de id_num: la página N+1 no hace skip de N*page_size documentos
+        docs = _keyset_pager(flt, page_size).page(page)
+    else:
+        docs = find_page(collection, flt, sort_by, True, page, page_size, projection={"id_num": 0})
+    if not docs:
+        return pd.DataFrame(columns=df.columns)
+    out = _normalize_customers_df(pd.DataFrame(docs))
+    if "mongo_id" in out.columns:
+        out["mongo_id"] = out["mongo_id"].astype(str)
+    return out
 
 # ================== CSV I/O (fallback) ==================
-def read_csv_any() -> pd.DataFrame:
-    if not os.path.isfile(CSV_PATH):
-        pd.DataFrame().to_csv(CSV_PATH, index=False)
-        return pd.DataFrame()
-    try:
-        return pd.read_csv(CSV_PATH, low_memory=False)
-    except Exception:
-        return pd.DataFrame()
-
 def write_csv_any(df: pd.DataFrame) -> None:
     df.to_csv(CSV_PATH, index=False)
 
+def _base_path() -> str:
+    """Archivo base del dataset local (junto a él vive el change log)."""
+    return STORE_PATH if columnar_enabled() else CSV_PATH
+
+def write_store(df: pd.DataFrame) -> None:
+    """
+    Reescritura completa del dataset (Parquet tipado si está activo; si no, el CSV)
+    y vaciado del change log: equivale a compactar.
+    """
+    out = _normalize_customers_df(df) if not df.empty else df
+    if columnar_enabled():
+        write_parquet_atomic(out, STORE_PATH)
+    else:
+        write_csv_any(df)
+    wal_clear(_base_path())
+    _publish_dataset(out)
+
+def commit_changes(current: pd.DataFrame, upserts: List[Dict[str, Any]] = (), deletes: List[Any] = ()) -> None:
+    """
+    Registra upserts/deletes por PK en el change log (I/O O(filas cambiadas)) y publica
+    el frame resultante. Compacta en el archivo base al pasar WAL_COMPACT_ROWS entradas.
+    """
+    entries = wal_append(upserts, deletes, pk="id", base_path=_base_path())
+    locate = pk_index_for(current).positions
+    out = merge_wal(current, entries, pk="id", normalize=_normalize_customers_df, locate=locate)
+    # una fila tocada varias veces en el mismo commit cuenta una sola vez en el delta
+    keys = list(dict.fromkeys(e["key"] for e in entries))
+    v0, cur0 = _dataset_cache().snapshot()
+    before = current.iloc[locate(keys)]
+    if wal_count(_base_path()) >= WAL_COMPACT_ROWS:
+        write_store(out)
+    else:
+        _publish_dataset(out)
+    _advance_aggregates(v0 if cur0 is current else -1, before, out, keys)
+
+def _apply_wal(pdf: pd.DataFrame) -> pd.DataFrame:
+    entries = wal_read(_base_path())
+    return merge_wal(pdf, entries, pk="id", normalize=_normalize_customers_df) if entries else pdf
+
 # ========= Normalización de schema =========
 RENAMES_MAP = {
     "_id": "mongo_id",
@@ -633,7 +764,34 @@ def _unify_email(df: pd.DataFrame) -> pd.DataFrame:
         df["email"] = df["email"].astype(str).str.strip().str.lower()
     return df
 
-def _normalize_customers_df(pdf: pd.DataFrame) -> pd.DataFrame:
+def _as_category(s: pd.Series) -> pd.Series:
+    """Texto de baja cardinalidad -> category (códigos int + diccionario ordenado)."""
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        return s
+    s = s.where(s.isna(), s.astype(str))
+    if s.nunique(dropna=True) > CATEGORY_MAX_CARD:
+        return s
+    return s.astype("category")
+
+def _category_options(frame: pd.DataFrame, col: str) -> List[str]:
+    """Opciones de selectbox: del diccionario si la columna es category."""
+    s = frame[col]
+    vals = s.cat.categories if isinstance(s.dtype, pd.CategoricalDtype) else s.dropna().unique()
+    return sorted({v for v in (str(x).strip() for x in vals) if v})
+
+def _plain(frame: pd.DataFrame) -> pd.DataFrame:
+    """Columnas category -> object (para editar con valores nuevos)."""
+    cats = [c for c in frame.columns if isinstance(frame[c].dtype, pd.CategoricalDtype)]
+    return frame.astype({c: object for c in cats}) if cats else frame
+
+# columnas que el normalizador deja como texto a propósito (restore_csv_dtypes no las toca)
+_TEXT_COLS = ("name", "email", "phone", "created_ym")
+
+def _normalize_customers_df(pdf: pd.DataFrame, fix_pk: bool = True) -> pd.DataFrame:
+    """
+    Schema del dataset. Con fix_pk=False (chunks de una lectura por partes) la PK solo
+    se pasa a número: renumerar es una regla del total y la aplica _fix_pk al final.
+    """
     cols_target = ["id","name","email","phone","sex","dob","job_title",
                    "balance","created_at","created_ym",
                    "user_id","first_name","last_name","mongo_id"]
@@ -665,28 +823,40 @@ def _normalize_customers_df(pdf: pd.DataFrame) -> pd.DataFrame:
     if "balance" in df.columns:
         df["balance"] = pd.to_numeric(df["balance"], errors="coerce")
 
-    need_auto = ("id" not in df.columns)
-    if not need_auto:
-        tmp = pd.to_numeric(df["id"], errors="coerce")
-        need_auto = tmp.isna().any() or tmp.duplicated().any()
-    if need_auto:
-        df["id"] = pd.RangeIndex(1, len(df) + 1)
+    for c in CATEGORY_COLS:
+        if c in df.columns:
+            df[c] = _as_category(df[c])
+
+    if not fix_pk:
+        ids = pd.to_numeric(df["id"], errors="coerce") if "id" in df.columns else pd.Series(np.nan, index=df.index)
+        try:
+            df["id"] = ids.astype("Int64")  # mismo tipo en todos los chunks aunque haya nulos
+        except (TypeError, ValueError):
+            df["id"] = ids
     else:
-        df["id"] = pd.to_numeric(df["id"], errors="coerce")
-        if df["id"].isna().any() or df["id"].duplicated().any():
+        need_auto = ("id" not in df.columns)
+        if not need_auto:
+            tmp = pd.to_numeric(df["id"], errors="coerce")
+            need_auto = tmp.isna().any() or tmp.duplicated().any()
+        if need_auto:
             df["id"] = pd.RangeIndex(1, len(df) + 1)
+        else:
+            df["id"] = pd.to_numeric(df["id"], errors="coerce")
+            if df["id"].isna().any() or df["id"].duplicated().any():
+                df["id"] = pd.RangeIndex(1, len(df) + 1)
 
     ordered = [c for c in cols_target if c in df.columns]
     df = df[ordered + [c for c in df.columns if c not in ordered]]
 
     return df
 
+def _normalize_csv_chunk(pdf: pd.DataFrame) -> pd.DataFrame:
+    return _normalize_customers_df(pdf, fix_pk=False)
+
 def _next_id(current_df: pd.DataFrame) -> int:
     if current_df is None or current_df.empty or "id" not in current_df.columns:
         return 1
-    m = pd.to_numeric(current_df["id"], errors="coerce").max()
-    if pd.isna(m): return 1
-    return int(m) + 1
+    return pk_index_for(current_df).next_id()
 
 # ================== Barra de progreso (visual, genérica) ==================
 @contextmanager
@@ -694,9 +864,13 @@ def ui_progress(task: str, est_steps: int = 5):
     holder = st.empty()
     bar = holder.progress(0, text=f"🔄 {task} — preparando…")
     step = {"v": 0}
-    def tick(msg: str, add_steps: int = 1):
-        step["v"] += max(add_steps, 1)
-        p = min(int(step["v"] / max(est_steps,1) * 100), 99)
+    def tick(msg: str, add_steps: int = 1, frac: Optional[float] = None):
+        # frac (0..1): progreso real (p.ej. bytes leídos) en vez de pasos estimados
+        if frac is None:
+            step["v"] += max(add_steps, 1)
+            p = min(int(step["v"] / max(est_steps,1) * 100), 99)
+        else:
+            p = min(max(int(frac * 100), 0), 99)
         bar.progress(p, text=f"🔄 {task} — {msg}")
     try:
         yield tick
@@ -743,10 +917,41 @@ def _build_pipeline_json() -> Optional[str]:
         pipeline.append({"$limit": int(SPARK_READ_LIMIT)})
     return json.dumps(pipeline)
 
+def _mongo_source_active() -> bool:
+    """El dataset se lee de Mongo (lector directo o Spark, según MONGO_LOADER)."""
+    if DISABLE_MONGO or not ENABLE_MONGO_SYNC or not USE_MONGO_SOURCE:
+        return False
+    if MONGO_LOADER == "spark":
+        return USE_SPARK and USE_SPARK_MONGO and SPARK_AVAILABLE
+    return mongo_ok
+
 def load_dataframe() -> pd.DataFrame:
-    """Carga desde Mongo con Spark si está disponible; si no, cae a CSV con barra de progreso."""
+    """Carga desde Mongo (PyMongo → Arrow o Spark); si no, cae a Parquet/CSV con barra de progreso."""
+    # Mongo directo: lotes BSON crudos → Arrow, sin sesión Spark ni JVM
+    if _mongo_source_active() and MONGO_LOADER != "spark":
+        try:
+            with ui_progress("Leyendo desde Mongo", est_steps=3) as tick:
+                tick("preparando pipeline")
+                pipe = _build_pipeline_json()
+                # el $limit final se aplica por rangos de id_num en el lector particionado
+                stages = [s for s in json.loads(pipe) if "$limit" not in s] if pipe else None
+                total = max(int(collection.estimated_document_count()), 1)
+                pdf = load_frame_partitioned(
+                    collection,
+                    pipeline=stages or None,
+                    projection={"id_num": 0, CONTENT_HASH_FIELD: 0, UPDATED_AT_FIELD: 0},
+                    limit=SPARK_READ_LIMIT,
+                    uri=MONGO_URI,
+                    progress=lambda n: tick(f"leyendo ({n:,} docs)", frac=n / total),
+                )
+                if not pdf.empty:
+                    tick("normalizando schema")
+                    return _normalize_customers_df(pdf)
+        except Exception as e:
+            st.warning(f"No pude leer Mongo: {e}. Fallback a Parquet/CSV.")
+
     # Spark + Mongo (opcional)
-    if USE_SPARK and USE_SPARK_MONGO and SPARK_AVAILABLE and (not DISABLE_MONGO) and ENABLE_MONGO_SYNC:
+    if _mongo_source_active() and MONGO_LOADER == "spark":
         try:
             with ui_progress("Leyendo desde Mongo (Spark)", est_steps=6) as tick:
                 tick("creando sesión")
@@ -780,6 +985,23 @@ def load_dataframe() -> pd.DataFrame:
         except Exception as e:
             st.warning(f"No pude leer Mongo con Spark: {e}. Fallback a CSV.")
 
+    # Store Parquet: tipos ya normalizados, sin re-parsear el CSV
+    if columnar_enabled():
+        with ui_progress("Leyendo store Parquet", est_steps=3) as tick:
+            if store_is_stale(STORE_PATH, CSV_PATH):
+                tick("importando CSV → Parquet")
+                # el CSV importado pasa a ser el nuevo base: el change log anterior no aplica
+                wal_clear(STORE_PATH)
+                return import_csv_to_store(
+                    CSV_PATH, STORE_PATH, normalize=_normalize_csv_chunk, keep_text=_TEXT_COLS,
+                    progress=lambda done, total, rows: tick(f"importando CSV → Parquet ({rows:,} filas)",
+                                                            frac=done / max(total, 1)),
+                )
+            tick("leyendo datos")
+            out = read_parquet_store(STORE_PATH)
+            tick("aplicando cambios pendientes")
+            return _apply_wal(out)
+
     # CSV (fallback) — aquí añadimos barra de progreso
     with ui_progress("Leyendo CSV", est_steps=4) as tick:
         tick("verificando archivo")
@@ -788,14 +1010,167 @@ def load_dataframe() -> pd.DataFrame:
             pd.DataFrame().to_csv(CSV_PATH, index=False)
             return pd.DataFrame()
 
-        tick("leyendo datos")
-        pdf = read_csv_any()
-
-        tick("normalizando")
-        out = _normalize_customers_df(pdf) if not pdf.empty else pdf
+        tick("leyendo y normalizando por chunks")
+        out = read_csv_chunked(
+            CSV_PATH, normalize=_normalize_csv_chunk, keep_text=_TEXT_COLS,
+            progress=lambda done, total, rows: tick(f"leyendo datos ({rows:,} filas)", frac=done / max(total, 1)),
+        )
+        out = _apply_wal(out)
 
     return out
 
+# ================== Cache de dataset (compartido entre sesiones) ==================
+@st.cache_resource(show_spinner=False)
+def _dataset_cache() -> DatasetCache:
+    return DatasetCache()
+
+@st.cache_resource(show_spinner=False)
+def _rollup_store() -> MonthlyRollup:
+    """Rollup mensual (created_ym, métrica) del frame compartido; uno por proceso."""
+    return MonthlyRollup()
+
+def _rollup_key() -> str:
+    return repr((_dataset_key(), _rollup_store().metrics))
+
+def _monthly_rollup(frame: pd.DataFrame) -> Optional[MonthlyRollup]:
+    """
+    Rollup del frame publicado: incremental en commit_changes, persistido junto al
+    archivo base (fuente local) y reconstruido solo si no corresponde a la versión
+    actual (recarga, cambios en vivo). None si 'frame' no es el frame compartido.
+    """
+    store = _rollup_store()
+    version, cur = _dataset_cache().snapshot()
+    if cur is None or frame is not cur:
+        return None
+    if store.version != version:
+        local = not _mongo_source_active()
+        path = get_rollup_path(_base_path())
+        saved = read_rollup(path) if local else None
+        if saved is not None and saved[1] == _rollup_key():
+            store.load(saved[0], version)
+        else:
+            store.current(version, cur)
+            if local:
+                write_rollup(store.frame, path, _rollup_key())
+    return store
+
+@st.cache_resource(show_spinner=False)
+def _stats_store() -> StatsStore:
+    """Acumuladores en línea (momentos + sketch de cuantiles) por columna; uno por proceso."""
+    return StatsStore(alpha=ANALYTICS_SKETCH_ALPHA)
+
+def _column_stats(frame: pd.DataFrame, col: str) -> Optional[ColumnStats]:
+    """
+    Estadísticos en línea de 'col' en el frame publicado: se construyen una vez por
+    versión y commit_changes los avanza con el delta de filas. None si 'frame' no es
+    el frame compartido o si ANALYTICS_ONLINE_STATS está apagado.
+    """
+    if not ANALYTICS_ONLINE_STATS:
+        return None
+    version, cur = _dataset_cache().snapshot()
+    if cur is None or frame is not cur or col not in cur.columns:
+        return None
+    return _stats_store().get(version, cur, col)
+
+@st.cache_resource(show_spinner=False)
+def _corr_store() -> CorrelationStore:
+    """Matrices de correlación por método del frame compartido; una por proceso."""
+    return CorrelationStore()
+
+def _correlation(frame: pd.DataFrame, method: str, columns: List[str]) -> Optional[pd.DataFrame]:
+    """Matriz cacheada por versión y método; None si 'frame' no es el frame compartido."""
+    version, cur = _dataset_cache().snapshot()
+    if cur is None or frame is not cur:
+        return None
+    return _corr_store().matrix(version, cur, method, columns)
+
+@st.cache_resource(show_spinner=False)
+def _sample_store() -> SampleStore:
+    """Muestra estratificada del modo aproximado de Analytics; una por versión del dataset."""
+    return SampleStore()
+
+def _analytics_sample(frame: pd.DataFrame) -> Sample:
+    """SPARK_SAMPLE_SIZE filas estratificadas por ANALYTICS_SAMPLE_STRATA (o sex) del frame."""
+    version, cur = _dataset_cache().snapshot()
+    by = next((c for c in (ANALYTICS_SAMPLE_STRATA, "sex") if c and c in frame.columns), None)
+    return _sample_store().get(version if frame is cur else None, frame, SPARK_SAMPLE_SIZE, by=by)
+
+def _ci_text(est: Tuple[float, float, float], fmt: str = "{:,.2f}") -> str:
+    lo, hi = est[1], est[2]
+    if not (np.isfinite(lo) and np.isfinite(hi)):
+        return ""
+    return f"IC{ANALYTICS_CONFIDENCE:.0%} [{fmt.format(lo)} – {fmt.format(hi)}]"
+
+def _advance_aggregates(v0: int, before: pd.DataFrame, out: pd.DataFrame, keys: List[Any]) -> None:
+    """Delta de una escritura sobre rollup, estadísticos en línea y correlaciones (si estaban al día con la versión previa)."""
+    version, cur = _dataset_cache().snapshot()
+    if cur is not out:
+        return  # invalidado (Mongo sin feed) u otra sesión publicó: se reconstruye al leer
+    after = out.iloc[pk_index_for(out).positions(keys)]
+    _stats_store().advance(v0, version, before, after)
+    _corr_store().advance(v0, version, before, after, out)
+    if _rollup_store().advance(v0, version, before, after) and not _mongo_source_active():
+        write_rollup(_rollup_store().frame, get_rollup_path(_base_path()), _rollup_key())
+
+def _dataset_key() -> tuple:
+    """Huella de la fuente: archivos locales por mtime/tamaño; Mongo se invalida en escrituras."""
+    if _mongo_source_active():
+        return ("mongo", MONGO_DB, MONGO_COLL)
+    return ("local", columnar_enabled()) + file_fingerprint(STORE_PATH, CSV_PATH, get_wal_path(_base_path()))
+
+def get_dataset() -> pd.DataFrame:
+    """Frame normalizado compartido: se carga una vez por cambio de datos, no por rerun."""
+    return _dataset_cache().get(_dataset_key, load_dataframe)
+
+def _publish_dataset(pdf: pd.DataFrame) -> None:
+    """
+    Tras escribir: publica el frame ya normalizado. Si la fuente es Mongo sin feed de
+    cambios en vivo, invalida (la próxima lectura recarga la colección).
+    """
+    if _mongo_source_active() and _live_feed() is None:
+        _dataset_cache().invalidate()
+    else:
+        _dataset_cache().put(_dataset_key(), pdf)
+
+def _apply_live_changes(current: pd.DataFrame, entries: List[Dict[str, Any]], cache: DatasetCache) -> pd.DataFrame:
+    """Aplica un lote del ChangeFeed (formato change log) al frame compartido."""
+    if current.empty or "id" not in current.columns:
+        return current
+    # deletes que llegaron solo con _id: la key sale de la columna mongo_id
+    orphan = [e["mongo_id"] for e in entries if e["op"] == "delete" and e.get("key") is None]
+    if orphan and "mongo_id" in current.columns:
+        hit = current.loc[current["mongo_id"].astype(str).isin(orphan), ["mongo_id", "id"]]
+        keys = dict(zip(hit["mongo_id"].astype(str), hit["id"]))
+        for e in entries:
+            if e["op"] == "delete" and e.get("key") is None and e["mongo_id"] in keys:
+                e["key"] = str(keys[e["mongo_id"]])
+    entries = [e for e in entries if e.get("key") is not None]
+    locate = cache.derived("pk_index", lambda d: PKIndex.from_frame(d, "id"), current).positions
+    return merge_wal(current, entries, pk="id", normalize=_normalize_customers_df, locate=locate)
+
+@st.cache_resource(show_spinner=False)
+def _change_feed(db: str, coll: str) -> "ChangeFeed":
+    """Un consumidor de cambios por proceso: mantiene vivo el frame compartido."""
+    cache = _dataset_cache()
+    feed = ChangeFeed(
+        collection,
+        on_changes=lambda entries: cache.apply(lambda cur: _apply_live_changes(cur, entries, cache)),
+        pk="id",
+        poll_interval=MONGO_LIVE_POLL_S,
+        on_reset=cache.invalidate,
+    )
+    return feed.start()
+
+def _live_feed() -> Optional["ChangeFeed"]:
+    """Feed activo solo con Mongo como fuente del dataset (y MONGO_LIVE)."""
+    if not (MONGO_LIVE and mongo_ok and _mongo_source_active()):
+        return None
+    return _change_feed(MONGO_DB, MONGO_COLL)
+
+def pk_index_for(frame: pd.DataFrame) -> PKIndex:
+    """Índice id -> posición del frame (una vez por versión del dataset compartido)."""
+    return _dataset_cache().derived("pk_index", lambda d: PKIndex.from_frame(d, "id"), frame)
+
 # ================== PK/VALIDACIÓN ==================
 def detect_pk(df: pd.DataFrame) -> str:
     if df.empty: return "id"
@@ -890,7 +1265,19 @@ with st.sidebar:
         _rerun()
 
 # ================== DATA + PK ==================
-df = load_dataframe()
+df = get_dataset()
+st.session_state["_seen_version"] = _dataset_cache().version
+
+if _live_feed() is not None and hasattr(st, "fragment"):
+    @st.fragment(run_every=MONGO_LIVE_POLL_S)
+    def _live_refresh():
+        # rerun completo solo cuando el feed publicó una versión nueva del dataset
+        status = _live_feed().status()
+        st.caption(f"🟢 En vivo ({status['mode'] or '…'}) • {status['events']:,} cambios")
+        if _dataset_cache().version != st.session_state.get("_seen_version"):
+            st.rerun()
+    with st.sidebar:
+        _live_refresh()
 pk_default = detect_pk(df)
 if st.session_state.pk is None:
     st.session_state.pk = pk_default
@@ -912,59 +1299,17 @@ st.markdown(f"""
 """, unsafe_allow_html=True)
 
 # ================== HELPERS UI ==================
-def paginate(view: pd.DataFrame, page: int, page_size: int) -> pd.DataFrame:
-    start = (page-1)*page_size
-    end = start + page_size
-    return view.iloc[start:end].reset_index(drop=True)
-
-def _contains_ci(s: pd.Series, q: str) -> pd.Series:
-    if q is None or str(q).strip() == "":
-        return pd.Series(True, index=s.index)
-    return s.astype(str).str.contains(str(q), case=False, na=False)
-
-def _between_num(s: pd.Series, vmin: Optional[float], vmax: Optional[float]) -> pd.Series:
-    x = pd.to_numeric(s, errors="coerce")
-    mask = pd.Series(True, index=s.index)
-    if vmin is not None:
-        mask &= x >= vmin
-    if vmax is not None:
-        mask &= x <= vmax
-    return mask.fillna(False)
-
-def _between_date(s: pd.Series, dmin: Optional[date], dmax: Optional[date]) -> pd.Series:
-    x = pd.to_datetime(s, errors="coerce")
-    mask = pd.Series(True, index=s.index)
-    if dmin is not None:
-        mask &= x >= pd.Timestamp(dmin)
-    if dmax is not None:
-        mask &= x <= pd.Timestamp(dmax) + pd.Timedelta(days=1) - pd.Timedelta(seconds=1)
-    return mask.fillna(False)
+def _views() -> ViewCache:
+    """Órdenes filtrados/ordenados cacheados para la versión actual del dataset."""
+    return _dataset_cache().derived("views", ViewCache, df)
+
+def _filters(frame: pd.DataFrame) -> FilterEngine:
+    """Columnas pre-tipadas y máscaras por predicado, cacheadas por versión del dataset."""
+    return _dataset_cache().derived("filters", FilterEngine, frame)
 
 def _apply_advanced_filters(df: pd.DataFrame, f: Dict[str, Any]) -> pd.DataFrame:
     if df.empty: return df
-    m = pd.Series(True, index=df.index)
-
-    for key in ["name","first_name","last_name","email","phone","job_title","user_id","mongo_id"]:
-        if key in df.columns and f.get(key):
-            m &= _contains_ci(df[key], f[key])
-
-    if "sex" in df.columns and f.get("sex") and f["sex"] != "Todos":
-        m &= df["sex"].astype(str).str.lower() == str(f["sex"]).lower()
-
-    if "created_ym" in df.columns and f.get("created_ym") and f["created_ym"] != "Todos":
-        m &= df["created_ym"].astype(str) == str(f["created_ym"])
-
-    if "id" in df.columns:
-        m &= _between_num(df["id"], f.get("id_min"), f.get("id_max"))
-    if "balance" in df.columns:
-        m &= _between_num(df["balance"], f.get("bal_min"), f.get("bal_max"))
-
-    if "dob" in df.columns:
-        m &= _between_date(df["dob"], f.get("dob_min"), f.get("dob_max"))
-    if "created_at" in df.columns:
-        m &= _between_date(df["created_at"], f.get("crt_min"), f.get("crt_max"))
-
-    return df[m].copy()
+    return df.iloc[_filters(df).positions(f)]
 
 def _filters_ui(df: pd.DataFrame) -> Dict[str, Any]:
     st.markdown("### 🎯 Filtros avanzados")
@@ -982,22 +1327,33 @@ def _filters_ui(df: pd.DataFrame) -> Dict[str, Any]:
     if "user_id" in df.columns:     f["user_id"] = r2[2].text_input("User Id contiene", "")
     if "mongo_id" in df.columns:    f["mongo_id"] = r2[3].text_input("Mongo _id contiene", "")
 
+    # con pushdown el frame local puede ser parcial: sus máximos no son los de la
+    # colección, así que los rangos arrancan vacíos y solo viajan los que se fijen
+    pushdown = _pushdown_active()
     r3 = st.columns(4)
     if "sex" in df.columns:
-        sex_opts = ["Todos"] + sorted([s for s in df["sex"].dropna().astype(str).str.strip().unique().tolist() if s])
+        sex_opts = ["Todos"] + _category_options(df, "sex")
         f["sex"] = r3[0].selectbox("Sexo", options=sex_opts, index=0)
     if "created_ym" in df.columns:
-        ym_opts = ["Todos"] + sorted([s for s in df["created_ym"].dropna().astype(str).unique().tolist() if s])
+        ym_opts = ["Todos"] + _category_options(df, "created_ym")
         f["created_ym"] = r3[1].selectbox("created_ym (YYYY-MM)", options=ym_opts, index=0)
     if "id" in df.columns:
-        f["id_min"] = r3[2].number_input("ID mín.", value=0, step=1)
-        f["id_max"] = r3[3].number_input("ID máx.", value=int(df["id"].max()) if not df.empty else 0, step=1)
+        if pushdown:
+            f["id_min"] = r3[2].number_input("ID mín.", value=None, step=1)
+            f["id_max"] = r3[3].number_input("ID máx.", value=None, step=1)
+        else:
+            f["id_min"] = r3[2].number_input("ID mín.", value=0, step=1)
+            f["id_max"] = r3[3].number_input("ID máx.", value=int(pk_index_for(df).max_key or 0) if not df.empty else 0, step=1)
 
     r4 = st.columns(4)
     if "balance" in df.columns:
-        f["bal_min"] = r4[0].number_input("Balance mín.", value=0.0, step=100.0, format="%.2f")
-        max_bal = float(np.nan_to_num(df["balance"].max(), nan=0.0)) if "balance" in df.columns else 0.0
-        f["bal_max"] = r4[1].number_input("Balance máx.", value=max_bal, step=100.0, format="%.2f")
+        if pushdown:
+            f["bal_min"] = r4[0].number_input("Balance mín.", value=None, step=100.0, format="%.2f")
+            f["bal_max"] = r4[1].number_input("Balance máx.", value=None, step=100.0, format="%.2f")
+        else:
+            f["bal_min"] = r4[0].number_input("Balance mín.", value=0.0, step=100.0, format="%.2f")
+            max_bal = float(np.nan_to_num(df["balance"].max(), nan=0.0)) if "balance" in df.columns else 0.0
+            f["bal_max"] = r4[1].number_input("Balance máx.", value=max_bal, step=100.0, format="%.2f")
     if "dob" in df.columns:
         f["dob_min"] = r4[2].date_input("DOB desde", value=None)
         f["dob_max"] = r4[3].date_input("DOB hasta", value=None)
@@ -1026,22 +1382,37 @@ def page_dashboard():
     with c3:
         page_size = st.selectbox("Filas/página", [10,25,50,100], index=1)
 
-    view = df.copy()
-    if q.strip():
-        view = view[view[col].astype(str).str.contains(q, case=False, na=False)]
+    pushdown = _pushdown_active()
+    if pushdown:
+        flt = build_filter(quick=(col, q) if q.strip() else None)
+        total = count_matches(collection, flt)
+    else:
+        order = _views().order(
+            view_signature("dash", col, q.strip()),
+            lambda: sorted_positions(df, _filters(df).contains(col, q) if q.strip() else np.ones(len(df), dtype=bool)),
+        )
+        total = len(order)
 
-    total = len(view)
     total_pages = max(1, math.ceil(total / page_size))
     if "dash_page" not in st.session_state:
         st.session_state.dash_page = 1
     st.number_input("Página", min_value=1, max_value=total_pages, step=1, key="dash_page")
     st.caption(f"Total: {total:,} • Páginas: {total_pages}")
 
-    page_df = paginate(view, st.session_state.dash_page, page_size)
+    if pushdown:
+        page_df = _mongo_page_df(flt, pk, st.session_state.dash_page, page_size)
+    else:
+        page_df = page_slice(df, order, st.session_state.dash_page, page_size)
     st.dataframe(page_df, width='stretch', height=420)  # <- reemplazo de use_container_width
-    st.download_button("⬇️ Exportar vista (CSV)",
-                       data=view.to_csv(index=False).encode("utf-8"),
-                       file_name="trabajadores_vista.csv", mime="text/csv")
+    # con pushdown solo existe la página en memoria: se exporta esa.
+    # La vista completa se serializa solo a pedido (no en cada cambio de página).
+    if pushdown:
+        st.download_button("⬇️ Exportar página (CSV)", data=page_df.to_csv(index=False).encode("utf-8"),
+                           file_name="trabajadores_vista.csv", mime="text/csv")
+    elif st.checkbox("Preparar exportación de la vista (CSV)", key="dash_export"):
+        st.download_button("⬇️ Exportar vista (CSV)",
+                           data=df.iloc[order].to_csv(index=False).encode("utf-8"),
+                           file_name="trabajadores_vista.csv", mime="text/csv")
     st.markdown('</div>', unsafe_allow_html=True)
 
 def page_registros():
@@ -1070,30 +1441,16 @@ def page_registros():
         if submitted:
             with ui_progress("Guardando registro", est_steps=3) as tick:
                 tick("preparando datos")
-                work = df.copy()
-                schema = list(work.columns) if not work.empty else list(dict.fromkeys(["id", *inputs.keys()]))
-                inputs["id"] = _next_id(work)
+                schema = list(df.columns) if not df.empty else list(dict.fromkeys(["id", *inputs.keys()]))
+                inputs["id"] = _next_id(df)
                 row = normalize_new_row(inputs, schema)
                 ok, msg = validate_row(row, "id")
                 if not ok:
                     st.error(msg)
                 else:
-                    tick("aplicando cambios")
-                    if work.empty:
-                        work = pd.DataFrame(columns=schema)
-                    if "id" not in work.columns:
-                        work["id"] = pd.NA
-                    mask = work["id"].astype(str) == str(row["id"])
-                    if mask.any():
-                        for c in schema:
-                            if c not in work.columns: work[c] = pd.NA
-                            work.loc[mask, c] = row.get(c, None)
-                    else:
-                        for c in schema:
-                            if c not in work.columns: work[c] = pd.NA
-                        work = pd.concat([work, pd.DataFrame([row])], ignore_index=True)
-                    tick("escribiendo CSV / Mongo")
-                    write_csv_any(work)
+                    tick("registrando cambio")
+                    commit_changes(df, upserts=[row])
+                    tick("escribiendo Mongo")
                     mongo_upsert(row, "id")
                     st.success(f"Upsert OK (id={row['id']}).")
                     _rerun()
@@ -1106,18 +1463,25 @@ def page_registros():
     st.markdown('<div class="card">', unsafe_allow_html=True)
     st.subheader("🧹 Filtrar, ordenar y editar")
     filters = _filters_ui(df)
-    v = _apply_advanced_filters(df, filters)
+    pushdown = _pushdown_active()
+    sort_cols = list(df.columns)
+    if pushdown:
+        flt = build_filter(filters)
 
     f1, f2 = st.columns([1,1])
     with f1:
-        sort_by = st.selectbox("Ordenar por", options=list(v.columns),
-                               index=(list(v.columns).index("id") if "id" in v.columns else 0))
+        sort_by = st.selectbox("Ordenar por", options=sort_cols,
+                               index=(sort_cols.index("id") if "id" in sort_cols else 0))
     with f2:
         page_size = st.selectbox("Filas/página", [10,25,50,100], index=1)
 
-    v = v.sort_values(sort_by, na_position="last").reset_index(drop=True)
-
-    total = len(v)
+    view_sig = view_signature("reg", filters, sort_by)
+    if pushdown:
+        total = count_matches(collection, flt)
+    else:
+        # filtro + sort completo solo cuando cambia la firma; cambiar de página es O(page_size)
+        order = _views().order(view_sig, lambda: sorted_positions(df, _filters(df).mask(filters), sort_by))
+        total = len(order)
     total_pages = max(1, math.ceil(total / page_size))
     if "reg_page" not in st.session_state:
         st.session_state.reg_page = 1
@@ -1125,7 +1489,11 @@ def page_registros():
     st.caption(f"Total (filtrado): {total:,} • Páginas: {total_pages}")
 
     SEL = "__select__"
-    page_df = paginate(v, st.session_state.reg_page, page_size)
+    if pushdown:
+        page_df = _mongo_page_df(flt, sort_by, st.session_state.reg_page, page_size)
+    else:
+        page_df = page_slice(df, order, st.session_state.reg_page, page_size)
+    page_df = _plain(page_df)  # category -> texto libre en el editor
     if SEL not in page_df.columns: page_df.insert(0, SEL, False)
 
     # Bloquear edición de 'id' y 'mongo_id'
@@ -1141,7 +1509,7 @@ def page_registros():
         height=460,
         num_rows="dynamic",
         column_config=colcfg,
-        key=f"grid_{st.session_state.reg_page}_{page_size}_{sort_by}"
+        key=f"grid_{hashlib.md5(view_sig.encode('utf-8')).hexdigest()[:10]}_{st.session_state.reg_page}_{page_size}"
     )
 
     a1, a2, a3 = st.columns([1,1,1])
@@ -1150,19 +1518,32 @@ def page_registros():
             try:
                 with ui_progress("Guardando cambios", est_steps=3) as tick:
                     tick("preparando merge")
-                    base = df.set_index("id").copy()
                     upd = edited.drop(columns=[SEL]).set_index("id")
-                    tick("aplicando a DataFrame")
-                    base.update(upd)
-                    base = base.reset_index()
-                    tick("escribiendo CSV/Mongo")
-                    write_csv_any(base)
+                    tick("aplicando a filas editadas")
+                    if pushdown:
+                        # la página vino completa desde Mongo: cada fila editada ya es el documento
+                        before = page_df.drop(columns=[SEL])
+                        after = upd[upd.index.notna()].reset_index()
+                    else:
+                        before = _plain(df.iloc[pk_index_for(df).positions(upd.index)])
+                        cur = before.set_index("id")
+                        cur.update(upd)
+                        after = cur.reset_index()
+                    # solo las filas cuyo contenido cambió (huella distinta) van al WAL / Mongo
+                    # (las huellas vienen de mongo_backend: sin Mongo se guarda la página completa)
                     if mongo_ok:
-                        keys = upd.index.dropna().tolist()
-                        docs = base[base["id"].isin(keys)].to_dict(orient="records")
-                        mongo_upsert_many(docs, "id")
-                st.success("Cambios guardados.")
-                _rerun()
+                        after = after[changed_rows(before, after, "id")]
+                    docs = after.to_dict(orient="records")
+                    tick("escribiendo cambios/Mongo")
+                    if docs:
+                        commit_changes(df, upserts=docs)
+                        if mongo_ok:
+                            mongo_upsert_many(docs, "id")
+                if docs:
+                    st.success(f"Cambios guardados ({len(docs):,} filas).")
+                    _rerun()
+                else:
+                    st.info("Sin cambios que guardar.")
             except Exception as e:
                 st.error(f"No pude guardar: {e}")
     with a2:
@@ -1175,21 +1556,31 @@ def page_registros():
                         st.warning("Selecciona al menos 1 fila.")
                     else:
                         keys = keys.dropna()
-                        tick("borrando en DataFrame")
-                        df2 = df[~(df["id"].isin(keys))]
-                        tick("escribiendo CSV/Mongo")
-                        write_csv_any(df2)
+                        tick("registrando borrado")
+                        commit_changes(df, deletes=list(keys))
+                        tick("escribiendo Mongo")
                         if mongo_ok: mongo_delete_many(list(keys), "id")
                         st.success(f"Eliminados: {len(keys)}.")
                         _rerun()
             except Exception as e:
                 st.error(f"No pude eliminar: {e}")
     with a3:
-        st.download_button("⬇️ Exportar vista (CSV)",
-                           data=v.to_csv(index=False).encode("utf-8"),
-                           file_name="trabajadores_filtrado.csv", mime="text/csv")
+        if pushdown:
+            st.download_button("⬇️ Exportar página (CSV)",
+                               data=page_df.drop(columns=[SEL]).to_csv(index=False).encode("utf-8"),
+                               file_name="trabajadores_filtrado.csv", mime="text/csv")
+        elif st.checkbox("Preparar exportación (CSV)", key="reg_export"):
+            st.download_button("⬇️ Exportar vista (CSV)",
+                               data=df.iloc[order].to_csv(index=False).encode("utf-8"),
+                               file_name="trabajadores_filtrado.csv", mime="text/csv")
     st.markdown('</div>', unsafe_allow_html=True)
 
+@st.cache_resource(show_spinner=False)
+def _mongo_analytics(db: str, coll: str) -> "MongoAnalytics":
+    """Un motor por proceso (recuerda qué operadores no soporta el servidor); crea el rollup si falta."""
+    ensure_rollup(collection)
+    return MongoAnalytics(collection, sample_size=SPARK_SAMPLE_SIZE)
+
 def page_analytics():
     if not ENABLE_ANALYTICS:
         st.warning("Analytics deshabilitado en settings.py / ENV.")
@@ -1198,10 +1589,33 @@ def page_analytics():
         st.info("No hay datos para analizar. Carga o crea registros primero.")
         return
 
+    # Motor: _MU sobre el DataFrame en memoria o pipelines de agregación en Mongo
+    server = False
+    if mongo_ok:
+        engines = ["pandas (memoria)", "Mongo (servidor)"]
+        server = st.radio("Motor de cálculo", options=engines, horizontal=True,
+                          index=1 if ANALYTICS_BACKEND == "mongo" else 0) == engines[1]
+    if server:
+        ma = _mongo_analytics(MONGO_DB, MONGO_COLL)
+        run = lambda fn, *a, **kw: getattr(ma, fn)(*a, **kw)
+    else:
+        run = lambda fn, *a, **kw: getattr(mu, fn)(df, *a, **kw)
+
+    # Modo aproximado: muestra estratificada (una por versión) + intervalos de confianza
+    approx = False
+    if not server:
+        approx = st.checkbox(
+            f"Modo aproximado (muestra de {min(SPARK_SAMPLE_SIZE, len(df)):,} filas)",
+            value=len(df) > ANALYTICS_MAX_ROWS,
+            help=f"Activo por defecto con más de {ANALYTICS_MAX_ROWS:,} filas. Desmarca para calcular exacto.",
+        )
+    smp = _analytics_sample(df) if approx else None
+    base = smp.frame if approx else df
+
     st.markdown('<div class="card">', unsafe_allow_html=True)
     st.subheader("📊 Descriptivos & Outliers")
 
-    num_df = _coerce_numeric_cols(df)
+    num_df = _coerce_numeric_cols(base)
     if num_df.empty:
         st.info("No se detectaron columnas numéricas.")
         st.markdown('</div>', unsafe_allow_html=True)
@@ -1213,24 +1627,55 @@ def page_analytics():
             index=list(num_df.columns).index(col_default)
         )
 
-        stats = mu.describe_numeric(df, col_num)
-        pct = mu.percentiles_iqr(df, col_num)
-        out_z = mu.flag_outliers_z(df, col_num, z=OUTLIER_Z_THRESHOLD)
-        out_i = mu.flag_outliers_iqr(df, col_num, k=OUTLIER_IQR_K)
+        ci: Dict[str, Tuple[float, float, float]] = {}
+        cs = None if (server or approx) else _column_stats(df, col_num)
+        if approx:
+            ci = {**describe_ci(smp, col_num, ANALYTICS_CONFIDENCE), **percentiles_ci(smp, col_num, ANALYTICS_CONFIDENCE)}
+            stats = {k: ci[k][0] for k in ("mean", "median", "std", "sum")}
+            pct = {k: ci[k][0] for k in ("p25", "p50", "p75", "iqr")}
+            oc = outlier_counts_ci(smp, col_num, z=OUTLIER_Z_THRESHOLD, k=OUTLIER_IQR_K, conf=ANALYTICS_CONFIDENCE)
+            zc, ic, tc = int(round(oc["z"][0])), int(round(oc["iqr"][0])), oc["total"]
+        elif cs is not None:
+            # O(1) tras escrituras: momentos exactos, cuantiles/outliers del sketch
+            stats, pct = cs.describe(), cs.percentiles_iqr()
+            oc = cs.outlier_counts(z=OUTLIER_Z_THRESHOLD, k=OUTLIER_IQR_K)
+            zc, ic, tc = oc["z"], oc["iqr"], oc["total"]
+        elif server:
+            stats = run("describe_numeric", col_num)
+            pct = run("percentiles_iqr", col_num)
+            oc = ma.outlier_counts(col_num, z=OUTLIER_Z_THRESHOLD, k=OUTLIER_IQR_K)
+            zc, ic, tc = oc["z"], oc["iqr"], oc["total"]
+        else:
+            stats = run("describe_numeric", col_num)
+            pct = run("percentiles_iqr", col_num)
+            out_z = mu.flag_outliers_z(df, col_num, z=OUTLIER_Z_THRESHOLD)
+            out_i = mu.flag_outliers_iqr(df, col_num, k=OUTLIER_IQR_K)
+            zc, ic, tc = int(out_z.sum()), int(out_i.sum()), len(df)
 
         k1, k2, k3, k4 = st.columns(4)
         k1.metric("Promedio", f"{stats['mean']:.2f}" if np.isfinite(stats['mean']) else "—")
         k2.metric("Mediana", f"{stats['median']:.2f}" if np.isfinite(stats['median']) else "—")
         k3.metric("σ (std)", f"{stats['std']:.2f}" if np.isfinite(stats['std']) else "—")
         k4.metric("Suma", f"{stats['sum']:.2f}" if np.isfinite(stats['sum']) else "—")
+        if ci:
+            for box, key in zip((k1, k2, k3, k4), ("mean", "median", "std", "sum")):
+                box.caption(_ci_text(ci[key]))
 
         c1, c2, c3, c4 = st.columns(4)
         c1.metric("P25", f"{pct['p25']:.2f}" if np.isfinite(pct['p25']) else "—")
         c2.metric("P50", f"{pct['p50']:.2f}" if np.isfinite(pct['p50']) else "—")
         c3.metric("P75", f"{pct['p75']:.2f}" if np.isfinite(pct['p75']) else "—")
         c4.metric("IQR", f"{pct['iqr']:.2f}" if np.isfinite(pct['iqr']) else "—")
-
-        zc, ic, tc = int(out_z.sum()), int(out_i.sum()), len(df)
+        if ci:
+            for box, key in zip((c1, c2, c3, c4), ("p25", "p50", "p75", "iqr")):
+                box.caption(_ci_text(ci[key]))
+
+        if approx:
+            st.caption(f"Estimado sobre {smp.n:,} filas (estrato: {smp.by or '—'}) • "
+                       f"Outliers Z {_ci_text(oc['z'], '{:,.0f}')} • IQR {_ci_text(oc['iqr'], '{:,.0f}')}")
+        if cs is not None and not cs.sketch.exact:
+            st.caption(f"Mediana, percentiles y outliers aproximados: cada cuantil interpola entre dos rangos "
+                       f"vecinos con error relativo ≤ {ANALYTICS_SKETCH_ALPHA:g} sobre el valor.")
         st.caption(f"Outliers (Z>{OUTLIER_Z_THRESHOLD}): **{zc:,}**  •  Outliers (IQR*k, k={OUTLIER_IQR_K}): **{ic:,}**  •  Total filas: **{tc:,}**")
 
         st.markdown('</div>', unsafe_allow_html=True)
@@ -1245,11 +1690,15 @@ def page_analytics():
             ANALYTICS_CORR_METHOD if ANALYTICS_CORR_METHOD in ["pearson", "spearman", "kendall"] else "pearson"
         ),
     )
-    corr = mu.correlation_matrix(df, method=method)
+    corr = mu.correlation_matrix(base, method=method)
     if corr.empty:
         st.info("No hay suficientes columnas numéricas para correlación.")
     else:
         st.dataframe(corr, width='stretch', height=380)  # <- reemplazo de use_container_width
+        if approx and not smp.exact:
+            lo, hi = correlation_ci(corr, smp.n, method=method, conf=ANALYTICS_CONFIDENCE)
+            with st.expander(f"Intervalos de confianza ({ANALYTICS_CONFIDENCE:.0%})"):
+                st.dataframe(lo.round(3).astype(str) + " – " + hi.round(3).astype(str), width='stretch')
     st.markdown('</div>', unsafe_allow_html=True)
 
     st.markdown('<div class="card">', unsafe_allow_html=True)
@@ -1259,7 +1708,7 @@ def page_analytics():
     date_cols = [date_guess] + [c for c in df.columns if c != date_guess] if date_guess else list(df.columns)
     date_col = st.selectbox("Columna de fecha", options=date_cols, index=0 if date_guess else 0)
 
-    num_df2 = _coerce_numeric_cols(df)
+    num_df2 = _coerce_numeric_cols(base)
     if num_df2.empty:
         st.info("No hay métricas numéricas para series.")
     else:
@@ -1271,27 +1720,58 @@ def page_analytics():
         w = st.number_input("Ventana SMA (periodos)", min_value=2, max_value=365, value=ROLLING_DEFAULT_WINDOW, step=1)
         s = st.number_input("Span EMA", min_value=2, max_value=365, value=EMA_DEFAULT_SPAN, step=1)
 
+        if approx and not smp.exact:
+            # sumas por periodo expandidas con el peso de cada estrato
+            ts_df = smp.scaled([val_col])
+            run = lambda fn, *a, **kw: getattr(mu, fn)(ts_df, *a, **kw)
+            st.caption(f"Series estimadas desde la muestra ({smp.n:,} de {smp.population:,} filas).")
+
         try:
             with ui_progress("Calculando series", est_steps=4) as tick:
                 tick("SMA")
-                sma = mu.rolling_sma(df, date_col, val_col, window=int(w), freq=freq, agg="sum")
+                sma = run("rolling_sma", date_col, val_col, window=int(w), freq=freq, agg="sum")
                 tick("EMA")
-                ema = mu.rolling_ema(df, date_col, val_col, span=int(s), freq=freq, agg="sum")
+                ema = run("rolling_ema", date_col, val_col, span=int(s), freq=freq, agg="sum")
                 tick("uniendo y graficando")
                 ts = sma.join(ema[[f"ema_{int(s)}"]], how="outer")
                 st.line_chart(ts, height=320, width='stretch')  # <- ancho estirable
                 tick("indicadores")
-                mg = mu.monthly_growth(df, date_col, val_col, agg="sum")
+                mg = run("monthly_growth", date_col, val_col, agg="sum")
                 last_mom = float(mg["mom_pct"].iloc[-1]) if not mg.empty and np.isfinite(mg["mom_pct"].iloc[-1]) else np.nan
                 kpi1, kpi2 = st.columns(2)
                 kpi1.metric("MoM (último mes)", f"{last_mom:.2f}%" if np.isfinite(last_mom) else "—")
-                _cagr = mu.cagr(df, date_col, val_col, agg="sum")
+                _cagr = run("cagr", date_col, val_col, agg="sum")
                 kpi2.metric("CAGR (aprox.)", f"{_cagr:.2f}%" if (_cagr is not None and np.isfinite(_cagr)) else "—")
-                trend = mu.linear_trend(df, date_col, val_col, freq=freq, agg="sum")
+                trend = run("linear_trend", date_col, val_col, freq=freq, agg="sum")
                 st.caption(f"Tendencia: slope={trend['slope']:.4f} • R²={trend['r2']:.4f}" if np.isfinite(trend["slope"]) else "Tendencia: —")
         except Exception as e:
             st.error(f"No pude calcular series de tiempo: {e}")
 
+        # Varias métricas × grupos en una sola pasada (formato largo)
+        st.markdown("---")
+        st.markdown("**Comparar métricas y grupos**")
+        num_opts = list(num_df2.columns)
+        metrics = st.multiselect("Métricas", options=num_opts, default=[val_col], key="cmp_metrics")
+        group_opts = ["(sin agrupar)"] + [c for c in CATEGORY_COLS if c in base.columns and c != date_col]
+        grp = st.selectbox("Agrupar por", options=group_opts, key="cmp_by")
+        view = st.selectbox("Serie", options=["value", f"sma_{int(w)}", f"ema_{int(s)}", "mom_pct"], key="cmp_stat")
+        if metrics:
+            try:
+                by = None if grp == group_opts[0] else grp
+                src = smp.scaled(metrics) if approx and not smp.exact else df
+                long = mu.batch_series(src, date_col, metrics, by=by, freq=freq, windows=(int(w),), spans=(int(s),))
+                per = long[(long["stat"] == view) & long["date"].notna()]
+                label = per["metric"] if by is None else per[by].astype(str) + " • " + per["metric"]
+                chart = per.assign(serie=label).pivot_table(index="date", columns="serie", values="value")
+                st.line_chart(chart, height=320, width='stretch')
+                summary = long[long["date"].isna()].pivot_table(
+                    index=([by] if by else []) + ["metric"], columns="stat", values="value")
+                if freq != "M":
+                    summary = summary.drop(columns=["cagr"], errors="ignore")  # CAGR solo con serie mensual
+                st.dataframe(summary.rename(columns={"cagr": "CAGR %", "r2": "R²"}), width='stretch')
+            except Exception as e:
+                st.error(f"No pude comparar series: {e}")
+
     st.markdown('</div>', unsafe_allow_html=True)
 
 def page_config():
@@ -1307,8 +1787,45 @@ def page_config():
     with c2:
         if mongo_ok:
             st.success(f"Mongo conectado\nDB: {MONGO_DB} • Coll: {MONGO_COLL}")
+            for ps in pool_stats():
+                st.caption(f"Pool {ps['uri']}: {ps['in_use']}/{ps['max_pool_size']} en uso "
+                           f"(pico {ps['peak_in_use']}) • {ps['open']} abiertas • {ps['checkouts']:,} checkouts")
         else:
             st.warning(f"Mongo no activo: {mongo_err or '—'}")
+        pending = wal_count(_base_path())
+        st.caption(f"Cambios en el change log: {pending:,} (compacta solo al llegar a {WAL_COMPACT_ROWS:,})")
+        if pending and st.button("🗜️ Compactar ahora"):
+            with ui_progress("Compactando dataset", est_steps=1) as tick:
+                tick("reescribiendo archivo base")
+                write_store(df)
+            _rerun()
+        if mongo_ok and not df.empty:
+            verify = st.checkbox("Verificar huellas contra Mongo (ignora el sidecar local)", value=False)
+            # con Mongo como fuente el frame está acotado (SPARK_READ_LIMIT): lo ausente no está borrado
+            partial = _mongo_source_active()
+            delete_missing = st.checkbox(
+                "Borrar en Mongo los documentos que no están en el dataset", value=False, disabled=partial,
+                help="No disponible con Mongo como fuente: el dataset cargado es parcial." if partial else None,
+            )
+            if delete_missing and not partial:
+                delete_missing = st.checkbox("Confirmo el borrado en Mongo de los documentos ausentes", value=False,
+                                             key="confirm_delete_missing")
+            if st.button("⬆️ Dataset → Mongo (solo cambios)"):
+                try:
+                    with ui_progress("Dataset → Mongo", est_steps=2) as tick:
+                        tick("comparando huellas")
+                        plan, stats = diff_sync(
+                            collection, df, pk="id", match=_pk_match,
+                            sidecar=get_fingerprint_path(_base_path(), f"{MONGO_DB}.{MONGO_COLL}"),
+                            verify_remote=verify, delete_missing=delete_missing, partial=partial,
+                            progress=lambda s: tick(f"{s.docs:,} docs • {s.docs_per_s:,.0f} docs/s", add_steps=0),
+                        )
+                    d = plan.as_dict()
+                    bajas = f"{d['deletes']:,} bajas" if delete_missing else f"{d['deletes']:,} ausentes en el dataset (no borrados)"
+                    st.success(f"Sync OK: {d['inserts']:,} altas • {d['updates']:,} cambios • {bajas} • "
+                               f"{d['unchanged']:,} sin cambios ({stats.docs_per_s:,.0f} docs/s • {stats.retries} reintentos)")
+                except Exception as e:
+                    st.error(f"Falló sync a Mongo: {e}")
 
     st.markdown("---")
     st.subheader("🧩 Integración Spark ⇄ Mongo (opcional)")
@@ -1358,6 +1875,7 @@ def page_config():
                             tick("normalizando y guardando CSV")
                             pdf = _normalize_customers_df(pdf)
                             write_csv_any(pdf)
+                            write_store(pdf)
                             st.success(f"Exportado {len(pdf):,} filas de Mongo → CSV.")
                         else:
                             st.info("Mongo vacío o sin datos legibles.")
@@ -1389,7 +1907,7 @@ def page_config():
                             tick("normalizando")
                             pdf = _normalize_customers_df(pdf)
                             st.session_state.pk = detect_pk(pdf)
-                            globals()['df'] = pdf
+                            _dataset_cache().put(_dataset_key(), pdf)
                             st.success(f"Datos refrescados desde Mongo ({len(pdf):,} filas).")
                             _rerun()
                         else:
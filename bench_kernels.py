@@ -0,0 +1,77 @@
+# bench_kernels.py
+# Compara math_kernels (SMA / EMA / tendencia) contra las versiones pandas anteriores
+# Uso: python bench_kernels.py [periodos] [métricas] [repeticiones]
+#   p.ej. python bench_kernels.py 5000 20 5
+# Reporta el mejor tiempo de cada variante y la diferencia máxima contra pandas.
+
+from __future__ import annotations
+
+import sys
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+import pandas as pd
+
+import math_kernels
+
+
+def _best(fn: Callable[[], object], reps: int) -> float:
+    best = float("inf")
+    for _ in range(reps):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def _pandas_trend(s: pd.Series) -> Dict[str, float]:
+    s = s.dropna()
+    if s.count() < 2:
+        return dict(slope=np.nan, r2=np.nan)
+    t = np.arange(len(s), dtype=float)
+    y = s.values.astype(float)
+    b, a = np.polyfit(t, y, 1)
+    y_hat = a + b * t
+    ss_res = float(np.sum((y - y_hat) ** 2))
+    ss_tot = float(np.sum((y - np.mean(y)) ** 2))
+    return dict(slope=float(b), r2=1.0 - ss_res / ss_tot if ss_tot != 0 else np.nan)
+
+
+def main(periods: int = 5000, metrics: int = 20, reps: int = 5) -> List[Dict[str, object]]:
+    rng = np.random.default_rng(0)
+    idx = pd.date_range("2000-01-01", periods=periods, freq="D")
+    y = rng.normal(1000.0, 200.0, (periods, metrics)).cumsum(axis=0)
+    y[rng.random(y.shape) < 0.02] = np.nan  # huecos como los de resample(...).sum(min_count=1)
+    frame = pd.DataFrame(y, index=idx)
+    windows = [3, 6, 12, 24]
+
+    cases = [
+        ("SMA (ventanas x métricas)",
+         lambda: [frame[c].rolling(w, min_periods=1).mean() for c in frame for w in windows],
+         lambda: math_kernels.sma(y, windows),
+         lambda: np.nanmax(np.abs(math_kernels.sma(y, windows)[-1] - frame.rolling(windows[-1], min_periods=1).mean().to_numpy()))),
+        ("EMA (spans x métricas)",
+         lambda: [frame[c].ewm(span=w, adjust=False, min_periods=1).mean() for c in frame for w in windows],
+         lambda: math_kernels.ema(y, windows),
+         lambda: np.nanmax(np.abs(math_kernels.ema(y, windows)[-1] - frame.ewm(span=windows[-1], adjust=False, min_periods=1).mean().to_numpy()))),
+        ("Tendencia OLS (métricas)",
+         lambda: [_pandas_trend(frame[c]) for c in frame],
+         lambda: math_kernels.ols_trend(y),
+         lambda: np.nanmax(np.abs(math_kernels.ols_trend(y)["slope"] - np.array([_pandas_trend(frame[c])["slope"] for c in frame])))),
+    ]
+
+    rows = []
+    print(f"{periods:,} periodos x {metrics} métricas • ventanas {windows} • numba={'sí' if math_kernels.USE_NUMBA else 'no'}")
+    for name, old, new, diff in cases:
+        new()  # calentamiento (JIT si hay numba)
+        t_old, t_new = _best(old, reps), _best(new, reps)
+        d = float(diff())
+        rows.append(dict(case=name, pandas_s=t_old, kernel_s=t_new, speedup=t_old / t_new, max_abs_diff=d))
+        print(f"  {name:<28} pandas {t_old * 1e3:9.2f} ms • kernel {t_new * 1e3:9.2f} ms • x{t_old / t_new:6.1f} • dif máx {d:.2e}")
+    return rows
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:4]]
+    main(*args)
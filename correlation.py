@@ -0,0 +1,269 @@
+# correlation.py
+# Matrices de correlación sin recalcular todo en cada rerun
+# - PearsonStats: estadísticos suficientes por par de columnas (n, Σx, Σy, Σx², Σy², Σxy)
+#   sobre observaciones completas del par; se actualizan con deltas de filas
+# - spearman_matrix(): Pearson sobre la transformación a rangos (cacheable)
+# - kendall_tau(): tau-b de Knight, O(n log n) por par (inversiones por merge sort)
+# - corr_frame(): las tres con la semántica de DataFrame.corr (pares completos)
+# - CorrelationStore: resultados por método ligados a una versión del dataset;
+#   advance() aplica el delta de una escritura a los estadísticos de Pearson
+#
+# No depende de Streamlit.
+
+from __future__ import annotations
+
+import threading
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+
+CHUNK_ROWS = 250_000
+
+
+def numeric_array(df: pd.DataFrame, columns: Sequence[str]) -> np.ndarray:
+    """Columnas como float64 (coerce); NaN donde no hay número."""
+    if not len(columns):
+        return np.empty((len(df), 0))
+    return np.column_stack([
+        pd.to_numeric(df[c], errors="coerce").to_numpy(dtype="float64", na_value=np.nan) for c in columns
+    ])
+
+
+class PearsonStats:
+    """
+    Sumas por par (i, j) sobre filas con ambas columnas presentes. Los valores se
+    desplazan por una referencia fija por columna para no perder precisión en Σx².
+    """
+
+    def __init__(self, shift: np.ndarray) -> None:
+        k = len(shift)
+        self.shift = np.asarray(shift, dtype="float64")
+        self.n = np.zeros((k, k))
+        self.sx = np.zeros((k, k))    # sx[i, j] = Σ x_i sobre filas con i y j
+        self.sxx = np.zeros((k, k))   # sxx[i, j] = Σ x_i² sobre filas con i y j
+        self.sxy = np.zeros((k, k))   # sxy[i, j] = Σ x_i x_j
+
+    @classmethod
+    def from_array(cls, a: np.ndarray, chunk_rows: int = CHUNK_ROWS) -> "PearsonStats":
+        head = a[:chunk_rows]
+        with np.errstate(invalid="ignore"):
+            shift = np.nan_to_num(np.nanmean(head, axis=0)) if head.size else np.zeros(a.shape[1])
+        out = cls(shift)
+        for i in range(0, len(a), max(1, int(chunk_rows))):
+            out.update(a[i:i + chunk_rows])
+        return out
+
+    def _acc(self, a: np.ndarray, sign: float) -> None:
+        if not len(a):
+            return
+        x = a - self.shift
+        m = ~np.isnan(x)
+        x0 = np.where(m, x, 0.0)
+        mf = m.astype("float64")
+        self.n += sign * (mf.T @ mf)
+        self.sx += sign * (x0.T @ mf)
+        self.sxx += sign * ((x0 * x0).T @ mf)
+        self.sxy += sign * (x0.T @ x0)
+
+    def update(self, a: np.ndarray) -> None:
+        self._acc(a, 1.0)
+
+    def remove(self, a: np.ndarray) -> None:
+        self._acc(a, -1.0)
+
+    def merge(self, other: "PearsonStats") -> None:
+        # misma referencia: Σ(x - c) cambia linealmente con c, así que se re-centra 'other'
+        d = other.shift - self.shift
+        sx_o = other.sx + d[:, None] * other.n
+        self.sxx += other.sxx + 2 * d[:, None] * other.sx + (d * d)[:, None] * other.n
+        self.sxy += other.sxy + d[:, None] * other.sx.T + d[None, :] * other.sx + np.outer(d, d) * other.n
+        self.sx += sx_o
+        self.n += other.n
+
+    def corr(self) -> np.ndarray:
+        n, sx, sxx = self.n, self.sx, self.sxx
+        with np.errstate(invalid="ignore", divide="ignore"):
+            num = n * self.sxy - sx * sx.T
+            den = np.sqrt((n * sxx - sx * sx) * (n * sxx.T - sx.T * sx.T))
+            r = np.where((n >= 2) & (den > 0), num / den, np.nan)
+        return np.clip(r, -1.0, 1.0)
+
+
+def rank_array(a: np.ndarray) -> np.ndarray:
+    """Rangos promedio por columna (NaN se queda NaN), como DataFrame.rank()."""
+    return pd.DataFrame(a).rank(method="average").to_numpy(dtype="float64")
+
+
+def _pair_pearson(x: np.ndarray, y: np.ndarray) -> float:
+    if len(x) < 2:
+        return np.nan
+    xc, yc = x - x.mean(), y - y.mean()
+    den = np.sqrt((xc * xc).sum() * (yc * yc).sum())
+    return float(np.clip((xc * yc).sum() / den, -1.0, 1.0)) if den > 0 else np.nan
+
+
+def spearman_matrix(a: np.ndarray, ranks: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Pearson sobre rangos. Los pares sin NaN usan los rangos globales (cacheables);
+    los que tienen NaN se re-rankean sobre sus filas completas, como pandas.
+    """
+    ranks = rank_array(a) if ranks is None else ranks
+    r = PearsonStats.from_array(ranks).corr()
+    nan_cols = np.isnan(a).any(axis=0)
+    k = a.shape[1]
+    for i in range(k):
+        for j in range(i + 1, k):
+            if nan_cols[i] or nan_cols[j]:
+                m = ~np.isnan(a[:, i]) & ~np.isnan(a[:, j])
+                rr = rank_array(a[m][:, [i, j]])
+                r[i, j] = r[j, i] = _pair_pearson(rr[:, 0], rr[:, 1])
+    return r
+
+
+def _tied_pairs(sorted_v: np.ndarray) -> int:
+    if not len(sorted_v):
+        return 0
+    cuts = np.flatnonzero(np.diff(sorted_v)) + 1
+    c = np.diff(np.concatenate([[0], cuts, [len(sorted_v)]]))
+    return int((c * (c - 1) // 2).sum())
+
+
+def _inversions(r: np.ndarray) -> int:
+    """
+    Pares i < j con r[i] > r[j] (r enteros >= 0). Merge sort por niveles: en cada nivel
+    cada elemento de la mitad derecha de su bloque cuenta los mayores de la izquierda.
+    """
+    n = len(r)
+    m = int(r.max()) + 1 if n else 1
+    pos = np.arange(n, dtype="int64")
+    total = 0
+    w = 1
+    while w < n:
+        blk = pos // (2 * w)
+        right = ((pos // w) & 1).astype(bool)
+        left_keys = np.sort(blk[~right] * m + r[~right])
+        br, rr = blk[right], r[right]
+        total += int((np.searchsorted(left_keys, br * m + m, side="left")
+                      - np.searchsorted(left_keys, br * m + rr, side="right")).sum())
+        w *= 2
+    return total
+
+
+def kendall_tau(x: np.ndarray, y: np.ndarray) -> float:
+    """Tau-b sobre las filas donde x e y son números."""
+    ok = ~np.isnan(x) & ~np.isnan(y)
+    x, y = x[ok], y[ok]
+    n = len(x)
+    if n < 2:
+        return np.nan
+    order = np.lexsort((y, x))
+    xs, ys = x[order], y[order]
+    n0 = n * (n - 1) // 2
+    n1 = _tied_pairs(xs)
+    uy, ry = np.unique(ys, return_inverse=True)
+    n2 = _tied_pairs(np.sort(ys))
+    same = np.concatenate([[False], (np.diff(xs) == 0) & (np.diff(ys) == 0)])
+    runs = np.diff(np.concatenate([np.flatnonzero(~same), [n]]))
+    n3 = int((runs * (runs - 1) // 2).sum())
+    den = np.sqrt(float(n0 - n1) * float(n0 - n2))
+    if den == 0:
+        return np.nan
+    swaps = _inversions(ry.astype("int64"))
+    return float(np.clip((n0 - n1 - n2 + n3 - 2 * swaps) / den, -1.0, 1.0))
+
+
+def kendall_matrix(a: np.ndarray) -> np.ndarray:
+    k = a.shape[1]
+    r = np.eye(k)
+    for i in range(k):
+        for j in range(i + 1, k):
+            r[i, j] = r[j, i] = kendall_tau(a[:, i], a[:, j])
+    return r
+
+
+def corr_array(a: np.ndarray, method: str = "pearson", ranks: Optional[np.ndarray] = None,
+               stats: Optional[PearsonStats] = None) -> np.ndarray:
+    if method == "spearman":
+        return spearman_matrix(a, ranks)
+    if method == "kendall":
+        return kendall_matrix(a)
+    return (stats or PearsonStats.from_array(a)).corr()
+
+
+def corr_frame(df: pd.DataFrame, method: str = "pearson") -> pd.DataFrame:
+    """Como df.corr(method) sobre columnas ya numéricas (coerce)."""
+    cols = list(df.columns)
+    return pd.DataFrame(corr_array(numeric_array(df, cols), method), index=cols, columns=cols)
+
+
+class CorrelationStore:
+    """
+    Matrices por método del dataset publicado. 'version' es la del DatasetCache:
+    advance() aplica el delta de una escritura a los estadísticos de Pearson (exacto)
+    y descarta rangos y Kendall, que se recalculan al pedirlos.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.version: Optional[int] = None
+        self.columns: List[str] = []
+        self._df: Optional[pd.DataFrame] = None
+        self._data: Optional[np.ndarray] = None
+        self._ranks: Optional[np.ndarray] = None
+        self._pearson: Optional[PearsonStats] = None
+        self._results: Dict[str, pd.DataFrame] = {}
+
+    def _array(self) -> np.ndarray:
+        if self._data is None:
+            self._data = numeric_array(self._df, self.columns)
+        return self._data
+
+    def matrix(self, version: int, df: pd.DataFrame, method: str, columns: Sequence[str]) -> pd.DataFrame:
+        with self._lock:
+            if self.version != version or self.columns != list(columns):
+                self.version, self.columns, self._df = version, list(columns), df
+                self._data = self._ranks = self._pearson = None
+                self._results = {}
+            out = self._results.get(method)
+            if out is None:
+                if method == "spearman":
+                    if self._ranks is None:
+                        self._ranks = rank_array(self._array())
+                    r = spearman_matrix(self._array(), self._ranks)
+                elif method == "kendall":
+                    r = kendall_matrix(self._array())
+                else:
+                    if self._pearson is None:
+                        self._pearson = PearsonStats.from_array(self._array())
+                    r = self._pearson.corr()
+                out = pd.DataFrame(r, index=self.columns, columns=self.columns)
+                self._results[method] = out
+            return out
+
+    def advance(self, from_version: int, to_version: int, before: pd.DataFrame,
+                after: pd.DataFrame, df: pd.DataFrame) -> bool:
+        with self._lock:
+            if self.version != from_version:
+                return False
+            if self._pearson is not None:
+                self._pearson.remove(numeric_array(before, self.columns))
+                self._pearson.update(numeric_array(after, self.columns))
+            self.version, self._df = to_version, df
+            self._data = self._ranks = None
+            self._results = {}
+            return True
+
+
+__all__ = [
+    "PearsonStats",
+    "CorrelationStore",
+    "numeric_array",
+    "rank_array",
+    "spearman_matrix",
+    "kendall_tau",
+    "kendall_matrix",
+    "corr_array",
+    "corr_frame",
+]
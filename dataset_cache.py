@@ -0,0 +1,112 @@
+# dataset_cache.py
+# Cache de dataset compartido por todo el proceso (todas las sesiones de Streamlit).
+# - Un único DataFrame normalizado por "clave" (huella del archivo o marcador de Mongo)
+# - Se recarga solo cuando cambia la clave; la carga ocurre una vez aunque haya
+#   varias sesiones pidiendo datos al mismo tiempo (lock)
+# - Cada frame nuevo incrementa 'version', útil para cachés derivados (filtros, índices...)
+# - derived(): artefactos calculados una vez por versión (índice de PK, etc.)
+# - apply(): aplica un delta al frame actual (p.ej. cambios que llegan de Mongo)
+#   y publica el resultado con la misma clave, sin recargar
+#
+# No depende de Streamlit. En app.py se instancia una vez con @st.cache_resource.
+#
+# IMPORTANTE: el frame entregado es compartido; no mutarlo en sitio (usar .copy()).
+
+from __future__ import annotations
+
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple, TypeVar
+
+import pandas as pd
+
+T = TypeVar("T")
+
+
+class DatasetCache:
+    def __init__(self) -> None:
+        self._lock = threading.RLock()
+        self._key: Optional[Hashable] = None
+        self._df: Optional[pd.DataFrame] = None
+        self._version = 0
+        self._derived: Dict[str, Tuple[int, Any]] = {}
+
+    @property
+    def version(self) -> int:
+        """Versión del frame actual (0 = nunca cargado)."""
+        return self._version
+
+    @property
+    def key(self) -> Optional[Hashable]:
+        return self._key
+
+    def get(self, key_fn: Callable[[], Hashable], loader: Callable[[], pd.DataFrame]) -> pd.DataFrame:
+        """
+        Devuelve el frame cacheado si key_fn() coincide; si no, llama a 'loader' una sola
+        vez (las demás sesiones esperan el lock) y publica el resultado.
+        La clave se recalcula tras cargar: la carga puede reescribir el archivo
+        (p.ej. importación CSV → Parquet).
+        """
+        with self._lock:
+            if self._df is not None and self._key == key_fn():
+                return self._df
+            df = loader()
+            self._publish(key_fn(), df)
+            return df
+
+    def put(self, key: Hashable, df: pd.DataFrame) -> None:
+        """Publica un frame ya calculado (p.ej. tras una escritura) sin recargar."""
+        with self._lock:
+            self._publish(key, df)
+
+    def apply(self, fn: Callable[[pd.DataFrame], pd.DataFrame]) -> bool:
+        """
+        Publica fn(frame_actual) con la misma clave (nueva versión). 'fn' corre bajo el
+        lock: ninguna carga/put concurrente se pierde. False si no hay frame o fn
+        devolvió el mismo objeto (sin cambios).
+        """
+        with self._lock:
+            if self._df is None:
+                return False
+            out = fn(self._df)
+            if out is self._df:
+                return False
+            self._publish(self._key, out)
+            return True
+
+    def invalidate(self) -> None:
+        """Fuerza recarga en el próximo get()."""
+        with self._lock:
+            self._key = None
+            self._df = None
+
+    def derived(self, name: str, builder: Callable[[pd.DataFrame], T], df: Optional[pd.DataFrame] = None) -> T:
+        """
+        Artefacto derivado del frame actual, calculado una vez por versión.
+        Si se pasa 'df' y no es el frame cacheado (otra sesión publicó entretanto),
+        se construye para ese frame sin cachear.
+        """
+        with self._lock:
+            if self._df is None or (df is not None and df is not self._df):
+                return builder(df if df is not None else pd.DataFrame())
+            hit = self._derived.get(name)
+            if hit is not None and hit[0] == self._version:
+                return hit[1]
+            val = builder(self._df)
+            self._derived[name] = (self._version, val)
+            return val
+
+    def snapshot(self) -> Tuple[int, Optional[pd.DataFrame]]:
+        """(version, frame) consistentes entre sí."""
+        with self._lock:
+            return self._version, self._df
+
+    def _publish(self, key: Hashable, df: pd.DataFrame) -> None:
+        self._key = key
+        self._df = df
+        self._version += 1
+        self._derived.clear()
+
+
+__all__ = [
+    "DatasetCache",
+]
@@ -0,0 +1,200 @@
+# filter_engine.py
+# Motor de filtros vectorizado para los "Filtros avanzados" y la búsqueda rápida.
+# - Columnas pre-tipadas cacheadas por versión del dataset: texto en minúsculas,
+#   numéricos como float64 y fechas como datetime64 (se calculan una sola vez)
+# - Una máscara booleana memoizada por predicado (LRU): cambiar un filtro solo
+#   recalcula ese predicado; el resto se combina con & de numpy
+# - "contiene" sobre columnas de texto usa un índice de trigramas (text_index.py),
+#   construido perezosamente por columna; consultas de < 3 caracteres hacen scan
+# - Columnas category: texto/minúsculas se derivan del diccionario y la igualdad
+#   compara códigos enteros
+# - Devuelve máscaras / posiciones (iloc), nunca copias del frame
+#
+# Misma semántica que el antiguo app._apply_advanced_filters. Se crea una instancia
+# por versión del dataset (DatasetCache.derived). No depende de Streamlit.
+
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from text_index import NgramIndex
+
+
+# Columnas de texto con filtro "contiene" (mismo orden que la UI)
+TEXT_FILTERS = ("name", "first_name", "last_name", "email", "phone", "job_title", "user_id", "mongo_id")
+
+
+class FilterEngine:
+    def __init__(self, df: pd.DataFrame, max_masks: int = 32) -> None:
+        self.df = df
+        self.n = len(df)
+        self.max_masks = max_masks
+        self._lock = threading.RLock()
+        self._cols: Dict[Hashable, Any] = {}
+        self._masks: "OrderedDict[Hashable, np.ndarray]" = OrderedDict()
+
+    # --------- Columnas pre-tipadas (una vez por versión) ---------
+
+    def _col(self, key: Hashable, build: Callable[[], Any]) -> Any:
+        with self._lock:
+            if key not in self._cols:
+                self._cols[key] = build()
+            return self._cols[key]
+
+    def _is_cat(self, col: str) -> bool:
+        return isinstance(self.df[col].dtype, pd.CategoricalDtype)
+
+    def codes(self, col: str) -> np.ndarray:
+        """Códigos de una columna category (-1 = nulo)."""
+        return self._col(("codes", col), lambda: self.df[col].cat.codes.to_numpy())
+
+    def _from_dict(self, col: str, cats: pd.Index) -> pd.Series:
+        """Expande valores por categoría a las n filas vía códigos (nulo -> "")."""
+        table = np.append(cats.to_numpy(dtype=object), "")
+        return pd.Series(table[self.codes(col)], dtype=object)
+
+    def text(self, col: str) -> pd.Series:
+        """Columna como texto (NaN -> ""), índice 0..n-1."""
+        def _b() -> pd.Series:
+            if self._is_cat(col):
+                return self._from_dict(col, self.df[col].cat.categories.astype(str))
+            s = self.df[col].reset_index(drop=True)
+            if pd.api.types.is_datetime64_any_dtype(s):
+                # como el astype(str) del filtro original: fechas sin hora -> "YYYY-MM-DD"
+                # (vía object saldría "YYYY-MM-DD 00:00:00")
+                return s.astype(str).astype(object).where(s.notna(), "")
+            return s.astype(object).where(s.notna(), "").astype(str)
+        return self._col(("text", col), _b)
+
+    def lower(self, col: str) -> pd.Series:
+        def _b() -> pd.Series:
+            if self._is_cat(col):
+                return self._from_dict(col, self.df[col].cat.categories.astype(str).str.lower())
+            return self.text(col).str.lower()
+        return self._col(("lower", col), _b)
+
+    def ngrams(self, col: str) -> NgramIndex:
+        """Índice de trigramas de la columna (se construye en la primera búsqueda)."""
+        return self._col(("ngram", col), lambda: NgramIndex(self.lower(col)))
+
+    def numeric(self, col: str) -> np.ndarray:
+        return self._col(
+            ("num", col),
+            lambda: pd.to_numeric(self.df[col], errors="coerce").to_numpy(dtype="float64", na_value=np.nan),
+        )
+
+    def dates(self, col: str) -> np.ndarray:
+        return self._col(
+            ("dt", col),
+            lambda: pd.to_datetime(self.df[col], errors="coerce").to_numpy(dtype="datetime64[ns]"),
+        )
+
+    # --------- Predicados memoizados ---------
+
+    def _mask(self, key: Hashable, build: Callable[[], np.ndarray]) -> np.ndarray:
+        with self._lock:
+            hit = self._masks.get(key)
+            if hit is not None:
+                self._masks.move_to_end(key)
+                return hit
+        m = np.asarray(build(), dtype=bool)
+        with self._lock:
+            self._masks[key] = m
+            while len(self._masks) > self.max_masks:
+                self._masks.popitem(last=False)
+        return m
+
+    def contains(self, col: str, q: Any) -> np.ndarray:
+        """'contiene' case-insensitive, literal (sin regex)."""
+        ql = str(q).strip().lower()
+
+        def _b() -> np.ndarray:
+            if col in TEXT_FILTERS:
+                m = self.ngrams(col).mask(ql)
+                if m is not None:
+                    return m
+            return self.lower(col).str.contains(ql, regex=False).to_numpy(dtype=bool, na_value=False)
+
+        return self._mask(("contains", col, ql), _b)
+
+    def equals(self, col: str, value: Any, case: bool = True) -> np.ndarray:
+        v = str(value) if case else str(value).lower()
+
+        def _b() -> np.ndarray:
+            if self._is_cat(col):
+                cats = self.df[col].cat.categories.astype(str)
+                hit = np.flatnonzero((cats if case else cats.str.lower()) == v)
+                return np.isin(self.codes(col), hit)
+            src = self.text if case else self.lower
+            return (src(col) == v).to_numpy(dtype=bool)
+
+        return self._mask(("eq", col, v, case), _b)
+
+    def between_num(self, col: str, vmin: Optional[float], vmax: Optional[float]) -> np.ndarray:
+        def _b() -> np.ndarray:
+            x = self.numeric(col)
+            m = np.ones(self.n, dtype=bool)
+            if vmin is not None:
+                m &= x >= vmin
+            if vmax is not None:
+                m &= x <= vmax
+            return m
+        return self._mask(("num", col, vmin, vmax), _b)
+
+    def between_date(self, col: str, dmin: Optional[date], dmax: Optional[date]) -> np.ndarray:
+        def _b() -> np.ndarray:
+            x = self.dates(col)
+            m = np.ones(self.n, dtype=bool)
+            if dmin is not None:
+                m &= x >= np.datetime64(pd.Timestamp(dmin))
+            if dmax is not None:
+                end = pd.Timestamp(dmax) + pd.Timedelta(days=1) - pd.Timedelta(seconds=1)
+                m &= x <= np.datetime64(end)
+            return m
+        return self._mask(("dt", col, dmin, dmax), _b)
+
+    # --------- Combinación ---------
+
+    def mask(self, f: Dict[str, Any]) -> np.ndarray:
+        """Máscara combinada para el dict de _filters_ui (AND de predicados)."""
+        cols = self.df.columns
+        parts: List[np.ndarray] = []
+
+        for key in TEXT_FILTERS:
+            if key in cols and f.get(key) and str(f[key]).strip():
+                parts.append(self.contains(key, f[key]))
+
+        if "sex" in cols and f.get("sex") and f["sex"] != "Todos":
+            parts.append(self.equals("sex", f["sex"], case=False))
+        if "created_ym" in cols and f.get("created_ym") and f["created_ym"] != "Todos":
+            parts.append(self.equals("created_ym", f["created_ym"]))
+
+        if "id" in cols:
+            parts.append(self.between_num("id", f.get("id_min"), f.get("id_max")))
+        if "balance" in cols:
+            parts.append(self.between_num("balance", f.get("bal_min"), f.get("bal_max")))
+        if "dob" in cols:
+            parts.append(self.between_date("dob", f.get("dob_min"), f.get("dob_max")))
+        if "created_at" in cols:
+            parts.append(self.between_date("created_at", f.get("crt_min"), f.get("crt_max")))
+
+        out = np.ones(self.n, dtype=bool)
+        for p in parts:
+            out &= p
+        return out
+
+    def positions(self, f: Dict[str, Any]) -> np.ndarray:
+        """Posiciones iloc que cumplen los filtros."""
+        return np.flatnonzero(self.mask(f))
+
+
+__all__ = [
+    "TEXT_FILTERS",
+    "FilterEngine",
+]
@@ -0,0 +1,208 @@
+# math_kernels.py
+# Kernels sobre ndarrays para las vistas de TimeSeriesContext (math_utils)
+# - sma(): media móvil por suma acumulada (mismo resultado que rolling(w, min_periods=1).mean())
+# - ema(): recurrencia de una pasada (igual que ewm(span, adjust=False, min_periods=1).mean())
+# - ols_trend(): pendiente y R² de y = a + b*t en forma cerrada desde sumas
+#
+# Todos aceptan y de forma (n,) o (n, m) (m métricas en columnas) y una ventana/span o
+# una secuencia de ellas: con secuencia, la salida agrega un primer eje por ventana.
+# NaN se trata como en pandas (se salta en SMA/tendencia; en EMA la brecha decae).
+#
+# numba es opcional: si está instalado, la recurrencia de la EMA se compila con JIT
+# (MATH_USE_NUMBA=0 lo desactiva); si no, se resuelve como scan lineal vectorizado.
+
+from __future__ import annotations
+
+import os
+from typing import Dict, Sequence, Tuple, Union
+
+import numpy as np
+
+try:
+    import numba  # type: ignore
+    _HAS_NUMBA = True
+except Exception:  # pragma: no cover
+    numba = None  # type: ignore
+    _HAS_NUMBA = False
+
+USE_NUMBA = _HAS_NUMBA and os.getenv("MATH_USE_NUMBA", "1").strip().lower() not in ("0", "false", "no")
+
+Windows = Union[int, Sequence[int]]
+
+
+def _as_2d(y: np.ndarray) -> Tuple[np.ndarray, bool]:
+    a = np.asarray(y, dtype="float64")
+    return (a[:, None], True) if a.ndim == 1 else (a, False)
+
+
+def _as_windows(w: Windows) -> Tuple[np.ndarray, bool]:
+    if np.ndim(w) == 0:
+        return np.array([max(1, int(w))]), True
+    return np.array([max(1, int(x)) for x in w]), False
+
+
+def _shape(out: np.ndarray, flat_y: bool, one_w: bool) -> np.ndarray:
+    if flat_y:
+        out = out[..., 0]
+    return out[0] if one_w else out
+
+
+def sma(y: np.ndarray, window: Windows) -> np.ndarray:
+    """Media de los valores no NaN en las últimas 'window' posiciones (NaN si no hay)."""
+    a, flat = _as_2d(y)
+    ws, one = _as_windows(window)
+    n = a.shape[0]
+    ok = ~np.isnan(a)
+    zero = np.zeros((1, a.shape[1]))
+    cs = np.vstack([zero, np.cumsum(np.where(ok, a, 0.0), axis=0)])
+    cn = np.vstack([zero, np.cumsum(ok, axis=0, dtype="float64")])
+    idx = np.arange(1, n + 1)
+    out = np.empty((len(ws), n, a.shape[1]))
+    for k, w in enumerate(ws):
+        lo = np.maximum(idx - w, 0)
+        cnt = cn[idx] - cn[lo]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out[k] = np.where(cnt > 0, (cs[idx] - cs[lo]) / cnt, np.nan)
+    return _shape(out, flat, one)
+
+
+def _gap_new_weight(old: np.ndarray, alpha: np.ndarray) -> np.ndarray:
+    """
+    Peso de la observación que cierra una brecha en ewm(adjust=False): alpha, salvo con
+    com == 1 (alpha = 0.5, span = 3), donde pandas 3 lo recalcula como 1 - old.
+    """
+    return np.where(alpha == 0.5, 1.0 - old, alpha)
+
+
+def _ema_numpy(a: np.ndarray, alpha: np.ndarray) -> np.ndarray:
+    """
+    a: (n, m); alpha: (m,). La recurrencia de ewm(adjust=False, ignore_na=False) es
+    lineal, e_t = A_t * e_{t-1} + B_t: tras una brecha de g periodos el peso anterior es
+    w = (1 - alpha)^(g+1) y el nuevo alpha, normalizados (A = w / (w + alpha)); con
+    alpha = 0.5 (com == 1) pandas usa 1 - w como peso nuevo (ver _gap_new_weight);
+    en huecos A=1, B=0; en la primera observación A=0, B=y.
+    Se resuelve por bloques de ~sqrt(n): recurrencia local dentro de todos los bloques
+    a la vez, luego el arrastre entre bloques (~2*sqrt(n) pasos vectorizados).
+    """
+    n, m = a.shape
+    if n == 0:
+        return np.empty_like(a)
+    # caso común: sin huecos, A = 1 - alpha y B = alpha * y
+    A = np.empty((n, m))
+    A[:] = 1.0 - alpha
+    B = a * alpha
+    obs = ~np.isnan(a)
+    last = None
+    A[0], B[0] = 0.0, a[0]
+    if not obs.all():
+        idx = np.arange(n)[:, None]
+        last = np.maximum.accumulate(np.where(obs, idx, -1), axis=0)
+        A[~obs], B[~obs] = 1.0, 0.0
+        # solo cambian las observaciones que siguen a un hueco
+        r, c = np.nonzero(obs[1:] & ~obs[:-1])
+        r = r + 1
+        prev = last[r - 1, c]
+        first = prev < 0
+        A[r[first], c[first]] = 0.0
+        B[r[first], c[first]] = a[r[first], c[first]]
+        gap = ~first & (r - prev > 1)
+        if gap.any():
+            rg, cg = r[gap], c[gap]
+            old = (1.0 - alpha[cg]) ** (rg - prev[gap])
+            A[rg, cg] = old / (old + _gap_new_weight(old, alpha[cg]))
+            B[rg, cg] = (1.0 - A[rg, cg]) * a[rg, cg]
+
+    size = max(1, int(np.sqrt(n)))
+    nb = -(-n // size)
+    pad = nb * size - n
+    A3 = np.vstack([A, np.ones((pad, m))]).reshape(nb, size, m)
+    B3 = np.vstack([B, np.zeros((pad, m))]).reshape(nb, size, m)
+    loc = np.empty_like(B3)  # recurrencia dentro del bloque partiendo de 0
+    prod = np.empty_like(A3)  # producto de A dentro del bloque
+    loc[:, 0], prod[:, 0] = B3[:, 0], A3[:, 0]
+    for i in range(1, size):
+        loc[:, i] = A3[:, i] * loc[:, i - 1] + B3[:, i]
+        prod[:, i] = prod[:, i - 1] * A3[:, i]
+    carry = np.empty((nb, 1, m))
+    e = np.zeros(m)
+    for b in range(nb):
+        carry[b, 0] = e
+        e = prod[b, -1] * e + loc[b, -1]
+    out = (loc + prod * carry).reshape(nb * size, m)[:n]
+    return out if last is None else np.where(last >= 0, out, np.nan)
+
+
+if USE_NUMBA:  # pragma: no cover - depende de numba
+    @numba.njit(cache=True)
+    def _ema_jit(a: np.ndarray, alpha: np.ndarray) -> np.ndarray:
+        n, m = a.shape
+        out = np.empty_like(a)
+        for j in range(m):
+            if n == 0:
+                break
+            weighted = a[0, j]
+            old_wt = 1.0
+            out[0, j] = weighted
+            for i in range(1, n):
+                cur = a[i, j]
+                if weighted == weighted:
+                    old_wt *= 1.0 - alpha[j]
+                    if cur == cur:
+                        new_wt = 1.0 - old_wt if alpha[j] == 0.5 else alpha[j]
+                        weighted = (old_wt * weighted + new_wt * cur) / (old_wt + new_wt)
+                        old_wt = 1.0
+                elif cur == cur:
+                    weighted = cur
+                out[i, j] = weighted
+        return out
+
+
+def ema(y: np.ndarray, span: Windows) -> np.ndarray:
+    """EMA con alpha = 2 / (span + 1); las ventanas se resuelven en una sola pasada."""
+    a, flat = _as_2d(y)
+    spans, one = _as_windows(span)
+    n, m = a.shape
+    # todas las spans a la vez: columnas (span, métrica)
+    big = np.tile(a, (1, len(spans)))
+    alpha = np.repeat(2.0 / (spans + 1.0), m)
+    res = _ema_jit(big, alpha) if USE_NUMBA else _ema_numpy(big, alpha)
+    out = res.reshape(n, len(spans), m).transpose(1, 0, 2)
+    return _shape(out, flat, one)
+
+
+def ols_trend(y: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    slope y r2 de y = a + b*t con t = 0..k-1 sobre los valores no NaN de cada columna
+    (como np.polyfit tras dropna). NaN con menos de 2 valores o varianza nula.
+    """
+    a, flat = _as_2d(y)
+    ok = ~np.isnan(a)
+    t = np.cumsum(ok, axis=0, dtype="float64") - 1.0
+    n = ok.sum(axis=0).astype("float64")
+    with np.errstate(invalid="ignore", divide="ignore"):
+        # centrar y por columna: misma pendiente y R², sin cancelar en Σy²
+        yc = np.where(ok, a - np.nanmean(np.where(ok, a, np.nan), axis=0), 0.0)
+    t0 = np.where(ok, t, 0.0)
+    st = n * (n - 1) / 2.0
+    stt = (n - 1) * n * (2 * n - 1) / 6.0
+    sy = yc.sum(axis=0)
+    sty = (t0 * yc).sum(axis=0)
+    syy = (yc * yc).sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        dt = n * stt - st * st
+        dy = n * syy - sy * sy
+        cov = n * sty - st * sy
+        slope = np.where((n >= 2) & (dt > 0), cov / dt, np.nan)
+        r2 = np.where((n >= 2) & (dy > 0) & (dt > 0), cov * cov / (dt * dy), np.nan)
+    r2 = np.where(np.isnan(slope), np.nan, np.clip(r2, 0.0, 1.0))
+    if flat:
+        return {"slope": slope[0], "r2": r2[0]}
+    return {"slope": slope, "r2": r2}
+
+
+__all__ = [
+    "sma",
+    "ema",
+    "ols_trend",
+    "USE_NUMBA",
+]
@@ -2,15 +2,27 @@
 # ----------------------------------------------------------
 # Todas las funciones son "pandas-friendly" (vectorizadas) y tolerantes a NaN.
 # No dependen de Streamlit. Se enfocan en robustez y en trabajar con frames grandes.
+#
+# Series de tiempo: TimeSeriesContext parsea, ordena y re-muestrea una sola vez por
+# (frame, date_col, val_col, freq, agg) y expone SMA/EMA/MoM/CAGR/tendencia como
+# vistas derivadas; ts_context() los guarda en un LRU (TS_CACHE_SIZE). SMA, EMA y
+# tendencia corren sobre ndarrays en math_kernels (numba opcional). batch_series()
+# calcula lo mismo para varias métricas y grupos en una pasada (formato largo).
 
 from __future__ import annotations
 
+import threading
+import weakref
+from collections import OrderedDict
 from dataclasses import dataclass
-from typing import Dict, Optional, Literal
+from typing import Any, Callable, Dict, Hashable, Optional, Literal, Sequence, Tuple, Union
 
 import numpy as np
 import pandas as pd
 
+import math_kernels
+from correlation import corr_frame
+
 
 # =========================
 # Helpers de tipificación
@@ -32,6 +44,17 @@ def _ensure_series(df: pd.DataFrame, col: str) -> pd.Series:
     return df[col]
 
 
+def resample_rule(freq: str) -> str:
+    """'M' (fin de mes) es 'ME' desde pandas 2.2; 'M' ya no se acepta en pandas 3."""
+    if freq != "M":
+        return freq
+    try:
+        pd.tseries.frequencies.to_offset("ME")
+        return "ME"
+    except ValueError:
+        return "M"
+
+
 # =========================
 # Estadísticos básicos
 # =========================
@@ -93,7 +116,7 @@ def flag_outliers_iqr(df: pd.DataFrame, col: str, k: float = 1.5) -> pd.Series:
 # =========================
 
 def correlation_matrix(df: pd.DataFrame, method: Literal["pearson", "spearman", "kendall"] = "pearson") -> pd.DataFrame:
-    """Matriz de correlación solo con columnas numéricas (coerce)."""
+    """Matriz de correlación solo con columnas numéricas (coerce); Kendall en O(n log n) por par."""
     numeric = {}
     for c in df.columns:
         s = _to_numeric(df[c])
@@ -103,7 +126,7 @@ def correlation_matrix(df: pd.DataFrame, method: Literal["pearson", "spearman",
     if not numeric:
         return pd.DataFrame()
     num_df = pd.DataFrame(numeric)
-    return num_df.corr(method=method)
+    return corr_frame(num_df, method=method)
 
 
 # =========================
@@ -125,16 +148,198 @@ def _aggregate_ts(
         return pd.Series(dtype=float)
 
     ts = ts.set_index("_d").sort_index()
+    rule = resample_rule(freq)
     if agg == "mean":
-        out = ts["_v"].resample(freq).mean()
+        out = ts["_v"].resample(rule).mean()
     elif agg == "count":
-        out = ts["_v"].resample(freq).count().astype(float)
+        out = ts["_v"].resample(rule).count().astype(float)
     else:
-        out = ts["_v"].resample(freq).sum()
+        out = ts["_v"].resample(rule).sum()
 
     return out
 
 
+# =========================
+# Contexto de serie (una preparación, muchas vistas)
+# =========================
+
+SeriesBuilder = Callable[[pd.DataFrame, str, str, str, str], pd.Series]
+
+
+class TimeSeriesContext:
+    """
+    Serie agregada ya preparada + vistas derivadas memorizadas (cada una O(periodos)).
+    La serie no se modifica; las vistas devuelven Series nuevas por parámetro.
+    """
+
+    def __init__(self, series: pd.Series) -> None:
+        self.series = series
+        self._views: Dict[Tuple[Any, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_frame(
+        cls,
+        df: pd.DataFrame,
+        date_col: str,
+        val_col: str,
+        freq: str = "M",
+        agg: str = "sum",
+        builder: Optional[SeriesBuilder] = None,
+    ) -> "TimeSeriesContext":
+        return cls((builder or _aggregate_ts)(df, date_col, val_col, freq, agg))
+
+    @property
+    def empty(self) -> bool:
+        return self.series.empty
+
+    def _view(self, key: Tuple[Any, ...], fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            if key not in self._views:
+                self._views[key] = fn()
+            return self._views[key]
+
+    def _wrap(self, values: np.ndarray) -> pd.Series:
+        return pd.Series(values, index=self.series.index, name=self.series.name)
+
+    def sma(self, window: int) -> pd.Series:
+        """Como rolling(window, min_periods=1).mean()."""
+        w = int(max(1, window))
+        return self._view(("sma", w), lambda: self._wrap(math_kernels.sma(self._values(), w)))
+
+    def ema(self, span: int) -> pd.Series:
+        """Como ewm(span, adjust=False, min_periods=1).mean()."""
+        sp = int(max(1, span))
+        return self._view(("ema", sp), lambda: self._wrap(math_kernels.ema(self._values(), sp)))
+
+    def smas(self, windows: Sequence[int]) -> pd.DataFrame:
+        """Varias ventanas SMA en una sola llamada al kernel: columnas sma_{w}."""
+        ws = [int(max(1, w)) for w in windows]
+        out = math_kernels.sma(self._values(), ws) if ws else np.empty((0, len(self.series)))
+        return pd.DataFrame({f"sma_{w}": out[i] for i, w in enumerate(ws)}, index=self.series.index)
+
+    def emas(self, spans: Sequence[int]) -> pd.DataFrame:
+        """Varias spans EMA en una sola pasada: columnas ema_{s}."""
+        sps = [int(max(1, s)) for s in spans]
+        out = math_kernels.ema(self._values(), sps) if sps else np.empty((0, len(self.series)))
+        return pd.DataFrame({f"ema_{s}": out[i] for i, s in enumerate(sps)}, index=self.series.index)
+
+    def _values(self) -> np.ndarray:
+        return self.series.to_numpy(dtype="float64", na_value=np.nan)
+
+    def mom_abs(self) -> pd.Series:
+        return self._view(("mom_abs",), lambda: self.series - self.series.shift(1))
+
+    def mom_pct(self) -> pd.Series:
+        """Variación periodo a periodo en % (sin rellenar huecos)."""
+        return self._view(("mom_pct",), lambda: (self.series / self.series.shift(1) - 1.0) * 100.0)
+
+    def cagr(self, years: Literal["calendar", "length"] = "calendar") -> Optional[float]:
+        """
+        CAGR en %. 'calendar': primer/último valor válido y meses entre ellos;
+        'length': extremos de la serie y len/12 años (criterio de _MU en app.py).
+        """
+        return self._view(("cagr", years), lambda: self._cagr(years))
+
+    def _cagr(self, years: str) -> Optional[float]:
+        s = self.series
+        if years == "length":
+            if s.empty or s.first_valid_index() is None:
+                return None
+            v0, v1 = s.iloc[0], s.iloc[-1]
+            if not (np.isfinite(v0) and np.isfinite(v1)) or v0 <= 0 or v1 <= 0:
+                return None
+            n_years = max(len(s) / 12.0, 0.001)
+            return float(((v1 / v0) ** (1.0 / n_years) - 1.0) * 100.0)
+        s = s.dropna()
+        if s.count() < 2:
+            return None
+        first_idx, last_idx = s.first_valid_index(), s.last_valid_index()
+        v0, v1 = float(s.loc[first_idx]), float(s.loc[last_idx])
+        if v0 <= 0 or v1 <= 0:
+            return None
+        months = max(1, (last_idx.to_period("M") - first_idx.to_period("M")).n)
+        return float(((v1 / v0) ** (1.0 / (months / 12.0)) - 1.0) * 100.0)
+
+    def trend(self) -> Dict[str, float]:
+        """Ajuste lineal y = a + b*t (t = 0..n-1) sobre la serie sin NaN: slope y r2."""
+        return dict(self._view(("trend",), self._trend))
+
+    def _trend(self) -> Dict[str, float]:
+        if self.series.count() < 2:
+            return dict(slope=np.nan, r2=np.nan)
+        fit = math_kernels.ols_trend(self._values())
+        return dict(slope=float(fit["slope"]), r2=float(fit["r2"]))
+
+
+TS_CACHE_SIZE = 32
+
+
+class TimeSeriesCache:
+    """
+    LRU de TimeSeriesContext por (frame, date_col, val_col, freq, agg, builder).
+    El frame se identifica por 'version' si se pasa (p.ej. la del DatasetCache) o por
+    identidad (weakref: una entrada de un frame ya liberado no se reutiliza). Asume
+    que los frames no se mutan en sitio.
+    """
+
+    def __init__(self, maxsize: int = TS_CACHE_SIZE) -> None:
+        self.maxsize = int(maxsize)
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[Hashable, Tuple[Any, TimeSeriesContext]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(
+        self,
+        df: pd.DataFrame,
+        date_col: str,
+        val_col: str,
+        freq: str = "M",
+        agg: str = "sum",
+        builder: Optional[SeriesBuilder] = None,
+        version: Optional[Hashable] = None,
+    ) -> TimeSeriesContext:
+        b = builder or _aggregate_ts
+        token = ("v", version) if version is not None else ("id", id(df))
+        key = (token, date_col, val_col, freq, agg, getattr(b, "__qualname__", id(b)))
+        with self._lock:
+            hit = self._items.get(key)
+            if hit is not None and (version is not None or hit[0]() is df):
+                self._items.move_to_end(key)
+                self.hits += 1
+                return hit[1]
+        ctx = TimeSeriesContext.from_frame(df, date_col, val_col, freq, agg, builder=b)
+        ref = (lambda: None) if version is not None else weakref.ref(df)
+        with self._lock:
+            self.misses += 1
+            self._items[key] = (ref, ctx)
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+        return ctx
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+
+_TS_CACHE = TimeSeriesCache()
+
+
+def ts_context(
+    df: pd.DataFrame,
+    date_col: str,
+    val_col: str,
+    freq: str = "M",
+    agg: str = "sum",
+    builder: Optional[SeriesBuilder] = None,
+    version: Optional[Hashable] = None,
+) -> TimeSeriesContext:
+    """Contexto compartido (LRU del módulo); 'builder' por defecto: _aggregate_ts."""
+    return _TS_CACHE.get(df, date_col, val_col, freq=freq, agg=agg, builder=builder, version=version)
+
+
 def rolling_sma(
     df: pd.DataFrame,
     date_col: str,
@@ -144,12 +349,10 @@ def rolling_sma(
     agg: Literal["sum", "mean", "count"] = "sum",
 ) -> pd.DataFrame:
     """SMA sobre serie agregada. Devuelve DataFrame con columnas ['value', f'sma_{window}']"""
-    base = _aggregate_ts(df, date_col, val_col, freq=freq, agg=agg)
-    if base.empty:
+    ctx = ts_context(df, date_col, val_col, freq=freq, agg=agg)
+    if ctx.empty:
         return pd.DataFrame(columns=["value", f"sma_{int(window)}"])
-    sma = base.rolling(window=int(max(1, window)), min_periods=1).mean()
-    out = pd.DataFrame({"value": base, f"sma_{int(window)}": sma})
-    return out
+    return pd.DataFrame({"value": ctx.series, f"sma_{int(window)}": ctx.sma(window)})
 
 
 def rolling_ema(
@@ -161,12 +364,10 @@ def rolling_ema(
     agg: Literal["sum", "mean", "count"] = "sum",
 ) -> pd.DataFrame:
     """EMA sobre serie agregada. Devuelve DataFrame con columnas ['value', f'ema_{span}']"""
-    base = _aggregate_ts(df, date_col, val_col, freq=freq, agg=agg)
-    if base.empty:
+    ctx = ts_context(df, date_col, val_col, freq=freq, agg=agg)
+    if ctx.empty:
         return pd.DataFrame(columns=["value", f"ema_{int(span)}"])
-    ema = base.ewm(span=int(max(1, span)), adjust=False).mean()
-    out = pd.DataFrame({"value": base, f"ema_{int(span)}": ema})
-    return out
+    return pd.DataFrame({"value": ctx.series, f"ema_{int(span)}": ctx.ema(span)})
 
 
 def monthly_growth(
@@ -179,14 +380,10 @@ def monthly_growth(
     Crecimiento MoM (% y absoluto) usando frecuencia mensual.
     mom_pct se devuelve en porcentaje (0..100).
     """
-    s = _aggregate_ts(df, date_col, val_col, freq="M", agg=agg)
-    if s.empty:
+    ctx = ts_context(df, date_col, val_col, freq="M", agg=agg)
+    if ctx.empty:
         return pd.DataFrame(columns=["value", "mom_abs", "mom_pct"])
-    prev = s.shift(1)
-    abs_diff = s - prev
-    pct = (s / prev - 1.0) * 100.0
-    out = pd.DataFrame({"value": s, "mom_abs": abs_diff, "mom_pct": pct})
-    return out
+    return pd.DataFrame({"value": ctx.series, "mom_abs": ctx.mom_abs(), "mom_pct": ctx.mom_pct()})
 
 
 def cagr(
@@ -196,27 +393,11 @@ def cagr(
     agg: Literal["sum", "mean", "count"] = "sum",
 ) -> Optional[float]:
     """
-    CAGR aproximado anualizado en % usando la serie mensual agregada.
-    Si el periodo es < 1 mes válido o la serie está vacía → None.
+    CAGR aproximado anualizado en % usando la serie mensual agregada
+    (primer y último valor válido; años = meses entre ellos / 12).
+    Si el periodo es < 1 mes válido, la serie está vacía o algún extremo es <= 0 → None.
     """
-    s = _aggregate_ts(df, date_col, val_col, freq="M", agg=agg).dropna()
-    if s.empty or s.count() < 2:
-        return None
-
-    # usar primer y último valor positivo (evita divisiones raras)
-    first_idx = s.first_valid_index()
-    last_idx = s.last_valid_index()
-    v0 = float(s.loc[first_idx])
-    v1 = float(s.loc[last_idx])
-    # Si v0 <= 0 o v1 <= 0, no tiene sentido el CAGR clásico
-    if v0 <= 0 or v1 <= 0:
-        return None
-
-    # años entre puntos (meses/12)
-    months = max(1, (last_idx.to_period("M") - first_idx.to_period("M")).n)
-    years = months / 12.0
-    cagr_val = (v1 / v0) ** (1.0 / years) - 1.0
-    return float(cagr_val * 100.0)
+    return ts_context(df, date_col, val_col, freq="M", agg=agg).cagr("calendar")
 
 
 def linear_trend(
@@ -230,22 +411,153 @@ def linear_trend(
     Ajuste lineal y = a + b*t sobre serie agregada.
     Devuelve dict con slope (b) y r2.
     """
-    s = _aggregate_ts(df, date_col, val_col, freq=freq, agg=agg).dropna()
-    if s.empty or s.count() < 2:
-        return dict(slope=np.nan, r2=np.nan)
+    return ts_context(df, date_col, val_col, freq=freq, agg=agg).trend()
+
+
+# =========================
+# Series por lotes (varias métricas × grupos)
+# =========================
+
+_PERIOD_FREQ = {"D": "D", "W": "W-SUN", "M": "M"}
 
-    # eje temporal como 0..n-1 (evita overflow de timestamps)
-    t = np.arange(len(s), dtype=float)
-    y = s.values.astype(float)
 
-    # Ajuste por mínimos cuadrados
-    # coef [b, a] para y ~ b*t + a
-    b, a = np.polyfit(t, y, 1)
+def batch_series(
+    df: pd.DataFrame,
+    date_col: str,
+    val_cols: Union[str, Sequence[str]],
+    by: Optional[Union[str, Sequence[str]]] = None,
+    freq: Literal["D", "W", "M"] = "M",
+    agg: Literal["sum", "mean", "count"] = "sum",
+    windows: Sequence[int] = (6,),
+    spans: Sequence[int] = (6,),
+    min_count: int = 0,
+    cagr_years: Literal["calendar", "length"] = "calendar",
+) -> pd.DataFrame:
+    """
+    SMA / EMA / MoM / CAGR / tendencia de varias métricas y grupos en una sola pasada:
+    las fechas se convierten a periodos una vez, cada métrica se agrega con bincount
+    sobre (grupo, periodo) y los kernels corren sobre la matriz periodos × series.
 
-    # R^2
-    y_hat = a + b * t
-    ss_res = float(np.sum((y - y_hat) ** 2))
-    ss_tot = float(np.sum((y - np.mean(y)) ** 2))
-    r2 = 1.0 - ss_res / ss_tot if ss_tot != 0 else np.nan
+    Cada serie cubre de su primer a su último periodo con filas (como resample por
+    grupo). min_count=0 rellena con 0 los periodos vacíos en 'sum' (como _aggregate_ts);
+    min_count=1 los deja NaN y recorta por valores válidos (criterio de _MU en app.py).
+    MoM es la variación entre periodos consecutivos de 'freq'.
 
-    return dict(slope=float(b), r2=float(r2))
+    Formato largo: [*by, metric, date, stat, value]. Por periodo, stat es value,
+    sma_{w}, ema_{s}, mom_abs o mom_pct; por serie (date = NaT), cagr, slope y r2.
+    """
+    val_cols = [val_cols] if isinstance(val_cols, str) else list(val_cols)
+    by_cols = [] if by is None else ([by] if isinstance(by, str) else list(by))
+    val_cols = [c for c in val_cols if c in df.columns]
+    out_cols = [*by_cols, "metric", "date", "stat", "value"]
+    if freq not in _PERIOD_FREQ:
+        freq = "M"
+    dates = _to_datetime(_ensure_series(df, date_col))
+    if not val_cols or dates.empty or any(c not in df.columns for c in by_cols):
+        return pd.DataFrame(columns=out_cols)
+
+    ok = dates.notna().to_numpy().copy()
+    if by_cols:
+        gb = df.groupby(by_cols, sort=True, observed=True, dropna=True)
+        gcode = gb.ngroup().to_numpy(dtype="float64", na_value=np.nan)
+        ok &= ~np.isnan(gcode)
+        keys = gb.size().index
+    else:
+        gcode, keys = np.zeros(len(df)), None
+    if not ok.any():
+        return pd.DataFrame(columns=out_cols)
+
+    ordinals = dates[ok].dt.to_period(_PERIOD_FREQ[freq]).array.asi8
+    p0 = int(ordinals.min())
+    pidx = ordinals - p0
+    P = int(pidx.max()) + 1
+    G = len(keys) if keys is not None else 1
+    M = len(val_cols)
+    cell = gcode[ok].astype("int64") * P + pidx
+    rows = np.bincount(cell, minlength=G * P).reshape(G, P)
+    pos = np.arange(P)
+
+    # matriz periodos × series (serie = grupo * M + métrica) y su rango válido
+    Y = np.full((P, G * M), np.nan)
+    inr = np.zeros((P, G * M), dtype=bool)
+    for mi, c in enumerate(val_cols):
+        v = _to_numeric(df[c]).to_numpy(dtype="float64", na_value=np.nan)[ok]
+        valid = ~np.isnan(v)
+        cnt = np.bincount(cell, weights=valid, minlength=G * P).reshape(G, P)
+        tot = np.bincount(cell, weights=np.where(valid, v, 0.0), minlength=G * P).reshape(G, P)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            if agg == "mean":
+                vals = np.where(cnt > 0, tot / cnt, np.nan)
+            elif agg == "count":
+                vals = cnt
+            else:
+                vals = tot if min_count <= 0 else np.where(cnt >= min_count, tot, np.nan)
+        present = (cnt if min_count > 0 else rows) > 0
+        has = present.any(axis=1)
+        first = np.argmax(present, axis=1)
+        last = P - 1 - np.argmax(present[:, ::-1], axis=1)
+        rng = has[:, None] & (pos[None, :] >= first[:, None]) & (pos[None, :] <= last[:, None])
+        cols = np.arange(G) * M + mi
+        Y[:, cols] = np.where(rng, vals, np.nan).T
+        inr[:, cols] = rng.T
+
+    labels = pd.period_range(start=pd.Period(ordinal=p0, freq=_PERIOD_FREQ[freq]), periods=P)
+    period_dates = labels.to_timestamp(how="end").normalize()
+
+    ws = [int(max(1, w)) for w in windows]
+    sps = [int(max(1, s)) for s in spans]
+    prev = np.vstack([np.full((1, Y.shape[1]), np.nan), Y[:-1]])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        stats: Dict[str, np.ndarray] = {"value": Y}
+        if ws:
+            stats.update({f"sma_{w}": a for w, a in zip(ws, math_kernels.sma(Y, ws))})
+        if sps:
+            stats.update({f"ema_{s}": a for s, a in zip(sps, math_kernels.ema(Y, sps))})
+        stats["mom_abs"] = Y - prev
+        stats["mom_pct"] = (Y / prev - 1.0) * 100.0
+
+    # por serie: tendencia y CAGR
+    fit = math_kernels.ols_trend(Y)
+    n_in = inr.sum(axis=0)
+    first = np.argmax(inr, axis=0)
+    last = P - 1 - np.argmax(inr[::-1], axis=0)
+    cagr_v = np.full(Y.shape[1], np.nan)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if cagr_years == "length":
+            v0, v1 = Y[first, np.arange(Y.shape[1])], Y[last, np.arange(Y.shape[1])]
+            n_years = np.maximum(n_in / 12.0, 0.001)
+        else:
+            fin = ~np.isnan(Y)
+            fv = np.argmax(fin, axis=0)
+            lv = P - 1 - np.argmax(fin[::-1], axis=0)
+            v0, v1 = Y[fv, np.arange(Y.shape[1])], Y[lv, np.arange(Y.shape[1])]
+            d0, d1 = period_dates[fv], period_dates[lv]
+            months = np.maximum(1, (d1.year - d0.year) * 12 + (d1.month - d0.month))
+            n_years = np.asarray(months, dtype="float64") / 12.0
+            v0 = np.where(fin.sum(axis=0) >= 2, v0, np.nan)
+        good = (n_in > 0) & np.isfinite(v0) & np.isfinite(v1) & (v0 > 0) & (v1 > 0)
+        cagr_v[good] = ((v1[good] / v0[good]) ** (1.0 / n_years[good]) - 1.0) * 100.0
+    summary = {"cagr": cagr_v, "slope": fit["slope"], "r2": fit["r2"]}
+
+    # armado largo: series con periodos en rango, luego resumen
+    sc, sp = np.nonzero(inr.T)
+    ser = [np.tile(sc, len(stats)), np.flatnonzero(n_in > 0)]
+    ser[1] = np.tile(ser[1], len(summary))
+    parts = {
+        "series": np.concatenate(ser),
+        "date": np.concatenate([np.tile(period_dates.to_numpy()[sp], len(stats)),
+                                np.full(len(ser[1]), np.datetime64("NaT"), dtype=period_dates.to_numpy().dtype)]),
+        "stat": np.concatenate([np.repeat(list(stats), len(sc)),
+                                np.repeat(list(summary), len(ser[1]) // max(len(summary), 1))]),
+        "value": np.concatenate([a.T[inr.T] for a in stats.values()]
+                                + [a[n_in > 0] for a in summary.values()]),
+    }
+    order = np.argsort(parts["series"], kind="stable")
+    series = parts["series"][order]
+    out = pd.DataFrame({"date": parts["date"][order], "stat": parts["stat"][order], "value": parts["value"][order]})
+    out.insert(0, "metric", np.asarray(val_cols, dtype=object)[series % M])
+    gi = series // M
+    for i, c in enumerate(by_cols):
+        level = keys.get_level_values(i) if isinstance(keys, pd.MultiIndex) else keys
+        out.insert(i, c, np.asarray(level, dtype=object)[gi])
+    return out[out_cols]
@@ -0,0 +1,309 @@
+# mongo_analytics.py
+# Analítica del lado del servidor: los mismos cálculos que _MU (app.py) pero como
+# pipelines de agregación, sin traer la colección a pandas.
+# - describe_numeric / percentiles_iqr: $group ($avg, $stdDevSamp, $sum) y $percentile
+#   (MongoDB 7.0+, método "approximate"); en servidores previos, muestra con $sample
+# - outlier_counts: conteos Z-score y Tukey (IQR*k) en una sola pasada ($group + $cond)
+# - Series de tiempo: $dateTrunc por periodo (D/W/M) y $setWindowFields ($densify +
+#   $avg por rango / $expMovingAvg) para SMA/EMA
+# - Series mensuales de created_at: desde el rollup materializado (<coll>_monthly) si
+#   existe, sin tocar la colección de datos (se recalcula si es más viejo que
+#   MONGO_ROLLUP_REBUILD_S, ver refresh_rollup)
+#
+# Formas de salida iguales a _MU: dicts con las mismas llaves y series/DataFrames con
+# índice de fechas igual al de pandas.resample (fin de mes, domingo, día). Crecimiento,
+# CAGR y tendencia se calculan localmente sobre la serie agregada (un punto por periodo).
+#
+# Si un operador no existe en el servidor (o en mongomock) se recuerda y se usa el
+# camino alternativo: agrupación diaria ($dateToString) + resample local, y ventanas
+# SMA/EMA locales sobre la serie agregada.
+#
+# No depende de Streamlit.
+
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from pymongo.collection import Collection  # type: ignore
+from pymongo.errors import OperationFailure  # type: ignore
+
+from math_utils import resample_rule
+from mongo_backend import load_rollup, refresh_rollup
+from mongo_query import mongo_field
+from rollup import monthly_series
+
+
+# Tamaño de la muestra para cuantiles cuando no hay $percentile
+SAMPLE_SIZE = 100_000
+
+_UNITS = {"D": "day", "W": "week", "M": "month"}
+
+
+def _num(field: str) -> Dict[str, Any]:
+    # como pd.to_numeric(errors="coerce"): lo no convertible queda en null
+    return {"$convert": {"input": f"${field}", "to": "double", "onError": None, "onNull": None}}
+
+
+def _date(field: str) -> Dict[str, Any]:
+    return {"$convert": {"input": f"${field}", "to": "date", "onError": None, "onNull": None}}
+
+
+# excluye null y NaN (NaN ordena por debajo de -inf en Mongo), como dropna()
+_VALID = {"$gte": float("-inf")}
+
+
+class MongoAnalytics:
+    """
+    Analítica de una colección (opcionalmente restringida por 'match', p.ej. el
+    filtro de mongo_query.build_filter). Los nombres de columna son los de la UI.
+    """
+
+    def __init__(self, coll: Collection, match: Optional[Dict[str, Any]] = None, sample_size: int = SAMPLE_SIZE,
+                 rollup: bool = True) -> None:
+        self.coll = coll
+        self.match = dict(match or {})
+        self.sample_size = int(sample_size)
+        self.rollup = rollup
+        self._unsupported: set = set()
+
+    # --------- helpers ---------
+
+    def _head(self) -> List[Dict[str, Any]]:
+        return [{"$match": self.match}] if self.match else []
+
+    def _values(self, col: str) -> List[Dict[str, Any]]:
+        return self._head() + [
+            {"$project": {"_id": 0, "v": _num(mongo_field(col))}},
+            {"$match": {"v": _VALID}},
+        ]
+
+    def _try(self, feature: str, pipeline: List[Dict[str, Any]]) -> Optional[List[Dict[str, Any]]]:
+        """Ejecuta el pipeline; None (y se recuerda) si el servidor no soporta 'feature'."""
+        if feature in self._unsupported:
+            return None
+        try:
+            return list(self.coll.aggregate(pipeline, allowDiskUse=True))
+        except (OperationFailure, NotImplementedError):
+            self._unsupported.add(feature)
+            return None
+
+    def _quantiles(self, col: str, qs: List[float]) -> List[float]:
+        res = self._try("percentile", self._values(col) + [
+            {"$group": {"_id": None, "q": {"$percentile": {"input": "$v", "p": qs, "method": "approximate"}}}},
+        ])
+        if res is not None:
+            return [float(x) for x in res[0]["q"]] if res else [np.nan] * len(qs)
+        # sin $percentile: muestra aleatoria (exacto si la colección cabe en la muestra)
+        pipe = self._head() + [
+            {"$sample": {"size": self.sample_size}},
+            {"$project": {"_id": 0, "v": _num(mongo_field(col))}},
+            {"$match": {"v": _VALID}},
+        ]
+        vals = np.array([d["v"] for d in self.coll.aggregate(pipe, allowDiskUse=True)], dtype="float64")
+        if vals.size == 0:
+            return [np.nan] * len(qs)
+        return [float(x) for x in np.percentile(vals, [q * 100.0 for q in qs])]
+
+    # --------- estadísticos ---------
+
+    def describe_numeric(self, col: str) -> Dict[str, float]:
+        res = list(self.coll.aggregate(self._values(col) + [
+            {"$group": {"_id": None, "n": {"$sum": 1}, "mean": {"$avg": "$v"},
+                        "std": {"$stdDevSamp": "$v"}, "sum": {"$sum": "$v"}}},
+        ], allowDiskUse=True))
+        if not res or not res[0]["n"]:
+            return {"mean": np.nan, "median": np.nan, "std": np.nan, "sum": np.nan}
+        g = res[0]
+        return {
+            "mean": float(g["mean"]),
+            "median": self._quantiles(col, [0.5])[0],
+            "std": float(g["std"]) if g["n"] > 1 and g["std"] is not None else 0.0,
+            "sum": float(g["sum"]),
+        }
+
+    def percentiles_iqr(self, col: str) -> Dict[str, float]:
+        p25, p50, p75 = self._quantiles(col, [0.25, 0.5, 0.75])
+        if not np.isfinite(p25):
+            return {"p25": np.nan, "p50": np.nan, "p75": np.nan, "iqr": np.nan}
+        return {"p25": p25, "p50": p50, "p75": p75, "iqr": p75 - p25}
+
+    def outlier_counts(self, col: str, z: float = 3.0, k: float = 1.5) -> Dict[str, int]:
+        """
+        Lo que la UI usa de flag_outliers_z / flag_outliers_iqr: cuántas filas marcan
+        ('z', 'iqr') y el total de documentos ('total'), sin materializar la máscara.
+        """
+        total = int(self.coll.count_documents(self.match))
+        stats = self.describe_numeric(col)
+        q1, _, q3 = self._quantiles(col, [0.25, 0.5, 0.75])
+
+        def _outside(lo: float, hi: float) -> Dict[str, Any]:
+            return {"$sum": {"$cond": [{"$or": [{"$lt": ["$v", lo]}, {"$gt": ["$v", hi]}]}, 1, 0]}}
+
+        group: Dict[str, Any] = {"_id": None}
+        m, sd = stats["mean"], stats["std"]
+        if np.isfinite(m) and np.isfinite(sd) and sd != 0:
+            group["z"] = _outside(m - z * sd, m + z * sd)
+        if np.isfinite(q1) and np.isfinite(q3):
+            iqr = q3 - q1
+            group["iqr"] = _outside(q1 - k * iqr, q3 + k * iqr)
+        out = {"z": 0, "iqr": 0, "total": total}
+        if len(group) > 1:
+            res = list(self.coll.aggregate(self._values(col) + [{"$group": group}], allowDiskUse=True))
+            if res:
+                out["z"] = int(res[0].get("z", 0))
+                out["iqr"] = int(res[0].get("iqr", 0))
+        return out
+
+    # --------- series de tiempo ---------
+
+    def _points(self, date_col: str, val_col: str) -> List[Dict[str, Any]]:
+        return self._head() + [
+            {"$project": {"_id": 0, "d": _date(mongo_field(date_col)), "v": _num(mongo_field(val_col))}},
+            {"$match": {"d": {"$ne": None}, "v": _VALID}},
+        ]
+
+    def _buckets(self, date_col: str, val_col: str, freq: str) -> pd.DataFrame:
+        """(inicio de periodo -> sum, n) agrupado en el servidor; diario si no hay $dateTrunc."""
+        trunc: Dict[str, Any] = {"date": "$d", "unit": _UNITS[freq]}
+        if freq == "W":
+            trunc["startOfWeek"] = "monday"  # semanas lun..dom, como resample("W") (W-SUN)
+        res = self._try("dateTrunc", self._points(date_col, val_col) + [
+            {"$group": {"_id": {"$dateTrunc": trunc}, "sum": {"$sum": "$v"}, "n": {"$sum": 1}}},
+        ])
+        if res is None:
+            res = list(self.coll.aggregate(self._points(date_col, val_col) + [
+                {"$group": {"_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$d"}},
+                            "sum": {"$sum": "$v"}, "n": {"$sum": 1}}},
+            ], allowDiskUse=True))
+        if not res:
+            return pd.DataFrame(columns=["sum", "n"])
+        out = pd.DataFrame({"sum": [r["sum"] for r in res], "n": [r["n"] for r in res]},
+                           index=pd.to_datetime([r["_id"] for r in res]))
+        return out.sort_index()
+
+    def _rollup_series(self, date_col: str, val_col: str, freq: str, agg: str) -> Optional[pd.Series]:
+        """Serie mensual desde <coll>_monthly (sin filtro, created_at, sum/mean); None si no aplica."""
+        if not self.rollup or self.match or freq != "M" or agg not in ("sum", "mean"):
+            return None
+        if mongo_field(date_col) != "created_at" or not refresh_rollup(self.coll):
+            return None
+        roll = load_rollup(self.coll)
+        if val_col not in set(roll["metric"]):
+            return None
+        return monthly_series(roll, val_col, agg)
+
+    def _prep_ts(self, date_col: str, val_col: str, freq: str, agg: str) -> pd.Series:
+        if freq not in _UNITS:
+            freq = "M"
+        s = self._rollup_series(date_col, val_col, freq, agg)
+        if s is not None:
+            return s
+        b = self._buckets(date_col, val_col, freq)
+        if b.empty:
+            return pd.Series(dtype=float)
+        r = b.rename_axis("date").resample(resample_rule(freq)).sum(min_count=1)
+        s = r["sum"] if agg == "sum" else r["sum"] / r["n"].where(r["n"] > 0)
+        return s.rename("val").astype(float)
+
+    def _windows(self, date_col: str, val_col: str, freq: str, agg: str,
+                 window: Optional[int] = None, span: Optional[int] = None) -> Optional[pd.DataFrame]:
+        """SMA/EMA con $setWindowFields sobre los periodos densificados; None si no hay soporte."""
+        unit = _UNITS[freq]
+        trunc: Dict[str, Any] = {"date": "$d", "unit": unit}
+        if freq == "W":
+            trunc["startOfWeek"] = "monday"
+        value: Any = "$sum" if agg == "sum" else {"$divide": ["$sum", "$n"]}
+        output: Dict[str, Any] = {}
+        if window:
+            output["sma"] = {"$avg": "$value", "window": {"range": [-(int(window) - 1), 0], "unit": unit}}
+        if span:
+            output["ema"] = {"$expMovingAvg": {"input": "$value", "N": int(span)}}
+        res = self._try("setWindowFields", self._points(date_col, val_col) + [
+            {"$group": {"_id": {"$dateTrunc": trunc}, "sum": {"$sum": "$v"}, "n": {"$sum": 1}}},
+            {"$project": {"_id": 0, "t": "$_id", "value": value}},
+            {"$densify": {"field": "t", "range": {"step": 1, "unit": unit, "bounds": "full"}}},
+            {"$setWindowFields": {"sortBy": {"t": 1}, "output": output}},
+        ])
+        if res is None:
+            return None
+        if not res:
+            return pd.DataFrame()
+        starts = pd.to_datetime([r["t"] for r in res])
+        pfreq = {"D": "D", "W": "W", "M": "M"}[freq]
+        labels = starts.to_period(pfreq).to_timestamp(how="end").normalize()
+        out = pd.DataFrame({k: [r.get(k) for r in res] for k in ["value", *output]}, index=labels)
+        out.index.name = "date"
+        out = out.astype(float).sort_index()
+        if "ema" in out:
+            # periodos sin datos: pandas (min_periods=1) repite la última EMA
+            out["ema"] = out["ema"].where(out["value"].notna()).ffill()
+        return out
+
+    def rolling_sma(self, date_col: str, val_col: str, window: int = 6, freq: str = "M", agg: str = "sum") -> pd.DataFrame:
+        if freq not in _UNITS:
+            freq = "M"
+        s = self._rollup_series(date_col, val_col, freq, agg)
+        w = self._windows(date_col, val_col, freq, agg, window=window) if s is None else None
+        if w is not None:
+            if w.empty:
+                return pd.DataFrame()
+            return pd.DataFrame({val_col: w["value"], f"sma_{window}": w["sma"]})
+        s = s if s is not None else self._prep_ts(date_col, val_col, freq, agg)
+        if s.empty:
+            return pd.DataFrame()
+        out = pd.DataFrame({val_col: s})
+        out[f"sma_{window}"] = s.rolling(window=window, min_periods=1).mean()
+        return out
+
+    def rolling_ema(self, date_col: str, val_col: str, span: int = 6, freq: str = "M", agg: str = "sum") -> pd.DataFrame:
+        if freq not in _UNITS:
+            freq = "M"
+        s = self._rollup_series(date_col, val_col, freq, agg)
+        w = self._windows(date_col, val_col, freq, agg, span=span) if s is None else None
+        if w is not None:
+            if w.empty:
+                return pd.DataFrame()
+            return pd.DataFrame({val_col: w["value"], f"ema_{span}": w["ema"]})
+        s = s if s is not None else self._prep_ts(date_col, val_col, freq, agg)
+        if s.empty:
+            return pd.DataFrame()
+        out = pd.DataFrame({val_col: s})
+        out[f"ema_{span}"] = s.ewm(span=span, adjust=False, min_periods=1).mean()
+        return out
+
+    def monthly_growth(self, date_col: str, val_col: str, agg: str = "sum") -> pd.DataFrame:
+        s = self._prep_ts(date_col, val_col, "M", agg)
+        if s.empty:
+            return pd.DataFrame(columns=["value", "mom_pct"])
+        out = pd.DataFrame({"value": s})
+        out["mom_pct"] = out["value"].pct_change() * 100.0
+        return out
+
+    def cagr(self, date_col: str, val_col: str, agg: str = "sum") -> Optional[float]:
+        s = self._prep_ts(date_col, val_col, "M", agg)
+        if s.empty:
+            return None
+        start, end = s.iloc[0], s.iloc[-1]
+        if not (np.isfinite(start) and np.isfinite(end)) or start <= 0 or end <= 0:
+            return None
+        n_years = max((len(s) / 12.0), 0.001)
+        return float(((end / start) ** (1.0 / n_years) - 1.0) * 100.0)
+
+    def linear_trend(self, date_col: str, val_col: str, freq: str = "M", agg: str = "sum") -> Dict[str, float]:
+        s = self._prep_ts(date_col, val_col, freq, agg).dropna()
+        if len(s) < 2:
+            return {"slope": np.nan, "r2": np.nan}
+        x = np.arange(len(s), dtype=float)
+        y = s.values.astype(float)
+        slope, intercept = np.polyfit(x, y, 1)
+        yhat = slope * x + intercept
+        ss_res = float(((y - yhat) ** 2).sum())
+        ss_tot = float(((y - y.mean()) ** 2).sum())
+        r2 = 1.0 - (ss_res / ss_tot) if ss_tot != 0 else np.nan
+        return {"slope": float(slope), "r2": float(r2)}
+
+
+__all__ = ["MongoAnalytics", "SAMPLE_SIZE"]
@@ -1,8 +1,15 @@
 # mongo_backend.py
 # Capa de utilidades para trabajar con MongoDB (PyMongo) de forma segura y consistente
 # - Normaliza documentos antes de escribir (tipos y claves)
+# - Normalización columnar (normalize_frame) para cargas masivas: DataFrame / Arrow
+# - Huella de contenido por fila (content_hash) para sincronizar solo lo que cambió
+# - Lectura columnar directa (load_frame): lotes BSON crudos -> Arrow -> pandas, sin Spark
+# - Lectura particionada por rangos de id_num en paralelo (load_frame_partitioned)
+# - Registro de clientes compartido por proceso (get_client / ClientRegistry): un pool por URI+opciones
 # - Upserts individuales y masivos por PK
 # - Borrado por PK
+# - Rollup mensual materializado (<coll>_monthly): count/sum/sumsq por (created_ym, métrica),
+#   actualizado con el delta de cada upsert/delete
 # - Índices recomendados
 #
 # Uso rápido:
@@ -11,14 +18,25 @@
 #   m.ensure_indexes()
 #   m.upsert({"id": 1, "name": "Ana", "email": "ANA@EXAMPLE.COM"})
 #   m.upsert_many([{"id": 2, "name": "Luis"}, {"id": 3, "name": "Marta"}])
+#   m.upsert_many(df)  # DataFrame / tabla Arrow: se normaliza por columnas
 #   m.delete_many([2, 3])
 
 from __future__ import annotations
 
 import os
-from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+import re
+import threading
+import time as _time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 from datetime import datetime, date, time
 
+import numpy as np
+import pandas as pd
+
+from rollup import COLUMNS as ROLLUP_COLUMNS, ROLLUP_METRICS, rollup_delta, rollup_frame
+
 try:
     # dateutil es flexible para parsear muchas fechas distintas
     from dateutil.parser import parse as dt_parse  # type: ignore
@@ -26,9 +44,10 @@ except Exception:  # pragma: no cover
     dt_parse = None  # type: ignore
 
 try:
-    from pymongo import MongoClient, UpdateOne, ASCENDING, HASHED  # type: ignore
+    from pymongo import MongoClient, UpdateOne, ASCENDING, HASHED, monitoring  # type: ignore
     from pymongo.collection import Collection  # type: ignore
-    from pymongo.errors import PyMongoError  # type: ignore
+    from pymongo.errors import OperationFailure, PyMongoError  # type: ignore
+    from bson import CodecOptions, decode_all  # type: ignore
 except Exception as e:  # pragma: no cover
     raise RuntimeError(
         "PyMongo no está instalado. Instala con: pip install pymongo python-dateutil"
@@ -185,14 +204,910 @@ def normalize_document(doc: Dict[str, Any], pk: str = "id") -> Dict[str, Any]:
     return d
 
 
+# ===================== Normalización columnar =====================
+
+# Campos que normalize_document siempre escribe (aunque el doc no los traiga)
+_ALWAYS_SET = ("id_num", "dob", "created_at", "created_ym")
+
+# Filas por bloque al normalizar iterables de dicts / tablas grandes
+NORMALIZE_CHUNK_ROWS = 50_000
+
+# Campo con la huella de contenido de cada documento (ver row_fingerprints)
+CONTENT_HASH_FIELD = "content_hash"
+# Hora del servidor de la última escritura ($currentDate): marca de agua del polling
+UPDATED_AT_FIELD = "updated_at"
+_HASH_SKIP = {"_id", "mongo_id", CONTENT_HASH_FIELD, UPDATED_AT_FIELD}
+_FNV_PRIME = np.uint64(0x100000001B3)
+_NUMERIC_INFERRED = ("integer", "floating", "mixed-integer-float")
+
+RowsLike = Union[pd.DataFrame, Iterable[Dict[str, Any]], Any]
+
+
+def _text_col(s: pd.Series) -> pd.Series:
+    """Texto (nulos -> "") sin strip."""
+    return s.astype(object).where(s.notna(), "").astype(str)
+
+
+def _datetime_col(s: pd.Series) -> pd.Series:
+    """
+    Columna a datetime64 naive (misma hora de pared, sin tz). Strings ISO / comunes se
+    parsean vectorizado; lo que no encaja (timestamps numéricos, tipos mezclados,
+    offsets distintos) cae al _to_datetime por valor.
+    """
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return s.dt.tz_localize(None) if getattr(s.dt, "tz", None) is not None else s
+    if pd.api.types.infer_dtype(s, skipna=True) in ("string", "empty"):
+        txt = s.astype(object).where(s.notna(), "").astype(str).str.strip()
+        try:
+            out = pd.to_datetime(txt.where(txt != "", None), errors="coerce", format="mixed")
+        except (ValueError, TypeError):
+            out = None
+        if out is not None and pd.api.types.is_datetime64_any_dtype(out):
+            return out.dt.tz_localize(None) if getattr(out.dt, "tz", None) is not None else out
+    return pd.to_datetime(pd.Series([_to_datetime(v) for v in s], index=s.index, dtype=object))
+
+
+def _year_month(dt: pd.Series) -> pd.Series:
+    """'YYYY-MM' (object, None si NaT): se formatea una vez por mes distinto."""
+    valid = dt.notna().to_numpy()
+    out = np.full(len(dt), None, dtype=object)
+    if valid.any():
+        ym = (dt.dt.year * 100 + dt.dt.month).to_numpy()[valid].astype("int64")
+        uniq, inv = np.unique(ym, return_inverse=True)
+        labels = np.array([f"{u // 100:04d}-{u % 100:02d}" for u in uniq], dtype=object)
+        out[valid] = labels[inv]
+    return pd.Series(out, index=dt.index, dtype=object)
+
+
+def _stripped_str(s: pd.Series) -> pd.Series:
+    """Valores str con strip; lo que no es str (o queda vacío) -> ""."""
+    if pd.api.types.infer_dtype(s, skipna=True) in ("string", "empty"):
+        return _text_col(s).str.strip()
+    is_str = s.map(lambda v: isinstance(v, str)).astype(bool)
+    return _text_col(s.where(is_str)).str.strip()
+
+
+def normalize_frame(df: pd.DataFrame, pk: str = "id") -> pd.DataFrame:
+    """
+    Versión columnar de normalize_document: mismas reglas, aplicadas con operaciones
+    vectorizadas de pandas sobre todo el DataFrame (o tabla/batch Arrow).
+    Devuelve un DataFrame nuevo con columnas tipadas (datetime64, float, Int64).
+    Los nulos de la PK quedan como "" (esas filas se saltan al emitir operaciones).
+    """
+    if hasattr(df, "to_pandas") and not isinstance(df, pd.DataFrame):
+        df = df.to_pandas()
+    out = df.copy()
+    n = len(out)
+
+    # --- PK como string + auxiliar numérico
+    key = out[pk] if pk in out.columns else pd.Series([None] * n, index=out.index, dtype=object)
+    out[pk] = _text_col(key).str.strip()
+    num = pd.to_numeric(key, errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+    ok = np.isfinite(num)
+    id_num = pd.array(np.where(ok, np.trunc(num), 0).astype("int64"), dtype="Int64")
+    id_num[~ok] = pd.NA
+    out["id_num"] = id_num
+
+    # --- Campos comunes
+    if "email" in out.columns:
+        out["email"] = _text_col(out["email"]).str.strip().str.lower()
+    if "phone" in out.columns:
+        out["phone"] = _text_col(out["phone"]).str.strip()
+
+    for c in ("dob", "created_at"):
+        out[c] = _datetime_col(out[c]) if c in out.columns else pd.Series(pd.NaT, index=out.index, dtype="datetime64[ns]")
+
+    # created_ym: el existente si es str no vacío; si no, derivado de created_at
+    derived = _year_month(out["created_at"])
+    if "created_ym" in out.columns:
+        ym = out["created_ym"]
+        if pd.api.types.infer_dtype(ym, skipna=True) in ("string", "empty"):
+            keep = ym.notna() & (_text_col(ym) != "")
+        else:
+            keep = ym.map(lambda v: isinstance(v, str) and bool(v)).astype(bool)
+        out["created_ym"] = ym.astype(object).where(keep, derived)
+    else:
+        out["created_ym"] = derived
+
+    if "balance" in out.columns:
+        out["balance"] = pd.to_numeric(out["balance"], errors="coerce").astype("float64")
+
+    # name: el propio (strip) o first_name + last_name; si no sale nada se deja igual
+    name = _stripped_str(out["name"]) if "name" in out.columns else pd.Series("", index=out.index, dtype=object)
+    fn = _stripped_str(out["first_name"]) if "first_name" in out.columns else ""
+    ln = _stripped_str(out["last_name"]) if "last_name" in out.columns else ""
+    if "first_name" in out.columns or "last_name" in out.columns:
+        joined = (fn + " " + ln).str.strip()
+        name = name.where(name != "", joined)
+    has = name != ""
+    if has.any():
+        base = out["name"].astype(object) if "name" in out.columns else pd.Series(None, index=out.index, dtype=object)
+        out["name"] = name.where(has, base)
+    return out
+
+
+def update_spec(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """$set del documento + updated_at con la hora del servidor."""
+    d = {k: v for k, v in doc.items() if k != UPDATED_AT_FIELD}
+    return {"$set": d, "$currentDate": {UPDATED_AT_FIELD: True}}
+
+
+def row_fingerprints(nf: pd.DataFrame) -> pd.Series:
+    """
+    Huella (hex de 64 bits) del contenido normalizado de cada fila: hash vectorizado
+    por columna (pandas) combinado en orden de nombre de columna, con el nombre como
+    sal. Numéricos se comparan como float64 (también las columnas object con solo
+    números, como las que arma _frame_chunks desde dicts) y category como sus valores,
+    así la misma fila da la misma huella venga de CSV, Parquet o Mongo. Las celdas
+    nulas no aportan (columna ausente == columna nula).
+    """
+    acc = np.zeros(len(nf), dtype=np.uint64)
+    for c in sorted((c for c in nf.columns if str(c) not in _HASH_SKIP), key=str):
+        s = nf[c]
+        if isinstance(s.dtype, pd.CategoricalDtype):
+            s = s.astype(object)
+        if s.dtype == object and pd.api.types.infer_dtype(s, skipna=True) in _NUMERIC_INFERRED:
+            s = pd.to_numeric(s)
+        if pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_bool_dtype(s):
+            s = pd.Series(s.to_numpy(dtype="float64", na_value=np.nan), index=s.index)
+        salt = pd.util.hash_array(np.array([str(c)], dtype=object))[0]
+        h = pd.util.hash_pandas_object(s, index=False).to_numpy(dtype=np.uint64)
+        with np.errstate(over="ignore"):
+            acc = np.where(s.isna().to_numpy(), acc, (acc * _FNV_PRIME) ^ (h + salt))
+    return pd.Series([f"{x:016x}" for x in acc.tolist()], index=nf.index, dtype=object)
+
+
+def _py_values(s: pd.Series, keep_nan: Optional[np.ndarray] = None) -> List[Any]:
+    """
+    Valores Python nativos con None en lugar de NaN/NaT/NA (encodable por BSON);
+    las celdas marcadas en 'keep_nan' quedan como float NaN.
+    """
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        s = s.astype(object)
+    missing = s.isna().to_numpy()
+    if pd.api.types.is_datetime64_any_dtype(s):
+        vals = np.array(s.dt.to_pydatetime(), dtype=object)
+    elif pd.api.types.is_bool_dtype(s) or pd.api.types.is_numeric_dtype(s):
+        vals = np.array(s.astype(object).tolist(), dtype=object)
+    else:
+        vals = s.to_numpy(dtype=object, copy=True)
+    vals[missing] = None
+    if keep_nan is not None:
+        vals[keep_nan & missing] = float("nan")
+    return vals.tolist()
+
+
+# Columnas que normalize_document reescribe: un NaN de entrada no sobrevive en ellas
+_NAN_REWRITTEN = ("id_num", "email", "phone", "dob", "created_at", "created_ym")
+
+
+def _raw_nan(frame: pd.DataFrame, pk: str = "id") -> Dict[str, np.ndarray]:
+    """
+    Celdas float NaN (no None) de las columnas object de un bloque de dicts. En la
+    ruta por documento esos valores se conservan (p.ej. balance=NaN), así que
+    frame_documents los emite como NaN y no como None.
+    """
+    skip = set(_NAN_REWRITTEN) | {pk}
+    out: Dict[str, np.ndarray] = {}
+    for c in frame.columns:
+        s = frame[c]
+        if s.dtype != object or str(c) in skip:
+            continue
+        m = np.fromiter((isinstance(v, float) and v != v for v in s.to_numpy()), dtype=bool, count=len(s))
+        if m.any():
+            out[str(c)] = m
+    return out
+
+
+def frame_documents(
+    nf: pd.DataFrame,
+    pk: str = "id",
+    present: Optional[List[Iterable[str]]] = None,
+    optional: Iterable[str] = (),
+    nan: Optional[Dict[str, np.ndarray]] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Documentos listos para $set a partir de un frame de normalize_frame. Salta filas
+    sin PK. 'present' (por fila) limita cada doc a las claves que traía el dict
+    original (+ las que normalize_document siempre escribe); las columnas 'optional'
+    se omiten cuando quedan nulas (p.ej. 'name' que no se pudo derivar). 'nan' (por
+    columna, ver _raw_nan) marca las celdas nulas que se emiten como NaN.
+    """
+    names = [str(c) for c in nf.columns]
+    nan = nan or {}
+    docs = (dict(zip(names, row)) for row in zip(*(_py_values(nf[c], nan.get(str(c))) for c in nf.columns)))
+    always = set(_ALWAYS_SET) | {pk}
+    opt = set(optional)
+    for i, d in enumerate(docs):
+        if not d.get(pk):
+            continue
+        if present is not None:
+            keep = set(present[i]) | always
+            d = {k: v for k, v in d.items() if k in keep or (k == "name" and v is not None)}
+        elif opt:
+            d = {k: v for k, v in d.items() if k not in opt or v is not None}
+        yield d
+
+
+def _frame_chunks(rows: RowsLike, chunk_rows: int) -> Iterator[Tuple[pd.DataFrame, Optional[List[Iterable[str]]]]]:
+    """(frame, claves por fila o None) por bloque: DataFrame, tabla/batch Arrow o dicts."""
+    if isinstance(rows, pd.DataFrame) or hasattr(rows, "to_pandas"):
+        frame = rows if isinstance(rows, pd.DataFrame) else rows.to_pandas()
+        for start in range(0, len(frame), chunk_rows):
+            yield frame.iloc[start:start + chunk_rows], None
+        return
+    it = iter(rows)
+    while True:
+        chunk = [d for d in islice(it, chunk_rows) if d is not None]
+        if not chunk:
+            return
+        keys = [d.keys() for d in chunk]
+        first = set(keys[0])
+        uniform = all(set(k) == first for k in keys)
+        # dtype=object: sin inferencia por columna (int + None no pasa a float, así
+        # la PK 1 sigue siendo "1" y no "1.0", igual que en normalize_document)
+        yield pd.DataFrame(chunk, dtype=object), (None if uniform else keys)
+
+
+def iter_upsert_docs(
+    rows: RowsLike,
+    pk: str = "id",
+    exclude: Iterable[str] = (),
+    chunk_rows: int = NORMALIZE_CHUNK_ROWS,
+    with_hash: bool = True,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Documentos normalizados (por bloques con normalize_frame), sin los que no tienen PK.
+    'exclude' quita campos del $set (p.ej. 'mongo_id', que es solo el _id leído).
+    Con 'with_hash' cada doc lleva su CONTENT_HASH_FIELD (no en dicts heterogéneos:
+    un doc parcial no tiene la huella de la fila completa).
+    """
+    drop = list(exclude)
+    for frame, present in _frame_chunks(rows, chunk_rows):
+        if frame.empty:
+            continue
+        optional = [] if "name" in frame.columns else ["name"]
+        nf = normalize_frame(frame.drop(columns=[c for c in drop if c in frame.columns]), pk=pk)
+        if with_hash and present is None:
+            nf[CONTENT_HASH_FIELD] = row_fingerprints(nf)
+        nan = _raw_nan(frame, pk=pk)
+        yield from frame_documents(nf, pk=pk, present=present, optional=optional, nan=nan)
+
+
+def frame_fingerprints(
+    rows: RowsLike,
+    pk: str = "id",
+    exclude: Iterable[str] = (),
+    chunk_rows: int = NORMALIZE_CHUNK_ROWS,
+) -> pd.DataFrame:
+    """
+    (key, hash) por fila, con la misma normalización que iter_upsert_docs: la huella
+    local coincide con la que se guarda en Mongo al escribir la fila.
+    """
+    drop = list(exclude)
+    keys: List[np.ndarray] = []
+    hashes: List[np.ndarray] = []
+    for frame, _ in _frame_chunks(rows, chunk_rows):
+        if frame.empty:
+            continue
+        nf = normalize_frame(frame.drop(columns=[c for c in drop if c in frame.columns]), pk=pk)
+        keys.append(nf[pk].to_numpy(dtype=object))
+        hashes.append(row_fingerprints(nf).to_numpy(dtype=object))
+    if not keys:
+        return pd.DataFrame({"key": pd.Series(dtype=object), "hash": pd.Series(dtype=object)})
+    return pd.DataFrame({"key": np.concatenate(keys), "hash": np.concatenate(hashes)})
+
+
+def iter_update_ops(
+    rows: RowsLike,
+    pk: str = "id",
+    match: Optional[Callable[[str, Any], Dict[str, Any]]] = None,
+    exclude: Iterable[str] = (),
+    chunk_rows: int = NORMALIZE_CHUNK_ROWS,
+) -> Iterator[UpdateOne]:
+    """
+    UpdateOne(upsert) por fila de iter_upsert_docs. 'match(pk, key)' arma el filtro
+    (por defecto {pk: key}).
+    """
+    match = match or (lambda k, v: {k: v})
+    for d in iter_upsert_docs(rows, pk=pk, exclude=exclude, chunk_rows=chunk_rows):
+        yield UpdateOne(match(pk, d[pk]), update_spec(d), upsert=True)
+
+
+def _bulk_upsert(
+    coll: Collection,
+    docs: Iterator[Dict[str, Any]],
+    pk: str,
+    batch_size: int,
+    match: Optional[Callable[[str, Any], Dict[str, Any]]] = None,
+    rollup: bool = False,
+) -> Tuple[int, int]:
+    """
+    bulk_write por lotes de docs ya normalizados. Con 'rollup', antes de cada lote se
+    leen los valores previos (solo campos del rollup) para aplicar el delta mensual.
+    """
+    match = match or (lambda k, v: {k: v})
+    n = 0
+    batches = 0
+    while True:
+        batch = list(islice(docs, batch_size))
+        if not batch:
+            return n, batches
+        before = _docs_by_key(coll, pk, [d[pk] for d in batch], match) if rollup else {}
+        coll.bulk_write([UpdateOne(match(pk, d[pk]), update_spec(d), upsert=True) for d in batch], ordered=False)
+        if rollup:
+            _rollup_upserts(coll, pk, before, batch)
+        n += len(batch)
+        batches += 1
+
+
+# ===================== Rollup mensual (<coll>_monthly) =====================
+
+ROLLUP_ENABLED = os.getenv("MONGO_ROLLUP", "true").strip().lower() in ("1", "true", "yes", "y", "on")
+ROLLUP_SUFFIX = os.getenv("MONGO_ROLLUP_SUFFIX", "_monthly")
+# Antigüedad máxima del rollup antes de recalcularlo desde la colección (0 = nunca)
+ROLLUP_REBUILD_S = float(os.getenv("MONGO_ROLLUP_REBUILD_S", "3600"))
+_ROLLUP_META = "__meta__"
+
+
+def rollup_collection(coll: Collection) -> Collection:
+    return coll.database[f"{coll.name}{ROLLUP_SUFFIX}"]
+
+
+def _key_str(v: Any) -> str:
+    """Clave comparable entre PK string (mongo_backend) y numérica (documentos previos)."""
+    s = str(v).strip()
+    try:
+        f = float(s)
+        if f.is_integer():
+            return str(int(f))
+    except (TypeError, ValueError):
+        pass
+    return s
+
+
+def _keys_filter(pk: str, keys: Iterable[Any], match: Optional[Callable[[str, Any], Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """Un solo $in con las variantes que 'match' genera por clave (se asume filtro sobre pk)."""
+    match = match or (lambda k, v: {k: v})
+    vals: List[Any] = []
+    for k in keys:
+        v = match(pk, k).get(pk)
+        vals.extend(v["$in"] if isinstance(v, dict) and "$in" in v else [v])
+    return {pk: {"$in": vals}}
+
+
+def _docs_by_key(
+    coll: Collection, pk: str, keys: List[Any],
+    match: Optional[Callable[[str, Any], Dict[str, Any]]] = None,
+    metrics: Iterable[str] = ROLLUP_METRICS,
+) -> Dict[str, Dict[str, Any]]:
+    proj = {"_id": 0, pk: 1, "created_at": 1, "created_ym": 1, **{m: 1 for m in metrics}}
+    return {_key_str(d.get(pk)): d for d in coll.find(_keys_filter(pk, keys, match), proj)}
+
+
+def apply_rollup_delta(coll: Collection, delta: pd.DataFrame) -> int:
+    """$inc por celda (created_ym|metric); las celdas que quedan vacías se borran."""
+    if delta is None or delta.empty:
+        return 0
+    ops = [
+        UpdateOne(
+            {"_id": f"{ym}|{m}"},
+            {"$inc": {"count": int(c), "sum": float(s), "sumsq": float(q)},
+             "$setOnInsert": {"created_ym": ym, "metric": m}},
+            upsert=True,
+        )
+        for ym, m, c, s, q in zip(delta["created_ym"], delta["metric"], delta["count"], delta["sum"], delta["sumsq"])
+    ]
+    rc = rollup_collection(coll)
+    rc.bulk_write(ops, ordered=False)
+    rc.delete_many({"count": {"$lte": 0}})
+    return len(ops)
+
+
+def _rollup_upserts(coll: Collection, pk: str, before: Dict[str, Dict[str, Any]], docs: List[Dict[str, Any]]) -> None:
+    # 'before' se leyó antes del bulk_write: leer y luego $inc no es atómico, así que
+    # dos escritores sobre la misma fila pueden restar el mismo valor previo dos veces.
+    # Esa deriva no se corrige aquí; refresh_rollup recalcula el rollup completo cuando
+    # pasa ROLLUP_REBUILD_S y diff_sync lo recalcula tras cada sincronización.
+    # estado final por clave: lo previo + los $set del lote, en orden
+    after: Dict[str, Dict[str, Any]] = {}
+    for d in docs:
+        k = _key_str(d[pk])
+        after[k] = {**after.get(k, before.get(k, {})), **d}
+    apply_rollup_delta(coll, rollup_delta(list(before.values()), list(after.values())))
+
+
+def rollup_ready(coll: Collection) -> bool:
+    return rollup_collection(coll).find_one({"_id": _ROLLUP_META}) is not None
+
+
+def refresh_rollup(coll: Collection, max_age_s: float = ROLLUP_REBUILD_S) -> bool:
+    """
+    True si el rollup existe; si su última reconstrucción tiene más de 'max_age_s'
+    segundos lo recalcula antes (reconcilia la deriva de los deltas concurrentes).
+    """
+    meta = rollup_collection(coll).find_one({"_id": _ROLLUP_META})
+    if meta is None:
+        return False
+    built = meta.get("built_at")
+    if max_age_s > 0 and (not isinstance(built, datetime)
+                          or (datetime.utcnow() - built.replace(tzinfo=None)).total_seconds() > max_age_s):
+        rebuild_rollup(coll, meta.get("metrics") or ROLLUP_METRICS)
+    return True
+
+
+def load_rollup(coll: Collection) -> pd.DataFrame:
+    """Rollup completo (unos cientos de filas) con las columnas de rollup.COLUMNS."""
+    docs = list(rollup_collection(coll).find({"metric": {"$exists": True}}, {"_id": 0, **{c: 1 for c in ROLLUP_COLUMNS}}))
+    out = pd.DataFrame(docs, columns=ROLLUP_COLUMNS)
+    return out.astype({"count": "int64", "sum": "float64", "sumsq": "float64"})
+
+
+def rebuild_rollup(coll: Collection, metrics: Iterable[str] = ROLLUP_METRICS) -> pd.DataFrame:
+    """
+    Recalcula el rollup desde la colección ($group en el servidor; sin $convert, p.ej.
+    mongomock, se agrupa en el cliente) y lo reemplaza. Sirve de reconciliación
+    tras escrituras que no pasan por este módulo.
+    """
+    metrics = tuple(metrics)
+    parts: Optional[List[pd.DataFrame]] = []
+    for m in metrics:
+        pipe = [
+            {"$project": {"_id": 0,
+                          "ym": {"$dateToString": {"format": "%Y-%m", "date": {
+                              "$convert": {"input": "$created_at", "to": "date", "onError": None, "onNull": None}}}},
+                          "v": {"$convert": {"input": f"${m}", "to": "double", "onError": None, "onNull": None}}}},
+            {"$match": {"ym": {"$type": "string"}, "v": {"$gte": float("-inf")}}},
+            {"$group": {"_id": "$ym", "count": {"$sum": 1}, "sum": {"$sum": "$v"},
+                        "sumsq": {"$sum": {"$multiply": ["$v", "$v"]}}}},
+        ]
+        try:
+            res = list(coll.aggregate(pipe, allowDiskUse=True))
+        except (OperationFailure, NotImplementedError):
+            parts = None
+            break
+        parts.append(pd.DataFrame({
+            "created_ym": [r["_id"] for r in res], "metric": m,
+            "count": [int(r["count"]) for r in res], "sum": [float(r["sum"]) for r in res],
+            "sumsq": [float(r["sumsq"]) for r in res],
+        }, columns=ROLLUP_COLUMNS))
+    if parts is None:
+        proj = {"_id": 0, "created_at": 1, **{m: 1 for m in metrics}}
+        roll = rollup_frame(load_frame(coll, projection=proj), metrics)
+    else:
+        roll = pd.concat(parts, ignore_index=True) if parts else rollup_frame([], metrics)
+
+    rc = rollup_collection(coll)
+    rc.delete_many({})
+    docs = [
+        {"_id": f"{ym}|{m}", "created_ym": ym, "metric": m, "count": int(c), "sum": float(s), "sumsq": float(q)}
+        for ym, m, c, s, q in zip(roll["created_ym"], roll["metric"], roll["count"], roll["sum"], roll["sumsq"])
+    ]
+    if docs:
+        rc.insert_many(docs, ordered=False)
+    rc.replace_one({"_id": _ROLLUP_META}, {"_id": _ROLLUP_META, "metrics": list(metrics),
+                                          "built_at": datetime.utcnow()}, upsert=True)
+    return roll
+
+
+def ensure_rollup(coll: Collection, metrics: Iterable[str] = ROLLUP_METRICS) -> bool:
+    """Construye el rollup si nunca se hizo. True si ya existía."""
+    if rollup_ready(coll):
+        return True
+    rebuild_rollup(coll, metrics)
+    return False
+
+
+# ===================== Lectura columnar (sin Spark) =====================
+
+# Documentos por lote del cursor (un lote = un mensaje BSON crudo del servidor)
+LOAD_BATCH_SIZE = 20_000
+
+# Pool de conexiones por cliente (0 = default de PyMongo) y cada cuánto re-validar con ping
+POOL_MAX_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+POOL_MIN_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+POOL_MAX_IDLE_MS = int(os.getenv("MONGO_MAX_IDLE_MS", "0"))
+HEALTH_CHECK_S = float(os.getenv("MONGO_HEALTH_CHECK_S", "30"))
+
+# Lectura particionada: workers (hilos o procesos) y particiones por worker
+SCAN_WORKERS = int(os.getenv("MONGO_SCAN_WORKERS", str(min(8, os.cpu_count() or 4))))
+SCAN_EXECUTOR = os.getenv("MONGO_SCAN_EXECUTOR", "thread").strip().lower()  # thread|process
+
+_CODEC = CodecOptions(tz_aware=False)
+
+
+def _batch_frame(docs: List[Dict[str, Any]]) -> pd.DataFrame:
+    """
+    Un lote decodificado -> DataFrame columnar vía Arrow (_id como string). Las columnas
+    son la unión de las llaves del lote (en orden de aparición; None donde falta), no
+    solo las del primer documento. Si el lote trae tipos que Arrow no unifica (p.ej.
+    int y str en la misma clave, Decimal128), cae a DataFrame.from_records.
+    """
+    keys: Dict[str, None] = {}
+    for d in docs:
+        if "_id" in d:
+            d["_id"] = str(d["_id"])
+        keys.update(dict.fromkeys(d))
+    try:
+        import pyarrow as pa  # type: ignore
+        return pa.Table.from_pydict({k: [d.get(k) for d in docs] for k in keys}).to_pandas()
+    except Exception:
+        return pd.DataFrame.from_records(docs, columns=list(keys))
+
+
+def _raw_batches(
+    coll: Collection,
+    query: Optional[Dict[str, Any]],
+    projection: Optional[Dict[str, Any]],
+    pipeline: Optional[List[Dict[str, Any]]],
+    batch_size: int,
+    limit: int,
+) -> Iterator[List[Dict[str, Any]]]:
+    """Lotes de documentos decodificados de una vez (decode_all en C) por mensaje del servidor."""
+    try:
+        if pipeline:
+            cur = coll.aggregate_raw_batches(pipeline, batchSize=batch_size, allowDiskUse=True)
+        else:
+            cur = coll.find_raw_batches(query or {}, projection, batch_size=batch_size, limit=max(0, int(limit)))
+    except (NotImplementedError, AttributeError, TypeError):
+        cur = None
+    if cur is not None:
+        for raw in cur:
+            docs = decode_all(raw, _CODEC)
+            if docs:
+                yield docs
+        return
+    # stand-ins sin lotes crudos (mongomock): mismo contrato, documento a documento
+    if pipeline:
+        it = iter(coll.aggregate(pipeline))
+    else:
+        it = iter(coll.find(query or {}, projection).limit(max(0, int(limit))))
+    while True:
+        docs = list(islice(it, batch_size))
+        if not docs:
+            return
+        yield docs
+
+
+def load_frame(
+    coll: Collection,
+    query: Optional[Dict[str, Any]] = None,
+    projection: Optional[Dict[str, Any]] = None,
+    pipeline: Optional[List[Dict[str, Any]]] = None,
+    batch_size: int = LOAD_BATCH_SIZE,
+    limit: int = 0,
+    progress: Optional[Callable[[int], None]] = None,
+) -> pd.DataFrame:
+    """
+    Lee la colección (find con query/projection, o un pipeline de aggregate) a un
+    DataFrame sin Spark ni dicts intermedios por documento en Python: cada lote BSON
+    crudo se decodifica de una vez y se convierte a columnas con Arrow.
+    'progress(docs_leidos)' se llama tras cada lote. '_id' queda como string.
+    """
+    parts: List[pd.DataFrame] = []
+    rows = 0
+    for docs in _raw_batches(coll, query, projection, pipeline, batch_size, limit):
+        parts.append(_batch_frame(docs))
+        rows += len(docs)
+        if progress is not None:
+            progress(rows)
+    if not parts:
+        return pd.DataFrame()
+    return pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0]
+
+
+def id_partitions(
+    coll: Collection,
+    partitions: int,
+    field: str = "id_num",
+    limit: int = 0,
+    balanced: bool = False,
+) -> List[Dict[str, Any]]:
+    """
+    Filtros de rango sobre 'field' que cubren la colección (usa el índice id_num_idx
+    para min/max). 'balanced' usa $bucketAuto (un scan del índice) en lugar de cortes
+    equiespaciados, útil si los ids tienen huecos grandes. Con 'limit' solo se cubren
+    los primeros 'limit' ids y se omite la partición sin id numérico (ver
+    non_numeric_partition: load_frame_partitioned completa el límite con ella).
+    Sin ids numéricos devuelve [].
+    """
+    numeric = {field: {"$type": "number"}}
+    lo = list(coll.find(numeric, {field: 1, "_id": 0}).sort(field, 1).limit(1))
+    if not lo:
+        return []
+    lo_v = lo[0][field]
+    if limit and limit > 0:
+        hi = list(coll.find(numeric, {field: 1, "_id": 0}).sort(field, 1).skip(int(limit) - 1).limit(1))
+    else:
+        hi = []
+    if not hi:
+        hi = list(coll.find(numeric, {field: 1, "_id": 0}).sort(field, -1).limit(1))
+    hi_v = hi[0][field]
+    parts = max(1, int(partitions))
+
+    edges: List[Any] = []
+    if balanced and parts > 1:
+        try:
+            buckets = list(coll.aggregate([
+                {"$match": {field: {"$gte": lo_v, "$lte": hi_v}}},
+                {"$bucketAuto": {"groupBy": f"${field}", "buckets": parts}},
+            ]))
+            edges = [b["_id"]["min"] for b in buckets]
+        except (OperationFailure, NotImplementedError):
+            edges = []  # servidor/mock sin $bucketAuto: cortes equiespaciados
+    if not edges:
+        edges = sorted(set(np.linspace(float(lo_v), float(hi_v), parts + 1)[:-1].tolist()))
+        if float(lo_v) == float(int(lo_v)) and float(hi_v) == float(int(hi_v)):
+            edges = sorted({int(e) for e in edges})
+    edges = edges or [lo_v]
+    out: List[Dict[str, Any]] = []
+    for i, a in enumerate(edges):
+        if i + 1 < len(edges):
+            out.append({field: {"$gte": a, "$lt": edges[i + 1]}})
+        else:
+            out.append({field: {"$gte": a, "$lte": hi_v}})
+    if not (limit and limit > 0):
+        out.append(non_numeric_partition(field))
+    return out
+
+
+def non_numeric_partition(field: str = "id_num") -> Dict[str, Any]:
+    """Filtro de los documentos sin id numérico (null / ausente / otro tipo)."""
+    return {field: {"$not": {"$type": "number"}}}
+
+
+def _partition_frame(
+    coll: Collection,
+    rng: Dict[str, Any],
+    query: Optional[Dict[str, Any]],
+    projection: Optional[Dict[str, Any]],
+    pipeline: Optional[List[Dict[str, Any]]],
+    batch_size: int,
+    limit: int = 0,
+) -> pd.DataFrame:
+    if pipeline:
+        return load_frame(coll, pipeline=[{"$match": rng}] + list(pipeline), batch_size=batch_size, limit=limit)
+    q = {"$and": [query, rng]} if query else rng
+    return load_frame(coll, query=q, projection=projection, batch_size=batch_size, limit=limit)
+
+
+def _partition_frame_proc(
+    uri: str, db_name: str, coll_name: str, rng: Dict[str, Any],
+    query: Optional[Dict[str, Any]], projection: Optional[Dict[str, Any]],
+    pipeline: Optional[List[Dict[str, Any]]], batch_size: int,
+) -> pd.DataFrame:
+    """Versión para ProcessPoolExecutor: cada proceso usa su propio cliente (del registro)."""
+    client = get_client(uri)
+    return _partition_frame(client[db_name][coll_name], rng, query, projection, pipeline, batch_size)
+
+
+def load_frame_partitioned(
+    coll: Collection,
+    query: Optional[Dict[str, Any]] = None,
+    projection: Optional[Dict[str, Any]] = None,
+    pipeline: Optional[List[Dict[str, Any]]] = None,
+    workers: int = SCAN_WORKERS,
+    partitions: Optional[int] = None,
+    field: str = "id_num",
+    limit: int = 0,
+    balanced: bool = False,
+    executor: str = SCAN_EXECUTOR,
+    uri: Optional[str] = None,
+    batch_size: int = LOAD_BATCH_SIZE,
+    progress: Optional[Callable[[int], None]] = None,
+) -> pd.DataFrame:
+    """
+    Como load_frame, pero partiendo la colección en rangos de 'field' (id_num_idx) que
+    se leen en paralelo: hilos sobre el mismo cliente (la red se solapa) o procesos
+    (la decodificación BSON/Arrow también escala con los cores; requiere 'uri').
+    Las partes se concatenan en orden de rango. 'progress(docs)' corre en este hilo.
+    Con 'limit', si los rangos numéricos no lo llenan, el resto sale de los documentos
+    sin id numérico (al final). Sin ids numéricos o con un solo worker cae a load_frame.
+    """
+    workers = max(1, int(workers))
+    ranges = id_partitions(coll, partitions or workers * 2, field=field, limit=limit, balanced=balanced) if workers > 1 else []
+    if not ranges:
+        return load_frame(coll, query=query, projection=projection, pipeline=pipeline,
+                          batch_size=batch_size, limit=limit, progress=progress)
+
+    use_procs = executor == "process" and uri is not None
+    pool_cls = ProcessPoolExecutor if use_procs else ThreadPoolExecutor
+    frames: Dict[int, pd.DataFrame] = {}
+    rows = 0
+    with pool_cls(max_workers=workers) as pool:
+        if use_procs:
+            futs = {
+                pool.submit(_partition_frame_proc, uri, coll.database.name, coll.name, rng,
+                            query, projection, pipeline, batch_size): i
+                for i, rng in enumerate(ranges)
+            }
+        else:
+            futs = {
+                pool.submit(_partition_frame, coll, rng, query, projection, pipeline, batch_size): i
+                for i, rng in enumerate(ranges)
+            }
+        for fut in as_completed(futs):
+            part = fut.result()
+            frames[futs[fut]] = part
+            rows += len(part)
+            if progress is not None:
+                progress(rows)
+    parts = [frames[i] for i in sorted(frames) if not frames[i].empty]
+    if limit and limit > 0 and rows < limit:
+        rest = _partition_frame(coll, non_numeric_partition(field), query, projection, pipeline,
+                                batch_size, limit=int(limit) - rows)
+        if not rest.empty:
+            parts.append(rest)
+            if progress is not None:
+                progress(rows + len(rest))
+    if not parts:
+        return pd.DataFrame()
+    out = pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0]
+    if limit and limit > 0 and len(out) > limit:
+        out = out.iloc[:limit].reset_index(drop=True)
+    return out
+
+
 # ===================== Conexión e índices =====================
 
-def get_client(uri: Optional[str] = None, timeout_ms: int = 4000) -> MongoClient:
-    uri = uri or DEFAULT_URI
-    client = MongoClient(uri, serverSelectionTimeoutMS=timeout_ms)
-    # ping para validar conexión
-    client.admin.command("ping")
-    return client
+class _PoolMetrics(monitoring.ConnectionPoolListener):
+    """Contadores del pool de un cliente (eventos CMAP de PyMongo, agregados por todos sus servidores)."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.open = 0
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.created = 0
+        self.closed = 0
+        self.clears = 0
+
+    def _add(self, **delta: int) -> None:
+        with self._lock:
+            for k, v in delta.items():
+                setattr(self, k, getattr(self, k) + v)
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+
+    def pool_created(self, event: Any) -> None: pass
+    def pool_ready(self, event: Any) -> None: pass
+    def pool_cleared(self, event: Any) -> None: self._add(clears=1)
+    def pool_closed(self, event: Any) -> None: pass
+    def connection_created(self, event: Any) -> None: self._add(open=1, created=1)
+    def connection_ready(self, event: Any) -> None: pass
+    def connection_closed(self, event: Any) -> None: self._add(open=-1, closed=1)
+    def connection_check_out_started(self, event: Any) -> None: pass
+    def connection_check_out_failed(self, event: Any) -> None: self._add(checkout_failures=1)
+    def connection_checked_out(self, event: Any) -> None: self._add(in_use=1, checkouts=1)
+    def connection_checked_in(self, event: Any) -> None: self._add(in_use=-1)
+
+    def as_dict(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "open": self.open, "in_use": self.in_use, "peak_in_use": self.peak_in_use,
+                "checkouts": self.checkouts, "checkout_failures": self.checkout_failures,
+                "created": self.created, "closed": self.closed, "clears": self.clears,
+            }
+
+
+def _redact_uri(uri: str) -> str:
+    return re.sub(r"//[^/@]*@", "//***@", uri)
+
+
+class ClientRegistry:
+    """
+    Un MongoClient por (URI, opciones) y por proceso. PyMongo ya es thread-safe y
+    mantiene su propio pool, así que reutilizarlo evita el handshake TCP/TLS y la
+    selección de servidor en cada llamada. El ping es perezoso: solo al crear el
+    cliente y cuando pasó 'health_check_s' desde la última validación; si falla,
+    el cliente sale del registro (sin cerrarlo: otros hilos pueden estar usándolo;
+    PyMongo libera monitores y conexiones cuando deja de estar referenciado) y el
+    error se propaga.
+    """
+
+    def __init__(self, health_check_s: float = HEALTH_CHECK_S) -> None:
+        self.health_check_s = float(health_check_s)
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._clients: Dict[Tuple[str, Tuple[Tuple[str, Any], ...]], Dict[str, Any]] = {}
+
+    @staticmethod
+    def _options(timeout_ms: int, options: Dict[str, Any]) -> Dict[str, Any]:
+        opts: Dict[str, Any] = {"serverSelectionTimeoutMS": int(timeout_ms)}
+        if POOL_MAX_SIZE > 0:
+            opts["maxPoolSize"] = POOL_MAX_SIZE
+        if POOL_MIN_SIZE > 0:
+            opts["minPoolSize"] = POOL_MIN_SIZE
+        if POOL_MAX_IDLE_MS > 0:
+            opts["maxIdleTimeMS"] = POOL_MAX_IDLE_MS
+        opts.update(options)
+        return opts
+
+    @staticmethod
+    def _freeze(name: str, value: Any) -> Any:
+        """Valor de opción como parte de la llave: listas/dicts -> tuplas; lo demás debe ser hashable."""
+        if isinstance(value, dict):
+            return tuple(sorted((str(k), ClientRegistry._freeze(name, v)) for k, v in value.items()))
+        if isinstance(value, (list, tuple, set, frozenset)):
+            items = [ClientRegistry._freeze(name, v) for v in value]
+            return tuple(sorted(items, key=repr) if isinstance(value, (set, frozenset)) else items)
+        try:
+            hash(value)
+        except TypeError:
+            raise TypeError(f"Opción de MongoClient no soportada por el registro: {name}={value!r} (no es hashable)") from None
+        return value
+
+    def get(self, uri: Optional[str] = None, timeout_ms: int = 4000, check: bool = True, **options: Any) -> MongoClient:
+        uri = uri or DEFAULT_URI
+        opts = self._options(timeout_ms, options)
+        key = (uri, tuple(sorted((k, self._freeze(k, v)) for k, v in opts.items())))
+        with self._lock:
+            if self._pid != os.getpid():
+                # proceso hijo (fork): los clientes del padre no son reutilizables
+                self._clients = {}
+                self._pid = os.getpid()
+            entry = self._clients.get(key)
+            if entry is None:
+                metrics = _PoolMetrics()
+                client = MongoClient(uri, event_listeners=[metrics], **opts)
+                entry = {"client": client, "metrics": metrics, "opts": opts, "checked_at": 0.0}
+                self._clients[key] = entry
+        if check and _time.monotonic() - entry["checked_at"] >= self.health_check_s:
+            try:
+                entry["client"].admin.command("ping")
+            except Exception:
+                self._evict(key, entry)
+                raise
+            entry["checked_at"] = _time.monotonic()
+        return entry["client"]
+
+    def _evict(self, key: Tuple[str, Tuple[Tuple[str, Any], ...]], entry: Dict[str, Any]) -> None:
+        # no se cierra: el cliente es compartido y una caída transitoria no debe
+        # cortar las operaciones en curso de otros hilos con el mismo cliente
+        with self._lock:
+            if self._clients.get(key) is entry:
+                del self._clients[key]
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Métricas por cliente: conexiones abiertas/en uso, pico y utilización del pool."""
+        with self._lock:
+            items = list(self._clients.items())
+        out: List[Dict[str, Any]] = []
+        for (uri, _), entry in items:
+            m = entry["metrics"].as_dict()
+            size = int(entry["opts"].get("maxPoolSize") or 100)
+            out.append({
+                "uri": _redact_uri(uri),
+                "max_pool_size": size,
+                **m,
+                "utilization": m["in_use"] / size if size else 0.0,
+                "peak_utilization": m["peak_in_use"] / size if size else 0.0,
+                "last_check_s": (_time.monotonic() - entry["checked_at"]) if entry["checked_at"] else None,
+            })
+        return out
+
+    def close_all(self) -> None:
+        with self._lock:
+            items = list(self._clients.items())
+            self._clients.clear()
+        for _, entry in items:
+            try:
+                entry["client"].close()
+            except Exception:
+                pass
+
+
+CLIENTS = ClientRegistry()
+
+
+def get_client(uri: Optional[str] = None, timeout_ms: int = 4000, **options: Any) -> MongoClient:
+    """Cliente compartido del registro del proceso (validado con ping de forma perezosa)."""
+    return CLIENTS.get(uri, timeout_ms=timeout_ms, **options)
+
+
+def pool_stats() -> List[Dict[str, Any]]:
+    return CLIENTS.stats()
 
 
 def get_collection(
@@ -227,6 +1142,9 @@ def ensure_indexes(coll: Collection) -> None:
     coll.create_index([("created_at", ASCENDING)], background=True, name="created_at_idx", sparse=True)
     coll.create_index([("created_ym", ASCENDING)], background=True, name="created_ym_idx", sparse=True)
 
+    # Marca de agua del polling de cambios (mongo_live)
+    coll.create_index([(UPDATED_AT_FIELD, ASCENDING)], background=True, name="updated_at_idx", sparse=True)
+
 
 # ===================== Backend OO =====================
 
@@ -237,11 +1155,13 @@ class MongoBackend:
         db_name: Optional[str] = None,
         coll_name: Optional[str] = None,
         timeout_ms: int = 4000,
+        rollup: bool = ROLLUP_ENABLED,
     ) -> None:
         self.uri = uri or DEFAULT_URI
         self.db_name = db_name or DEFAULT_DB
         self.coll_name = coll_name or DEFAULT_COLL
         self.timeout_ms = timeout_ms
+        self.rollup = rollup
 
         self.client: MongoClient = get_client(self.uri, timeout_ms=self.timeout_ms)
         self.collection: Collection = self.client[self.db_name][self.coll_name]
@@ -258,6 +1178,9 @@ class MongoBackend:
     def ensure_indexes(self) -> None:
         ensure_indexes(self.collection)
 
+    def rebuild_rollup(self) -> pd.DataFrame:
+        return rebuild_rollup(self.collection)
+
     # --------- CRUD ---------
 
     def upsert(self, doc: Dict[str, Any], pk: str = "id") -> None:
@@ -265,38 +1188,21 @@ class MongoBackend:
         key = ndoc.get(pk, "")
         if not key:
             raise ValueError(f"La PK '{pk}' no puede ir vacía en upsert().")
-        self.collection.update_one({pk: str(key)}, {"$set": ndoc}, upsert=True)
+        before = _docs_by_key(self.collection, pk, [key]) if self.rollup else {}
+        self.collection.update_one({pk: str(key)}, update_spec(ndoc), upsert=True)
+        if self.rollup:
+            _rollup_upserts(self.collection, pk, before, [ndoc])
 
-    def upsert_many(self, docs: Iterable[Dict[str, Any]], pk: str = "id", batch_size: int = 1000) -> Tuple[int, int]:
+    def upsert_many(self, docs: RowsLike, pk: str = "id", batch_size: int = 1000) -> Tuple[int, int]:
         """
-        Inserta/actualiza en lotes. Devuelve (n_docs, n_batches_enviados).
+        Inserta/actualiza en lotes. 'docs' puede ser un iterable de dicts, un DataFrame
+        o una tabla/batch Arrow; se normaliza por columnas (normalize_frame) y los docs
+        sin PK se saltan. Devuelve (n_docs, n_batches_enviados).
         """
-        ops: List[UpdateOne] = []
-        n = 0
-        batches = 0
-        for d in docs:
-            nd = normalize_document(d, pk=pk)
-            key = nd.get(pk, "")
-            if not key:
-                # saltar doc sin PK
-                continue
-            ops.append(UpdateOne({pk: str(key)}, {"$set": nd}, upsert=True))
-            n += 1
-            if len(ops) >= batch_size:
-                self.collection.bulk_write(ops, ordered=False)
-                ops.clear()
-                batches += 1
-        if ops:
-            self.collection.bulk_write(ops, ordered=False)
-            batches += 1
-        return n, batches
+        return _bulk_upsert(self.collection, iter_upsert_docs(docs, pk=pk), pk, batch_size, rollup=self.rollup)
 
     def delete_many(self, keys: Iterable[Union[str, int]], pk: str = "id") -> int:
-        ks = [str(k) for k in keys if k is not None and str(k) != ""]
-        if not ks:
-            return 0
-        res = self.collection.delete_many({pk: {"$in": ks}})
-        return int(res.deleted_count)
+        return mongo_delete_many(keys, pk=pk, coll=self.collection, rollup=self.rollup)
 
     # --------- Lecturas auxiliares ---------
 
@@ -326,52 +1232,79 @@ def get_default_collection() -> Collection:
     return get_collection(DEFAULT_DB, DEFAULT_COLL, DEFAULT_URI)
 
 
-def mongo_upsert(doc: Dict[str, Any], pk: str = "id", coll: Optional[Collection] = None) -> None:
+def mongo_upsert(doc: Dict[str, Any], pk: str = "id", coll: Optional[Collection] = None, rollup: bool = ROLLUP_ENABLED) -> None:
     coll = coll or get_default_collection()
     nd = normalize_document(doc, pk=pk)
     key = nd.get(pk, "")
     if not key:
         raise ValueError(f"La PK '{pk}' no puede ir vacía en mongo_upsert().")
-    coll.update_one({pk: str(key)}, {"$set": nd}, upsert=True)
-
-
-def mongo_upsert_many(rows: Iterable[Dict[str, Any]], pk: str = "id", coll: Optional[Collection] = None, batch_size: int = 1000) -> Tuple[int, int]:
+    before = _docs_by_key(coll, pk, [key]) if rollup else {}
+    coll.update_one({pk: str(key)}, update_spec(nd), upsert=True)
+    if rollup:
+        _rollup_upserts(coll, pk, before, [nd])
+
+
+def mongo_upsert_many(
+    rows: RowsLike,
+    pk: str = "id",
+    coll: Optional[Collection] = None,
+    batch_size: int = 1000,
+    match: Optional[Callable[[str, Any], Dict[str, Any]]] = None,
+    exclude: Iterable[str] = (),
+    rollup: bool = ROLLUP_ENABLED,
+) -> Tuple[int, int]:
     coll = coll or get_default_collection()
-    ops: List[UpdateOne] = []
-    n = 0
-    batches = 0
-    for d in rows:
-        nd = normalize_document(d, pk=pk)
-        key = nd.get(pk, "")
-        if not key:
-            continue
-        ops.append(UpdateOne({pk: str(key)}, {"$set": nd}, upsert=True))
-        n += 1
-        if len(ops) >= batch_size:
-            coll.bulk_write(ops, ordered=False)
-            ops.clear()
-            batches += 1
-    if ops:
-        coll.bulk_write(ops, ordered=False)
-        batches += 1
-    return n, batches
+    docs = iter_upsert_docs(rows, pk=pk, exclude=exclude)
+    return _bulk_upsert(coll, docs, pk, batch_size, match=match, rollup=rollup)
 
 
-def mongo_delete_many(keys: Iterable[Union[str, int]], pk: str = "id", coll: Optional[Collection] = None) -> int:
+def mongo_delete_many(
+    keys: Iterable[Union[str, int]],
+    pk: str = "id",
+    coll: Optional[Collection] = None,
+    match: Optional[Callable[[str, Any], Dict[str, Any]]] = None,
+    rollup: bool = ROLLUP_ENABLED,
+) -> int:
     coll = coll or get_default_collection()
     ks = [str(k) for k in keys if k is not None and str(k) != ""]
     if not ks:
         return 0
-    res = coll.delete_many({pk: {"$in": ks}})
+    before = _docs_by_key(coll, pk, ks, match) if rollup else {}
+    res = coll.delete_many(_keys_filter(pk, ks, match))
+    if before:
+        apply_rollup_delta(coll, rollup_delta(list(before.values()), None))
     return int(res.deleted_count)
 
 
 __all__ = [
     "MongoBackend",
     "normalize_document",
+    "normalize_frame",
+    "row_fingerprints",
+    "frame_fingerprints",
+    "CONTENT_HASH_FIELD",
+    "UPDATED_AT_FIELD",
+    "update_spec",
+    "frame_documents",
+    "iter_upsert_docs",
+    "iter_update_ops",
     "get_client",
+    "ClientRegistry",
+    "CLIENTS",
+    "pool_stats",
     "get_collection",
     "ensure_indexes",
+    "load_frame",
+    "load_frame_partitioned",
+    "id_partitions",
+    "non_numeric_partition",
+    "rollup_collection",
+    "apply_rollup_delta",
+    "load_rollup",
+    "rebuild_rollup",
+    "ensure_rollup",
+    "rollup_ready",
+    "refresh_rollup",
     "mongo_upsert",
     "mongo_upsert_many",
     "mongo_delete_many",
@@ -0,0 +1,274 @@
+# mongo_live.py
+# Consumidor de cambios de Mongo para mantener "vivo" el dataset en memoria
+# - Change streams (replica set / Atlas) con resume token y reconexión
+# - Fallback por polling en servidores standalone: marca de agua sobre updated_at
+#   (lo pone $currentDate en cada upsert de mongo_backend) y sobre _id (inserts de
+#   otras herramientas que no ponen updated_at)
+# - Los cambios se entregan en lotes como entradas con el formato del change log
+#   local ({"op": "upsert"|"delete", "pk", "key", "row"}), listas para merge_wal
+#
+# Limitación del polling: no ve borrados (no hay tombstones); se reconcilian en la
+# siguiente recarga completa. Con change streams los borrados llegan por _id: la key
+# se resuelve con lo visto antes o, si no, el llamador la busca por 'mongo_id'.
+#
+# No depende de Streamlit. Para pruebas basta una colección tipo mongomock: si
+# watch() no está soportado se usa polling.
+
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from pymongo.collection import Collection  # type: ignore
+from pymongo.errors import OperationFailure, PyMongoError  # type: ignore
+
+from mongo_backend import CONTENT_HASH_FIELD, UPDATED_AT_FIELD
+
+
+Entry = Dict[str, Any]
+ChangesFn = Callable[[List[Entry]], None]
+
+# Campos de servicio que no forman parte de la fila del dataset
+_BOOKKEEPING = ("id_num", CONTENT_HASH_FIELD, UPDATED_AT_FIELD)
+
+
+def doc_to_entry(doc: Dict[str, Any], pk: str = "id") -> Optional[Entry]:
+    """Documento de Mongo -> entrada upsert (con mongo_id = str(_id), como en las lecturas)."""
+    key = doc.get(pk)
+    if key is None or key == "":
+        return None
+    row = {k: v for k, v in doc.items() if k != "_id" and k not in _BOOKKEEPING}
+    if "_id" in doc:
+        row["mongo_id"] = str(doc["_id"])
+    return {"op": "upsert", "pk": pk, "key": str(key), "row": row}
+
+
+class ChangeFeed:
+    def __init__(
+        self,
+        coll: Collection,
+        on_changes: ChangesFn,
+        pk: str = "id",
+        mode: str = "auto",
+        poll_interval: float = 2.0,
+        max_batch: int = 1000,
+        max_wait_s: float = 0.5,
+        on_reset: Optional[Callable[[], None]] = None,
+    ) -> None:
+        """
+        mode: "auto" (change stream y si el servidor no lo soporta, polling),
+              "stream" o "poll". 'on_reset' se llama si el stream se invalida
+              (drop/rename de la colección): el llamador debe recargar completo.
+        """
+        self.coll = coll
+        self.on_changes = on_changes
+        self.pk = pk
+        self.mode = mode
+        self.poll_interval = poll_interval
+        self.max_batch = max_batch
+        self.max_wait_s = max_wait_s
+        self.on_reset = on_reset
+
+        self.active_mode: Optional[str] = None
+        self.events = 0
+        self.batches = 0
+        self.last_error: Optional[str] = None
+        self.last_change_at: Optional[float] = None
+
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._token: Optional[Dict[str, Any]] = None
+        self._keys: Dict[str, str] = {}   # str(_id) -> key (para resolver deletes)
+        self._wm_ts: Any = None           # marca de agua (updated_at, _id) del último doc visto (polling)
+        self._wm_ts_id: Any = None
+        self._wm_id: Any = None           # marca de agua _id (polling)
+
+    # --------- Ciclo de vida ---------
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> "ChangeFeed":
+        if self.running:
+            return self
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="mongo-change-feed", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "mode": self.active_mode,
+            "events": self.events,
+            "batches": self.batches,
+            "last_change_at": self.last_change_at,
+            "last_error": self.last_error,
+        }
+
+    # --------- Entrega ---------
+
+    def _emit(self, entries: List[Entry]) -> None:
+        if not entries:
+            return
+        try:
+            self.on_changes(entries)
+        except Exception as ex:  # noqa: BLE001
+            self.last_error = f"on_changes: {type(ex).__name__}: {ex}"
+            return
+        self.events += len(entries)
+        self.batches += 1
+        self.last_change_at = time.time()
+
+    def _upsert_entry(self, doc: Optional[Dict[str, Any]]) -> Optional[Entry]:
+        e = doc_to_entry(doc, self.pk) if doc else None
+        if e is not None and e["row"].get("mongo_id"):
+            self._keys[e["row"]["mongo_id"]] = e["key"]
+        return e
+
+    def _delete_entry(self, oid: Any) -> Entry:
+        mid = str(oid)
+        return {"op": "delete", "pk": self.pk, "key": self._keys.pop(mid, None), "mongo_id": mid}
+
+    # --------- Loop ---------
+
+    def _run(self) -> None:
+        # stand-ins tipo mongomock no implementan watch(): directo a polling
+        use_stream = self.mode == "stream" or (self.mode == "auto" and hasattr(type(self.coll), "watch"))
+        backoff = 1.0
+        while not self._stop.is_set():
+            try:
+                if use_stream:
+                    self._run_stream()
+                else:
+                    self._run_poll()
+                backoff = 1.0
+            except OperationFailure as e:
+                # standalone: "$changeStream stage is only supported on replica sets"
+                if use_stream and self.mode == "auto":
+                    use_stream = False
+                    self.last_error = f"change streams no disponibles ({e}); usando polling"
+                    continue
+                self.last_error = f"{type(e).__name__}: {e}"
+            except (NotImplementedError, AttributeError, TypeError) as e:
+                if use_stream and self.mode == "auto":
+                    use_stream = False
+                    continue
+                self.last_error = f"{type(e).__name__}: {e}"
+                return
+            except PyMongoError as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+            self._stop.wait(backoff)
+            backoff = min(backoff * 2, 30.0)
+
+    def _run_stream(self) -> None:
+        self.active_mode = "stream"
+        kwargs: Dict[str, Any] = {"full_document": "updateLookup", "max_await_time_ms": int(self.max_wait_s * 1000)}
+        if self._token is not None:
+            kwargs["resume_after"] = self._token
+        with self.coll.watch(**kwargs) as stream:
+            pending: List[Entry] = []
+            started = time.monotonic()
+            while not self._stop.is_set() and stream.alive:
+                ch = stream.try_next()
+                if ch is not None:
+                    self._token = stream.resume_token
+                    op = ch.get("operationType")
+                    if op in ("insert", "update", "replace"):
+                        e = self._upsert_entry(ch.get("fullDocument"))
+                        if e is not None:
+                            pending.append(e)
+                    elif op == "delete":
+                        pending.append(self._delete_entry((ch.get("documentKey") or {}).get("_id")))
+                    elif op in ("drop", "rename", "dropDatabase", "invalidate"):
+                        self._emit(pending)
+                        pending = []
+                        self._token = None
+                        if self.on_reset is not None:
+                            self.on_reset()
+                        return
+                if pending and (ch is None or len(pending) >= self.max_batch
+                                or time.monotonic() - started >= self.max_wait_s):
+                    self._emit(pending)
+                    pending = []
+                    started = time.monotonic()
+            self._emit(pending)
+
+    # --------- Polling (standalone) ---------
+
+    def _init_watermarks(self) -> None:
+        last = list(self.coll.find({UPDATED_AT_FIELD: {"$exists": True}}, {UPDATED_AT_FIELD: 1})
+                    .sort([(UPDATED_AT_FIELD, -1), ("_id", -1)]).limit(1))
+        if last:
+            self._wm_ts, self._wm_ts_id = last[0][UPDATED_AT_FIELD], last[0]["_id"]
+        last = list(self.coll.find({}, {"_id": 1}).sort("_id", -1).limit(1))
+        self._wm_id = last[0]["_id"] if last else None
+
+    def _poll_query(self) -> Dict[str, Any]:
+        """
+        Seek sobre la llave compuesta (updated_at, _id): los docs que comparten la marca
+        de agua ya vistos quedan fuera de la consulta (no de la página), así un lote de
+        más de max_batch docs con el mismo updated_at no atasca el polling.
+        """
+        ors: List[Dict[str, Any]] = []
+        if self._wm_ts is not None:
+            ors.append({UPDATED_AT_FIELD: {"$gt": self._wm_ts}})
+            ors.append({UPDATED_AT_FIELD: self._wm_ts, "_id": {"$gt": self._wm_ts_id}})
+        else:
+            ors.append({UPDATED_AT_FIELD: {"$exists": True}})
+        if self._wm_id is not None:
+            ors.append({"_id": {"$gt": self._wm_id}})
+        else:
+            ors.append({"_id": {"$exists": True}})
+        return {"$or": ors}
+
+    def _past_ts_mark(self, ts: Any, oid: Any) -> bool:
+        if self._wm_ts is None:
+            return True
+        try:
+            return ts > self._wm_ts or (ts == self._wm_ts and oid > self._wm_ts_id)
+        except TypeError:
+            return ts > self._wm_ts
+
+    def poll_once(self) -> int:
+        """Un ciclo de polling; devuelve cuántos cambios se entregaron."""
+        docs = list(self.coll.find(self._poll_query())
+                    .sort([(UPDATED_AT_FIELD, 1), ("_id", 1)]).limit(self.max_batch))
+        entries: List[Entry] = []
+        for d in docs:
+            oid = d.get("_id")
+            ts = d.get(UPDATED_AT_FIELD)
+            e = self._upsert_entry(d)
+            if e is not None:
+                entries.append(e)
+            if ts is not None and self._past_ts_mark(ts, oid):
+                self._wm_ts, self._wm_ts_id = ts, oid
+            try:
+                if self._wm_id is None or oid > self._wm_id:
+                    self._wm_id = oid
+            except TypeError:
+                pass  # _id de tipos mezclados: solo queda la marca de updated_at
+        self._emit(entries)
+        return len(entries)
+
+    def _run_poll(self) -> None:
+        self.active_mode = "poll"
+        if self._wm_ts is None and self._wm_id is None:
+            self._init_watermarks()
+        while not self._stop.is_set():
+            n = self.poll_once()
+            if n < self.max_batch:
+                self._stop.wait(self.poll_interval)
+
+
+__all__ = [
+    "ChangeFeed",
+    "doc_to_entry",
+]
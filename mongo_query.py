@@ -0,0 +1,158 @@
+# mongo_query.py
+# Traducción de la UI (filtros avanzados, búsqueda rápida, orden y paginación) a
+# consultas MongoDB, para que solo una página de documentos viaje por la red.
+# - build_filter(): dict de _filters_ui (+ búsqueda rápida) -> filtro Mongo
+# - build_sort(): columna de la UI -> campo indexado (id -> id_num, mongo_id -> _id)
+# - count_matches() / find_page(): total y una página (skip/limit)
+#
+# Aprovecha los índices de mongo_backend.ensure_indexes(): id_num, email,
+# created_at, created_ym. Los "contiene" se traducen a $regex case-insensitive.
+#
+# No depende de Streamlit.
+
+from __future__ import annotations
+
+import re
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    from pymongo.collection import Collection  # type: ignore
+except Exception:  # pragma: no cover
+    Collection = Any  # type: ignore
+
+
+# Columnas de la UI (app._normalize_customers_df) -> campos en Mongo
+FIELD_MAP = {
+    "id": "id_num",
+    "mongo_id": "_id",
+}
+
+# Mismas columnas de texto que app._apply_advanced_filters
+TEXT_FILTERS = ("name", "first_name", "last_name", "email", "phone", "job_title", "user_id", "mongo_id")
+
+# Campos que en Mongo son string y aceptan $regex directo
+_STRING_FIELDS = {"id", "name", "first_name", "last_name", "email", "phone", "sex", "job_title",
+                  "user_id", "created_ym"}
+
+
+def mongo_field(col: str) -> str:
+    return FIELD_MAP.get(col, col)
+
+
+# ===================== Predicados =====================
+
+def _contains(col: str, q: Any) -> Dict[str, Any]:
+    """'contiene' case-insensitive. Campos no-string se comparan por su texto ($toString)."""
+    rx = re.escape(str(q).strip())
+    if col in _STRING_FIELDS:
+        return {col: {"$regex": rx, "$options": "i"}}
+    field = mongo_field(col)
+    return {"$expr": {"$regexMatch": {"input": {"$toString": f"${field}"}, "regex": rx, "options": "i"}}}
+
+
+def _range(field: str, lo: Any, hi: Any) -> Optional[Dict[str, Any]]:
+    cond: Dict[str, Any] = {}
+    if lo is not None:
+        cond["$gte"] = lo
+    if hi is not None:
+        cond["$lte"] = hi
+    return {field: cond} if cond else None
+
+
+def _day_start(d: Optional[date]) -> Optional[datetime]:
+    if d is None:
+        return None
+    return datetime.combine(d, time.min)
+
+
+def _day_end(d: Optional[date]) -> Optional[datetime]:
+    # mismo criterio que app._between_date: hasta el último segundo del día
+    if d is None:
+        return None
+    return datetime.combine(d, time.min) + timedelta(days=1) - timedelta(seconds=1)
+
+
+def build_filter(f: Optional[Dict[str, Any]] = None, quick: Optional[Tuple[str, str]] = None) -> Dict[str, Any]:
+    """
+    Traduce el dict de _filters_ui (y opcionalmente la búsqueda rápida (columna, texto))
+    a un filtro Mongo con la misma semántica que _apply_advanced_filters.
+    """
+    f = f or {}
+    clauses: List[Dict[str, Any]] = []
+
+    for key in TEXT_FILTERS:
+        if f.get(key):
+            clauses.append(_contains(key, f[key]))
+
+    if f.get("sex") and f["sex"] != "Todos":
+        clauses.append({"sex": {"$regex": f"^{re.escape(str(f['sex']))}$", "$options": "i"}})
+    if f.get("created_ym") and f["created_ym"] != "Todos":
+        clauses.append({"created_ym": str(f["created_ym"])})
+
+    for field, lo, hi in (
+        ("id_num", f.get("id_min"), f.get("id_max")),
+        ("balance", f.get("bal_min"), f.get("bal_max")),
+        ("dob", _day_start(f.get("dob_min")), _day_end(f.get("dob_max"))),
+        ("created_at", _day_start(f.get("crt_min")), _day_end(f.get("crt_max"))),
+    ):
+        r = _range(field, lo, hi)
+        if r:
+            clauses.append(r)
+
+    if quick is not None and str(quick[1]).strip():
+        clauses.append(_contains(quick[0], quick[1]))
+
+    if not clauses:
+        return {}
+    if len(clauses) == 1:
+        return clauses[0]
+    return {"$and": clauses}
+
+
+def build_sort(sort_by: Optional[str], ascending: bool = True) -> List[Tuple[str, int]]:
+    """Orden Mongo; _id como desempate para que skip/limit sea estable entre páginas."""
+    d = 1 if ascending else -1
+    if not sort_by:
+        return [("_id", d)]
+    field = mongo_field(sort_by)
+    if field == "_id":
+        return [("_id", d)]
+    return [(field, d), ("_id", d)]
+
+
+# ===================== Ejecución =====================
+
+def count_matches(coll: Collection, flt: Dict[str, Any]) -> int:
+    """Total de documentos que cumplen el filtro (estimado barato si no hay filtro)."""
+    if not flt:
+        return int(coll.estimated_document_count())
+    return int(coll.count_documents(flt))
+
+
+def find_page(
+    coll: Collection,
+    flt: Dict[str, Any],
+    sort_by: Optional[str] = None,
+    ascending: bool = True,
+    page: int = 1,
+    page_size: int = 25,
+    projection: Optional[Dict[str, int]] = None,
+) -> List[Dict[str, Any]]:
+    """Una página de documentos (skip/limit) ya ordenada en el servidor."""
+    page = max(1, int(page))
+    page_size = max(1, int(page_size))
+    cur = coll.find(flt, projection).sort(build_sort(sort_by, ascending))
+    cur = cur.skip((page - 1) * page_size).limit(page_size)
+    return list(cur)
+
+
+__all__ = [
+    "FIELD_MAP",
+    "TEXT_FILTERS",
+    "mongo_field",
+    "build_filter",
+    "build_sort",
+    "count_matches",
+    "find_page",
+]
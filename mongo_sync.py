@@ -0,0 +1,359 @@
+# mongo_sync.py
+# Motor de sincronización masiva hacia Mongo (bulk_write en paralelo)
+# - Prepara lotes (normalize_frame + UpdateOne) en el hilo principal mientras N
+#   bulk_write viajan en un pool de hilos sobre el mismo MongoClient (su pool de
+#   conexiones es thread-safe)
+# - Tamaño de lote adaptativo por bytes BSON (muestreo de documentos)
+# - Reintento con backoff de lotes que fallan por errores transitorios (los upserts
+#   con $set son idempotentes: reenviar el lote completo es seguro)
+# - Reporta throughput (docs/s, lotes/s) al llamador
+# - Sync diferencial: compara huellas de contenido (content_hash en cada documento y
+#   un sidecar local) y solo envía altas, cambios y bajas
+#
+# Uso:
+#   from mongo_sync import BulkSyncEngine, diff_sync
+#   stats = BulkSyncEngine(coll).upsert(df, pk="id")
+#   print(stats.docs_per_s, stats.batches_per_s)
+#   plan, stats = diff_sync(coll, df, sidecar="data/customers.parquet.db.coll.fp.parquet")
+
+from __future__ import annotations
+
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import bson  # type: ignore
+import numpy as np
+import pandas as pd
+from pymongo import UpdateOne  # type: ignore
+from pymongo.collection import Collection  # type: ignore
+from pymongo.errors import AutoReconnect, BulkWriteError, ConnectionFailure, PyMongoError  # type: ignore
+
+from mongo_backend import (
+    CONTENT_HASH_FIELD,
+    ROLLUP_ENABLED,
+    RowsLike,
+    frame_fingerprints,
+    iter_upsert_docs,
+    rebuild_rollup,
+    update_spec,
+)
+from storage_config import read_fingerprints, write_fingerprints
+
+
+SYNC_WORKERS = int(os.getenv("MONGO_SYNC_WORKERS", "4"))
+SYNC_BATCH_BYTES = int(os.getenv("MONGO_SYNC_BATCH_BYTES", str(4 * 1024 * 1024)))
+SYNC_RETRIES = int(os.getenv("MONGO_SYNC_RETRIES", "3"))
+
+# Muestra 1 de cada N documentos para estimar el tamaño BSON promedio
+_SAMPLE_EVERY = 16
+
+
+@dataclass
+class SyncStats:
+    docs: int = 0
+    batches: int = 0
+    bytes: int = 0
+    retries: int = 0
+    failed_docs: int = 0
+    seconds: float = 0.0
+    errors: List[str] = field(default_factory=list)
+
+    @property
+    def docs_per_s(self) -> float:
+        return self.docs / self.seconds if self.seconds > 0 else 0.0
+
+    @property
+    def batches_per_s(self) -> float:
+        return self.batches / self.seconds if self.seconds > 0 else 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "docs": self.docs,
+            "batches": self.batches,
+            "bytes": self.bytes,
+            "retries": self.retries,
+            "failed_docs": self.failed_docs,
+            "seconds": round(self.seconds, 3),
+            "docs_per_s": round(self.docs_per_s, 1),
+            "batches_per_s": round(self.batches_per_s, 2),
+        }
+
+
+ProgressFn = Callable[[SyncStats], None]
+
+
+def _is_transient(exc: Exception) -> bool:
+    """Errores de red / elección de primario: vale la pena reintentar el lote."""
+    if isinstance(exc, (AutoReconnect, ConnectionFailure)):
+        return True
+    if isinstance(exc, BulkWriteError):
+        # errores de escritura por documento (validación, duplicados...) no se arreglan reintentando
+        return False
+    if isinstance(exc, PyMongoError):
+        return exc.has_error_label("RetryableWriteError") or exc.has_error_label("TransientTransactionError")
+    return False
+
+
+class BulkSyncEngine:
+    def __init__(
+        self,
+        coll: Collection,
+        workers: int = SYNC_WORKERS,
+        max_in_flight: Optional[int] = None,
+        batch_bytes: int = SYNC_BATCH_BYTES,
+        min_batch: int = 100,
+        max_batch: int = 10_000,
+        retries: int = SYNC_RETRIES,
+        backoff_s: float = 0.5,
+    ) -> None:
+        self.coll = coll
+        self.workers = max(1, int(workers))
+        self.max_in_flight = max(1, int(max_in_flight or 2 * self.workers))
+        self.batch_bytes = max(1, int(batch_bytes))
+        self.min_batch = max(1, int(min_batch))
+        self.max_batch = max(self.min_batch, int(max_batch))
+        self.retries = max(0, int(retries))
+        self.backoff_s = backoff_s
+
+    # --------- Preparación de lotes ---------
+
+    def _batches(self, pairs: Iterable[Tuple[Any, Dict[str, Any]]]) -> Iterator[Tuple[List[Any], int]]:
+        """Agrupa (op, doc) en lotes de ~batch_bytes según el tamaño BSON estimado."""
+        avg = 0.0
+        seen = 0
+        ops: List[Any] = []
+        est = 0.0
+        for i, (op, doc) in enumerate(pairs):
+            if i % _SAMPLE_EVERY == 0:
+                size = len(bson.encode(doc))
+                seen += 1
+                avg += (size - avg) / seen
+            ops.append(op)
+            est += avg
+            if len(ops) >= self.max_batch or (est >= self.batch_bytes and len(ops) >= self.min_batch):
+                yield ops, int(est)
+                ops, est = [], 0.0
+        if ops:
+            yield ops, int(est)
+
+    # --------- Escritura (en el pool) ---------
+
+    def _write(self, ops: List[Any]) -> Tuple[int, Optional[str]]:
+        """bulk_write con reintentos. Devuelve (reintentos_usados, error_final|None)."""
+        attempt = 0
+        while True:
+            try:
+                self.coll.bulk_write(ops, ordered=False)
+                return attempt, None
+            except Exception as e:  # noqa: BLE001
+                if attempt >= self.retries or not _is_transient(e):
+                    return attempt, f"{type(e).__name__}: {e}"
+                attempt += 1
+                time.sleep(self.backoff_s * (2 ** (attempt - 1)))
+
+    # --------- API ---------
+
+    def run(
+        self,
+        pairs: Iterable[Tuple[Any, Dict[str, Any]]],
+        progress: Optional[ProgressFn] = None,
+        raise_on_error: bool = True,
+    ) -> SyncStats:
+        """
+        Envía (op, doc) en lotes paralelos con hasta max_in_flight lotes en vuelo.
+        'progress(stats)' se llama (en este hilo) cada vez que termina un lote.
+        Con raise_on_error, al final lanza RuntimeError si algún lote no entró.
+        """
+        stats = SyncStats()
+        t0 = time.monotonic()
+        pending: Dict[Future, Tuple[int, int]] = {}
+
+        def _collect(done: Set[Future]) -> None:
+            for fut in done:
+                n, nbytes = pending.pop(fut)
+                used, err = fut.result()
+                stats.retries += used
+                if err is None:
+                    stats.docs += n
+                    stats.batches += 1
+                    stats.bytes += nbytes
+                else:
+                    stats.failed_docs += n
+                    if len(stats.errors) < 5:
+                        stats.errors.append(err)
+            stats.seconds = time.monotonic() - t0
+            if progress is not None:
+                progress(stats)
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="mongo-sync") as pool:
+            for ops, nbytes in self._batches(pairs):
+                while len(pending) >= self.max_in_flight:
+                    done, _ = wait(set(pending), return_when=FIRST_COMPLETED)
+                    _collect(done)
+                pending[pool.submit(self._write, ops)] = (len(ops), nbytes)
+            while pending:
+                done, _ = wait(set(pending), return_when=FIRST_COMPLETED)
+                _collect(done)
+
+        stats.seconds = time.monotonic() - t0
+        if raise_on_error and stats.failed_docs:
+            raise RuntimeError(f"{stats.failed_docs:,} documentos sin sincronizar: {stats.errors[0]}")
+        return stats
+
+    def upsert(
+        self,
+        rows: RowsLike,
+        pk: str = "id",
+        match: Optional[Callable[[str, Any], Dict[str, Any]]] = None,
+        exclude: Iterable[str] = (),
+        progress: Optional[ProgressFn] = None,
+        raise_on_error: bool = True,
+    ) -> SyncStats:
+        """Upsert masivo de filas (dicts / DataFrame / Arrow) normalizadas por columnas."""
+        match = match or (lambda k, v: {k: v})
+        pairs = (
+            (UpdateOne(match(pk, d[pk]), update_spec(d), upsert=True), d)
+            for d in iter_upsert_docs(rows, pk=pk, exclude=exclude)
+        )
+        return self.run(pairs, progress=progress, raise_on_error=raise_on_error)
+
+
+# ===================== Sync diferencial por huella =====================
+
+@dataclass
+class SyncPlan:
+    inserts: np.ndarray            # posiciones (iloc) locales que no están en Mongo
+    updates: np.ndarray            # posiciones (iloc) locales con huella distinta
+    deletes: List[str]             # keys en Mongo que ya no existen localmente
+    unchanged: int
+    local: pd.DataFrame            # (key, hash) local: pasa a ser el sidecar tras el push
+
+    @property
+    def positions(self) -> np.ndarray:
+        return np.sort(np.concatenate([self.inserts, self.updates]))
+
+    def as_dict(self) -> Dict[str, int]:
+        return {
+            "inserts": len(self.inserts),
+            "updates": len(self.updates),
+            "deletes": len(self.deletes),
+            "unchanged": int(self.unchanged),
+        }
+
+
+def remote_fingerprints(coll: Collection, pk: str = "id", batch_size: int = 10_000) -> pd.DataFrame:
+    """(key, hash) de la colección leyendo solo la PK y la huella (hash None si falta)."""
+    keys: List[str] = []
+    hashes: List[Any] = []
+    cur = coll.find({}, {pk: 1, CONTENT_HASH_FIELD: 1, "_id": 0}).batch_size(batch_size)
+    for d in cur:
+        k = d.get(pk)
+        if k is None or k == "":
+            continue
+        keys.append(str(k))
+        hashes.append(d.get(CONTENT_HASH_FIELD))
+    return pd.DataFrame({"key": pd.Series(keys, dtype=object), "hash": pd.Series(hashes, dtype=object)})
+
+
+def plan_diff(local: pd.DataFrame, remote: pd.DataFrame) -> SyncPlan:
+    """Compara (key, hash) local vs remoto. 'local' va alineado con las filas del frame."""
+    r = remote.drop_duplicates("key", keep="last").set_index("key")["hash"]
+    theirs = r.reindex(local["key"]).to_numpy(dtype=object)
+    missing = ~local["key"].isin(r.index).to_numpy()
+    differ = ~missing & (theirs != local["hash"].to_numpy(dtype=object))
+    has_key = (local["key"] != "").to_numpy()
+    inserts = np.flatnonzero(missing & has_key)
+    updates = np.flatnonzero(differ & has_key)
+    gone = r.index[~r.index.isin(local["key"])]
+    return SyncPlan(
+        inserts=inserts,
+        updates=updates,
+        deletes=[str(k) for k in gone],
+        unchanged=int(len(local) - len(inserts) - len(updates)),
+        local=local,
+    )
+
+
+def _key_variants(keys: List[str]) -> List[Any]:
+    """PK como string y, si es numérica, también como int (documentos previos)."""
+    out: List[Any] = []
+    for k in keys:
+        out.append(k)
+        try:
+            out.append(int(float(k)))
+        except Exception:
+            pass
+    return out
+
+
+def changed_rows(before: pd.DataFrame, after: pd.DataFrame, pk: str = "id", exclude: Iterable[str] = ("mongo_id",)) -> np.ndarray:
+    """Máscara sobre 'after': filas nuevas o cuyo contenido normalizado cambió."""
+    if after.empty:
+        return np.zeros(0, dtype=bool)
+    a = frame_fingerprints(after, pk=pk, exclude=exclude, chunk_rows=max(len(after), 1))
+    if before.empty:
+        return np.ones(len(after), dtype=bool)
+    b = frame_fingerprints(before, pk=pk, exclude=exclude, chunk_rows=max(len(before), 1))
+    prev = b.drop_duplicates("key", keep="last").set_index("key")["hash"]
+    return (prev.reindex(a["key"]).to_numpy(dtype=object) != a["hash"].to_numpy(dtype=object))
+
+
+def diff_sync(
+    coll: Collection,
+    df: pd.DataFrame,
+    pk: str = "id",
+    sidecar: Optional[str] = None,
+    verify_remote: bool = False,
+    delete_missing: bool = False,
+    partial: bool = False,
+    engine: Optional[BulkSyncEngine] = None,
+    match: Optional[Callable[[str, Any], Dict[str, Any]]] = None,
+    exclude: Iterable[str] = ("mongo_id",),
+    progress: Optional[ProgressFn] = None,
+    rollup: bool = ROLLUP_ENABLED,
+) -> Tuple[SyncPlan, SyncStats]:
+    """
+    Sincroniza 'df' hacia 'coll' moviendo solo el delta. Las huellas remotas salen del
+    sidecar (si existe y no se pide 'verify_remote') o de la colección (solo PK +
+    content_hash). Tras un push completo sin errores, el sidecar queda con las huellas
+    locales. Si hubo cambios, el rollup mensual se recalcula en el servidor (el motor
+    en paralelo no lee valores previos).
+
+    Por defecto no borra nada: las keys remotas ausentes en 'df' solo se reportan en
+    plan.deletes. 'delete_missing=True' las borra (huellas leídas de la colección, no
+    del sidecar) y se rechaza con 'partial=True' (frame con límite de lectura o leído
+    de la propia colección), donde "ausente" no significa "borrado".
+    """
+    if delete_missing and partial:
+        raise ValueError("delete_missing requiere el dataset completo: el frame es parcial (límite de lectura o fuente Mongo).")
+    local = frame_fingerprints(df, pk=pk, exclude=exclude)
+    remote = None if (verify_remote or delete_missing or not sidecar) else read_fingerprints(sidecar)
+    if remote is None:
+        remote = remote_fingerprints(coll, pk=pk)
+    plan = plan_diff(local, remote)
+
+    engine = engine or BulkSyncEngine(coll)
+    pos = plan.positions
+    stats = engine.upsert(df.iloc[pos], pk=pk, match=match, exclude=exclude, progress=progress) if len(pos) else SyncStats()
+    if delete_missing and plan.deletes:
+        for i in range(0, len(plan.deletes), 10_000):
+            coll.delete_many({pk: {"$in": _key_variants(plan.deletes[i:i + 10_000])}})
+    if sidecar:
+        write_fingerprints(local[local["key"] != ""], sidecar)
+    if rollup and (len(pos) or (delete_missing and plan.deletes)):
+        rebuild_rollup(coll)
+    return plan, stats
+
+
+__all__ = [
+    "BulkSyncEngine",
+    "SyncStats",
+    "SyncPlan",
+    "remote_fingerprints",
+    "plan_diff",
+    "changed_rows",
+    "diff_sync",
+]
@@ -0,0 +1,390 @@
+# online_stats.py
+# Estadísticos en línea por columna, actualizables por trozos o por deltas de filas
+# - RunningStats: count / mean / varianza (Welford + combinación de Chan), sum, min, max
+# - QuantileSketch: DDSketch (cuantiles con error relativo <= alpha), mergeable y con
+#   borrado: son conteos por bucket logarítmico, así que un delete resta del bucket
+#   (t-digest / KLL no admiten borrados)
+# - ColumnStats: ambos + nulos; sirve describe / percentiles / conteo de outliers con
+#   las mismas llaves que _MU (app.py) sin volver a recorrer la columna
+# - StatsStore: ColumnStats por columna ligado a una versión del dataset (como
+#   rollup.MonthlyRollup): advance() aplica el delta de una escritura
+#
+# Mean / std / sum son exactos (salvo redondeo). Mediana, percentiles y outliers son
+# exactos mientras la columna tenga <= EXACT_ROWS valores (el sketch guarda además
+# los valores ordenados) y, por encima, aproximados con error relativo <= alpha.
+# Los cuantiles interpolan entre los dos rangos vecinos, como np.quantile / pandas.
+#
+# No depende de Streamlit.
+
+from __future__ import annotations
+
+import math
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+SKETCH_ALPHA = 0.001
+EXACT_ROWS = 10_000
+CHUNK_ROWS = 250_000
+
+
+def _values(x: Any) -> np.ndarray:
+    """float64 con NaN para lo no numérico (como pd.to_numeric(errors='coerce'))."""
+    if isinstance(x, np.ndarray) and x.dtype.kind == "f":
+        return x.astype("float64", copy=False)
+    s = x if isinstance(x, pd.Series) else pd.Series(list(x) if not isinstance(x, (list, np.ndarray)) else x)
+    return pd.to_numeric(s, errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+
+
+class RunningStats:
+    """Momentos en línea. update/remove aceptan arreglos sin NaN."""
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.minmax_exact = True
+
+    def _combine(self, n_b: int, mean_b: float, m2_b: float) -> None:
+        n_a = self.count
+        n = n_a + n_b
+        delta = mean_b - self.mean
+        self.mean += delta * n_b / n
+        self.m2 += m2_b + delta * delta * n_a * n_b / n
+        self.count = n
+
+    def update(self, v: np.ndarray) -> None:
+        if v.size == 0:
+            return
+        mean_b = float(v.mean())
+        self._combine(int(v.size), mean_b, float(((v - mean_b) ** 2).sum()))
+        self.sum += float(v.sum())
+        self.min = min(self.min, float(v.min()))
+        self.max = max(self.max, float(v.max()))
+
+    def remove(self, v: np.ndarray) -> None:
+        if v.size == 0:
+            return
+        n_b = int(v.size)
+        n_a = self.count - n_b
+        if n_a <= 0:
+            self.__init__()  # type: ignore[misc]
+            return
+        mean_b = float(v.mean())
+        m2_b = float(((v - mean_b) ** 2).sum())
+        mean_a = (self.count * self.mean - n_b * mean_b) / n_a
+        delta = mean_b - mean_a
+        self.m2 = max(0.0, self.m2 - m2_b - delta * delta * n_a * n_b / self.count)
+        self.mean = mean_a
+        self.count = n_a
+        self.sum -= float(v.sum())
+        # el extremo pudo salir: queda como cota (ColumnStats lo toma del sketch)
+        if float(v.min()) <= self.min or float(v.max()) >= self.max:
+            self.minmax_exact = False
+
+    def merge(self, other: "RunningStats") -> None:
+        if other.count == 0:
+            return
+        if self.count == 0:
+            self.__dict__.update(other.__dict__)
+            return
+        self._combine(other.count, other.mean, other.m2)
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.minmax_exact = self.minmax_exact and other.minmax_exact
+
+    @property
+    def std(self) -> float:
+        """Desviación muestral (ddof=1); 0.0 con un solo valor."""
+        if self.count == 0:
+            return math.nan
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+
+def _remove_sorted(a: np.ndarray, v: np.ndarray) -> Optional[np.ndarray]:
+    """'a' (ordenado) sin una ocurrencia de cada valor de 'v'; None si alguno no está."""
+    vs = np.sort(v)
+    _, first, cnt = np.unique(vs, return_index=True, return_counts=True)
+    pos = np.searchsorted(a, vs, side="left") + (np.arange(len(vs)) - np.repeat(first, cnt))
+    if len(a) == 0 or (pos >= len(a)).any() or (a[np.minimum(pos, len(a) - 1)] != vs).any():
+        return None
+    return np.delete(a, pos)
+
+
+class QuantileSketch:
+    """
+    DDSketch con stores dict (bucket -> conteo) para positivos y negativos. Hasta
+    'exact_rows' valores guarda también la lista ordenada y responde con ella.
+    """
+
+    _MIN = 1e-12  # |x| menor cuenta como cero
+
+    def __init__(self, alpha: float = SKETCH_ALPHA, exact_rows: int = EXACT_ROWS) -> None:
+        self.alpha = float(alpha)
+        self.exact_rows = int(exact_rows)
+        # valores ordenados mientras count <= exact_rows; None una vez que se supera
+        self._exact: Optional[np.ndarray] = np.empty(0) if self.exact_rows > 0 else None
+        self.gamma = (1.0 + self.alpha) / (1.0 - self.alpha)
+        self._lg = math.log(self.gamma)
+        self.pos: Dict[int, int] = {}
+        self.neg: Dict[int, int] = {}
+        self.zero = 0
+        self.count = 0
+        self._cache: Optional[Tuple[np.ndarray, np.ndarray]] = None
+
+    def _add(self, v: np.ndarray, sign: int) -> None:
+        v = v[np.isfinite(v)]
+        if v.size == 0:
+            return
+        self._cache = None
+        if self._exact is not None:
+            if sign < 0:
+                self._exact = _remove_sorted(self._exact, v)
+            elif self.count + v.size <= self.exact_rows:
+                self._exact = np.sort(np.concatenate([self._exact, v]))
+            else:
+                self._exact = None
+        self.zero += sign * int((np.abs(v) < self._MIN).sum())
+        for store, part in ((self.pos, v[v >= self._MIN]), (self.neg, -v[v <= -self._MIN])):
+            if not part.size:
+                continue
+            keys, cnts = np.unique(np.ceil(np.log(part) / self._lg).astype("int64"), return_counts=True)
+            for k, c in zip(keys.tolist(), cnts.tolist()):
+                n = store.get(k, 0) + sign * c
+                if n > 0:
+                    store[k] = n
+                else:
+                    store.pop(k, None)
+        self.count += sign * int(v.size)
+
+    def update(self, v: np.ndarray) -> None:
+        self._add(v, 1)
+
+    def remove(self, v: np.ndarray) -> None:
+        self._add(v, -1)
+
+    def merge(self, other: "QuantileSketch") -> None:
+        if other.alpha != self.alpha:
+            raise ValueError("Solo se pueden combinar sketches con el mismo alpha.")
+        self._cache = None
+        if self._exact is not None and other._exact is not None and self.count + other.count <= self.exact_rows:
+            self._exact = np.sort(np.concatenate([self._exact, other._exact]))
+        else:
+            self._exact = None
+        for mine, theirs in ((self.pos, other.pos), (self.neg, other.neg)):
+            for k, c in theirs.items():
+                mine[k] = mine.get(k, 0) + c
+        self.zero += other.zero
+        self.count += other.count
+
+    def _buckets(self) -> Tuple[np.ndarray, np.ndarray]:
+        """(valores representativos ascendentes, conteos acumulados)."""
+        if self._cache is None:
+            nk = np.array(sorted(self.neg, reverse=True), dtype="int64")
+            pk = np.array(sorted(self.pos), dtype="int64")
+            rep = 2.0 / (self.gamma + 1.0)
+            vals = np.concatenate([-rep * self.gamma ** nk.astype(float), [0.0] if self.zero else [],
+                                   rep * self.gamma ** pk.astype(float)])
+            cnts = np.concatenate([[self.neg[k] for k in nk.tolist()], [self.zero] if self.zero else [],
+                                   [self.pos[k] for k in pk.tolist()]]).astype("int64")
+            self._cache = (vals.astype(float), np.cumsum(cnts))
+        return self._cache
+
+    @property
+    def exact(self) -> bool:
+        return self._exact is not None
+
+    def _at_rank(self, ranks: np.ndarray) -> np.ndarray:
+        """Valor representativo del bucket que contiene cada rango (0-based)."""
+        vals, cum = self._buckets()
+        return vals[np.minimum(np.searchsorted(cum, ranks, side="right"), len(vals) - 1)]
+
+    def quantiles(self, qs: Sequence[float]) -> List[float]:
+        """Interpolación lineal entre los rangos vecinos (como np.quantile)."""
+        if self.count <= 0:
+            return [math.nan] * len(qs)
+        q = np.clip(np.asarray(qs, dtype=float), 0.0, 1.0)
+        if self._exact is not None:
+            return [float(x) for x in np.quantile(self._exact, q)]
+        ranks = q * (self.count - 1)
+        lo = np.floor(ranks)
+        v_lo, v_hi = self._at_rank(lo), self._at_rank(np.ceil(ranks))
+        return [float(x) for x in v_lo + (ranks - lo) * (v_hi - v_lo)]
+
+    def count_below(self, x: float) -> int:
+        """Valores < x (aproximado por bucket)."""
+        if self.count <= 0:
+            return 0
+        if self._exact is not None:
+            return int(np.searchsorted(self._exact, x, side="left"))
+        vals, cum = self._buckets()
+        i = int(np.searchsorted(vals, x, side="left"))
+        return int(cum[i - 1]) if i > 0 else 0
+
+    def count_above(self, x: float) -> int:
+        """Valores > x (aproximado por bucket)."""
+        if self.count <= 0:
+            return 0
+        if self._exact is not None:
+            return int(self.count - np.searchsorted(self._exact, x, side="right"))
+        vals, cum = self._buckets()
+        i = int(np.searchsorted(vals, x, side="right"))
+        return int(self.count - (cum[i - 1] if i > 0 else 0))
+
+
+class ColumnStats:
+    """
+    Estadísticos de una columna: momentos exactos + sketch de cuantiles + nulos.
+    'total' cuenta todas las filas vistas (también las no numéricas), como len(df).
+    """
+
+    def __init__(self, alpha: float = SKETCH_ALPHA, exact_rows: int = EXACT_ROWS) -> None:
+        self.moments = RunningStats()
+        self.sketch = QuantileSketch(alpha, exact_rows)
+        self.nulls = 0
+
+    @classmethod
+    def from_series(cls, s: Any, chunk_rows: int = CHUNK_ROWS, alpha: float = SKETCH_ALPHA,
+                    exact_rows: int = EXACT_ROWS) -> "ColumnStats":
+        out = cls(alpha, exact_rows)
+        v = _values(s)
+        for i in range(0, len(v), max(1, int(chunk_rows))):
+            out._update(v[i:i + chunk_rows])
+        return out
+
+    @classmethod
+    def from_chunks(cls, chunks: Iterable[Any], alpha: float = SKETCH_ALPHA,
+                    exact_rows: int = EXACT_ROWS) -> "ColumnStats":
+        out = cls(alpha, exact_rows)
+        for c in chunks:
+            out.update(c)
+        return out
+
+    @property
+    def total(self) -> int:
+        return self.moments.count + self.nulls
+
+    def _update(self, v: np.ndarray) -> None:
+        ok = ~np.isnan(v)
+        self.nulls += int((~ok).sum())
+        self.moments.update(v[ok])
+        self.sketch.update(v[ok])
+
+    def update(self, values: Any) -> "ColumnStats":
+        self._update(_values(values))
+        return self
+
+    def remove(self, values: Any) -> "ColumnStats":
+        v = _values(values)
+        ok = ~np.isnan(v)
+        self.nulls = max(0, self.nulls - int((~ok).sum()))
+        self.moments.remove(v[ok])
+        self.sketch.remove(v[ok])
+        return self
+
+    def apply_delta(self, before: Any, after: Any) -> "ColumnStats":
+        """Reemplaza las filas 'before' por 'after' (upsert: ambas; alta: solo after; baja: solo before)."""
+        if before is not None and len(before):
+            self.remove(before)
+        if after is not None and len(after):
+            self.update(after)
+        return self
+
+    def merge(self, other: "ColumnStats") -> "ColumnStats":
+        """Combina particiones (p.ej. trozos leídos en paralelo)."""
+        self.moments.merge(other.moments)
+        self.sketch.merge(other.sketch)
+        self.nulls += other.nulls
+        return self
+
+    # --------- mismas llaves que _MU ---------
+
+    def describe(self) -> Dict[str, float]:
+        m = self.moments
+        if m.count == 0:
+            return {"mean": np.nan, "median": np.nan, "std": np.nan, "sum": np.nan}
+        return {"mean": float(m.mean), "median": self.sketch.quantiles([0.5])[0], "std": m.std, "sum": float(m.sum)}
+
+    def percentiles_iqr(self) -> Dict[str, float]:
+        if self.moments.count == 0:
+            return {"p25": np.nan, "p50": np.nan, "p75": np.nan, "iqr": np.nan}
+        p25, p50, p75 = self.sketch.quantiles([0.25, 0.5, 0.75])
+        return {"p25": p25, "p50": p50, "p75": p75, "iqr": p75 - p25}
+
+    def outlier_counts(self, z: float = 3.0, k: float = 1.5) -> Dict[str, int]:
+        """Filas fuera de mean ± z·std y de [Q1 - k·IQR, Q3 + k·IQR], y el total."""
+        out = {"z": 0, "iqr": 0, "total": self.total}
+        m = self.moments
+        sd = m.std
+        if m.count and np.isfinite(sd) and sd != 0:
+            out["z"] = self.sketch.count_below(m.mean - z * sd) + self.sketch.count_above(m.mean + z * sd)
+        if m.count:
+            q1, q3 = self.sketch.quantiles([0.25, 0.75])
+            iqr = q3 - q1
+            out["iqr"] = self.sketch.count_below(q1 - k * iqr) + self.sketch.count_above(q3 + k * iqr)
+        return out
+
+    @property
+    def min(self) -> float:
+        if self.moments.minmax_exact or self.sketch.count == 0:
+            return self.moments.min
+        return self.sketch.quantiles([0.0])[0]
+
+    @property
+    def max(self) -> float:
+        if self.moments.minmax_exact or self.sketch.count == 0:
+            return self.moments.max
+        return self.sketch.quantiles([1.0])[0]
+
+
+class StatsStore:
+    """
+    ColumnStats por columna del dataset publicado. 'version' es la del DatasetCache:
+    advance() aplica el delta de una escritura solo si estaba al día con la anterior;
+    si no, get() reconstruye la columna pedida.
+    """
+
+    def __init__(self, alpha: float = SKETCH_ALPHA, exact_rows: int = EXACT_ROWS) -> None:
+        self.alpha = alpha
+        self.exact_rows = exact_rows
+        self._lock = threading.Lock()
+        self._cols: Dict[str, ColumnStats] = {}
+        self.version: Optional[int] = None
+
+    def get(self, version: int, df: pd.DataFrame, col: str) -> ColumnStats:
+        with self._lock:
+            if self.version != version:
+                self._cols = {}
+                self.version = version
+            cs = self._cols.get(col)
+            if cs is None:
+                cs = ColumnStats.from_series(df[col], alpha=self.alpha, exact_rows=self.exact_rows)
+                self._cols[col] = cs
+            return cs
+
+    def advance(self, from_version: int, to_version: int, before: pd.DataFrame, after: pd.DataFrame) -> bool:
+        with self._lock:
+            if self.version != from_version:
+                return False
+            for col, cs in self._cols.items():
+                cs.apply_delta(before[col] if col in before.columns else None,
+                               after[col] if col in after.columns else None)
+            self.version = to_version
+            return True
+
+
+__all__ = [
+    "RunningStats",
+    "QuantileSketch",
+    "ColumnStats",
+    "StatsStore",
+    "SKETCH_ALPHA",
+    "EXACT_ROWS",
+]
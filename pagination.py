@@ -0,0 +1,141 @@
+# pagination.py
+# Paginación sin re-filtrar ni re-ordenar todo el frame en cada cambio de página.
+# - ViewCache: orden filtrado+ordenado (posiciones iloc) por firma (filtros, orden),
+#   con LRU. Se crea una por versión del dataset (DatasetCache.derived), así que
+#   nunca sirve posiciones de un frame viejo.
+# - page_slice(): página N en O(page_size) sobre el orden cacheado
+# - KeysetPager: páginas en Mongo por rangos de id_num ($gt último id) en vez de skip
+#   (skip/limit si algún documento del filtro no tiene id_num)
+#
+# No depende de Streamlit.
+
+from __future__ import annotations
+
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+try:
+    from pymongo.collection import Collection  # type: ignore
+except Exception:  # pragma: no cover
+    Collection = Any  # type: ignore
+
+
+def view_signature(*parts: Any) -> str:
+    """Firma estable de (filtros, orden, ...) para usar como clave de caché."""
+    return json.dumps(parts, sort_keys=True, default=str)
+
+
+def sorted_positions(df: pd.DataFrame, mask: Any, sort_by: Optional[str] = None, ascending: bool = True) -> np.ndarray:
+    """Posiciones iloc de las filas que pasan 'mask', ordenadas por 'sort_by' (NaN al final)."""
+    pos = np.flatnonzero(np.asarray(mask, dtype=bool))
+    if not sort_by or sort_by not in df.columns or len(pos) < 2:
+        return pos
+    keys = df[sort_by].take(pos).reset_index(drop=True)
+    if keys.is_monotonic_increasing and ascending:
+        return pos
+    o = keys.sort_values(ascending=ascending, na_position="last", kind="stable").index.to_numpy()
+    return pos[o]
+
+
+def page_slice(df: pd.DataFrame, order: np.ndarray, page: int, page_size: int) -> pd.DataFrame:
+    """Página 'page' (1-based) del orden cacheado: solo se tocan page_size filas."""
+    start = (max(1, int(page)) - 1) * int(page_size)
+    return df.iloc[order[start:start + int(page_size)]].reset_index(drop=True)
+
+
+class ViewCache:
+    def __init__(self, df: pd.DataFrame, max_entries: int = 16) -> None:
+        self.df = df
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._orders: "OrderedDict[str, np.ndarray]" = OrderedDict()
+
+    def order(self, signature: str, build: Callable[[], np.ndarray]) -> np.ndarray:
+        """Orden para la firma; 'build' solo corre si no está en caché (filtro+sort completo)."""
+        with self._lock:
+            hit = self._orders.get(signature)
+            if hit is not None:
+                self._orders.move_to_end(signature)
+                return hit
+        order = build()
+        with self._lock:
+            self._orders[signature] = order
+            while len(self._orders) > self.max_entries:
+                self._orders.popitem(last=False)
+        return order
+
+
+class KeysetPager:
+    """
+    Paginación por seek sobre un campo único e indexado (id_num): la página N+1 se pide
+    como {field > último de N}. Guarda los límites ya vistos; saltar a una página lejana
+    hace skip solo desde el límite conocido más cercano.
+    El seek no ve documentos sin 'field': si el filtro incluye alguno, se pagina con
+    skip/limit sobre (field, _id) para que las páginas cubran el mismo total que
+    count_matches.
+    """
+
+    def __init__(
+        self,
+        coll: Collection,
+        flt: Dict[str, Any],
+        page_size: int,
+        field: str = "id_num",
+        projection: Optional[Dict[str, int]] = None,
+    ) -> None:
+        self.coll = coll
+        self.flt = flt
+        self.page_size = max(1, int(page_size))
+        self.field = field
+        self.projection = projection
+        # página -> último valor de 'field' de la página anterior (None = desde el inicio)
+        self._bounds: Dict[int, Any] = {1: None}
+        self._seekable: Optional[bool] = None
+
+    def _and(self, clause: Dict[str, Any]) -> Dict[str, Any]:
+        return {"$and": [self.flt, clause]} if self.flt else clause
+
+    @property
+    def seekable(self) -> bool:
+        """True si todos los documentos del filtro tienen 'field' (se consulta una vez)."""
+        if self._seekable is None:
+            self._seekable = self.coll.find_one(self._and({self.field: None}), {"_id": 1}) is None
+        return self._seekable
+
+    def page(self, n: int) -> List[Dict[str, Any]]:
+        n = max(1, int(n))
+        if not self.seekable:
+            cur = self.coll.find(self.flt, self.projection).sort([(self.field, 1), ("_id", 1)])
+            return list(cur.skip((n - 1) * self.page_size).limit(self.page_size))
+        k = max(p for p in self._bounds if p <= n)
+        after = self._bounds[k]
+        seek = {self.field: {"$ne": None}} if after is None else {self.field: {"$gt": after}}
+        q = self._and(seek)
+        # projection puede excluir 'field': lo pedimos igual para registrar el límite
+        proj = dict(self.projection) if self.projection else None
+        if proj and proj.get(self.field) == 0:
+            proj.pop(self.field)
+        cur = self.coll.find(q, proj).sort([(self.field, 1)])
+        if n > k:
+            cur = cur.skip((n - k) * self.page_size)
+        docs = list(cur.limit(self.page_size))
+        if docs and docs[-1].get(self.field) is not None:
+            self._bounds[n + 1] = docs[-1][self.field]
+        if self.projection and self.projection.get(self.field) == 0:
+            for d in docs:
+                d.pop(self.field, None)
+        return docs
+
+
+__all__ = [
+    "view_signature",
+    "sorted_positions",
+    "page_slice",
+    "ViewCache",
+    "KeysetPager",
+]
@@ -0,0 +1,78 @@
+# pk_index.py
+# Índice de PK para el DataFrame en memoria.
+# - Arreglo ordenado de claves numéricas + posición de fila (searchsorted, O(log n))
+# - max id cacheado para _next_id() en O(1)
+# - Búsquedas por lote vectorizadas (ediciones / borrados de varias filas)
+#
+# Se construye una vez por versión del dataset (ver DatasetCache.derived). Si las
+# claves ya vienen ordenadas (caso normal: ids 1..n) la construcción es una sola
+# pasada vectorizada, sin hashing ni argsort.
+#
+# No depende de Streamlit.
+
+from __future__ import annotations
+
+from typing import Any, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+
+def _as_float_keys(keys: Any) -> np.ndarray:
+    s = keys if isinstance(keys, pd.Series) else pd.Series(list(keys), dtype=object)
+    return pd.to_numeric(s, errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+
+
+class PKIndex:
+    def __init__(self, keys: Any) -> None:
+        vals = _as_float_keys(keys)
+        valid = ~np.isnan(vals)
+        pos = np.flatnonzero(valid)
+        k = vals[valid]
+        if len(k) > 1 and not bool(np.all(k[1:] >= k[:-1])):
+            order = np.argsort(k, kind="stable")
+            k = k[order]
+            pos = pos[order]
+        self._keys = k
+        self._pos = pos
+        self._max: Optional[float] = float(k[-1]) if len(k) else None
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, pk: str = "id") -> "PKIndex":
+        if df is None or df.empty or pk not in df.columns:
+            return cls([])
+        return cls(df[pk])
+
+    def __len__(self) -> int:
+        return int(len(self._keys))
+
+    @property
+    def max_key(self) -> Optional[float]:
+        return self._max
+
+    def next_id(self) -> int:
+        """Siguiente id libre (max + 1), sin escanear el frame."""
+        return 1 if self._max is None else int(self._max) + 1
+
+    def positions(self, keys: Iterable[Any]) -> np.ndarray:
+        """Posiciones (iloc) de las claves que existen; las ausentes se omiten."""
+        q = _as_float_keys(list(keys))
+        q = q[~np.isnan(q)]
+        if not len(q) or not len(self._keys):
+            return np.empty(0, dtype=np.int64)
+        i = np.searchsorted(self._keys, q)
+        i_clip = np.minimum(i, len(self._keys) - 1)
+        hit = (i < len(self._keys)) & (self._keys[i_clip] == q)
+        return self._pos[i_clip[hit]]
+
+    def position(self, key: Any) -> Optional[int]:
+        p = self.positions([key])
+        return int(p[0]) if len(p) else None
+
+    def contains(self, key: Any) -> bool:
+        return self.position(key) is not None
+
+
+__all__ = [
+    "PKIndex",
+]
@@ -0,0 +1,197 @@
+# rollup.py
+# Rollup mensual materializado: (created_ym, metric) -> count, sum, sumsq
+# - rollup_frame(): construcción vectorizada desde un DataFrame o una lista de docs
+# - rollup_delta(): "después - antes" de un conjunto de filas (upserts / deletes)
+# - apply_delta(): suma un delta al rollup (las celdas que quedan en count 0 se van)
+# - monthly_series(): serie mensual con el mismo índice que resample("M") en _MU
+# - MonthlyRollup: rollup en memoria ligado a una versión del dataset
+#
+# Las series de tiempo mensuales (SMA/EMA/MoM/CAGR/tendencia) salen de unos cientos
+# de filas del rollup en lugar de re-agrupar el dataset completo en cada cálculo.
+# El mes se toma de created_at (igual que _MU._prep_ts con esa columna); si no
+# existe, de created_ym.
+#
+# No depende de Streamlit. La persistencia vive en storage_config (sidecar local)
+# y en mongo_backend (colección <coll>_monthly).
+
+from __future__ import annotations
+
+import os
+import threading
+from typing import Any, Iterable, Mapping, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+from math_utils import resample_rule
+
+
+ROLLUP_METRICS = tuple(m for m in os.getenv("ROLLUP_METRICS", "balance").replace(" ", "").split(",") if m)
+COLUMNS = ["created_ym", "metric", "count", "sum", "sumsq"]
+
+RowsIn = Union[pd.DataFrame, Iterable[Mapping[str, Any]]]
+
+
+def _empty() -> pd.DataFrame:
+    return pd.DataFrame({
+        "created_ym": pd.Series(dtype=object), "metric": pd.Series(dtype=object),
+        "count": pd.Series(dtype="int64"), "sum": pd.Series(dtype="float64"),
+        "sumsq": pd.Series(dtype="float64"),
+    })
+
+
+def _month_keys(frame: pd.DataFrame) -> np.ndarray:
+    """yyyymm como float (NaN sin fecha)."""
+    if "created_at" in frame.columns:
+        d = pd.to_datetime(frame["created_at"], errors="coerce")
+    elif "created_ym" in frame.columns:
+        d = pd.to_datetime(frame["created_ym"].astype(object), format="%Y-%m", errors="coerce")
+    else:
+        return np.full(len(frame), np.nan)
+    return (d.dt.year * 100 + d.dt.month).to_numpy(dtype="float64", na_value=np.nan)
+
+
+def rollup_frame(rows: RowsIn, metrics: Sequence[str] = ROLLUP_METRICS) -> pd.DataFrame:
+    """count / sum / sumsq por (mes, métrica); las celdas sin fecha o sin valor no cuentan."""
+    frame = rows if isinstance(rows, pd.DataFrame) else pd.DataFrame(list(rows))
+    if frame.empty:
+        return _empty()
+    ym = _month_keys(frame)
+    parts = []
+    for m in metrics:
+        if m not in frame.columns:
+            continue
+        v = pd.to_numeric(frame[m], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+        ok = ~np.isnan(ym) & ~np.isnan(v)
+        if not ok.any():
+            continue
+        g = pd.DataFrame({"k": ym[ok].astype("int64"), "v": v[ok], "v2": v[ok] * v[ok]}).groupby("k", sort=True)
+        agg = pd.DataFrame({"count": g["v"].size(), "sum": g["v"].sum(), "sumsq": g["v2"].sum()})
+        labels = {k: f"{k // 100:04d}-{k % 100:02d}" for k in agg.index}
+        parts.append(pd.DataFrame({
+            "created_ym": [labels[k] for k in agg.index], "metric": m,
+            "count": agg["count"].to_numpy(dtype="int64"),
+            "sum": agg["sum"].to_numpy(), "sumsq": agg["sumsq"].to_numpy(),
+        }))
+    if not parts:
+        return _empty()
+    return pd.concat(parts, ignore_index=True)[COLUMNS]
+
+
+def _combine(parts: Sequence[pd.DataFrame]) -> pd.DataFrame:
+    parts = [p for p in parts if not p.empty]
+    if not parts:
+        return _empty()
+    out = pd.concat(parts, ignore_index=True).groupby(["created_ym", "metric"], sort=True, as_index=False)[
+        ["count", "sum", "sumsq"]].sum()
+    out["count"] = out["count"].astype("int64")
+    return out[COLUMNS]
+
+
+def rollup_delta(before: Optional[RowsIn], after: Optional[RowsIn], metrics: Sequence[str] = ROLLUP_METRICS) -> pd.DataFrame:
+    """
+    Delta de rollup de reemplazar las filas 'before' por 'after' (mismas PK). Un upsert
+    nuevo tiene before vacío; un delete, after vacío.
+    """
+    a = rollup_frame(after if after is not None else [], metrics)
+    b = rollup_frame(before if before is not None else [], metrics)
+    if not b.empty:
+        b = b.assign(count=-b["count"], sum=-b["sum"], sumsq=-b["sumsq"])
+    d = _combine([a, b])
+    keep = (d["count"] != 0) | (d["sum"] != 0) | (d["sumsq"] != 0)
+    return d[keep].reset_index(drop=True)
+
+
+def apply_delta(roll: pd.DataFrame, delta: pd.DataFrame) -> pd.DataFrame:
+    if delta.empty:
+        return roll
+    out = _combine([roll, delta])
+    return out[out["count"] > 0].reset_index(drop=True)
+
+
+def monthly_series(roll: pd.DataFrame, metric: str, agg: str = "sum") -> pd.Series:
+    """
+    Serie mensual (índice fin de mes, continuo; NaN en meses sin filas) como
+    _MU._prep_ts(..., "M", agg): 'sum' | 'mean' | 'count'.
+    """
+    r = roll[roll["metric"] == metric]
+    if r.empty:
+        return pd.Series(dtype=float)
+    idx = pd.to_datetime(r["created_ym"].astype(str), format="%Y-%m") + pd.offsets.MonthEnd(0)
+    cnt = pd.Series(r["count"].to_numpy(dtype="float64"), index=idx)
+    tot = pd.Series(r["sum"].to_numpy(dtype="float64"), index=idx)
+    full = pd.date_range(idx.min(), idx.max(), freq=resample_rule("M"), name="date")
+    cnt = cnt.groupby(level=0).sum().reindex(full)
+    tot = tot.groupby(level=0).sum().reindex(full)
+    if agg == "count":
+        s = cnt
+    elif agg == "mean":
+        s = tot / cnt.where(cnt > 0)
+    else:
+        s = tot.where(cnt > 0)
+    return s.rename("val")
+
+
+def monthly_stats(roll: pd.DataFrame, metric: str) -> pd.DataFrame:
+    """count, sum, mean y std (muestral, vía sumsq) por mes."""
+    s_cnt = monthly_series(roll, metric, "count")
+    if s_cnt.empty:
+        return pd.DataFrame(columns=["count", "sum", "mean", "std"])
+    s_sum = monthly_series(roll, metric, "sum")
+    r = roll[roll["metric"] == metric]
+    idx = pd.to_datetime(r["created_ym"].astype(str), format="%Y-%m") + pd.offsets.MonthEnd(0)
+    sq = pd.Series(r["sumsq"].to_numpy(dtype="float64"), index=idx).groupby(level=0).sum().reindex(s_cnt.index)
+    n = s_cnt.where(s_cnt > 0)
+    var = (sq - s_sum * s_sum / n) / (n - 1)
+    return pd.DataFrame({
+        "count": s_cnt.fillna(0).astype("int64"), "sum": s_sum, "mean": s_sum / n,
+        "std": np.sqrt(var.clip(lower=0)).where(n > 1),
+    })
+
+
+class MonthlyRollup:
+    """
+    Rollup en memoria del dataset publicado. 'version' es la del DatasetCache a la que
+    corresponde: advance() aplica el delta de una escritura solo si el rollup estaba
+    al día con la versión anterior; si no, el siguiente current() lo reconstruye.
+    """
+
+    def __init__(self, metrics: Sequence[str] = ROLLUP_METRICS) -> None:
+        self.metrics = tuple(metrics)
+        self._lock = threading.Lock()
+        self.frame = _empty()
+        self.version: Optional[int] = None
+
+    def current(self, version: int, df: pd.DataFrame) -> pd.DataFrame:
+        with self._lock:
+            if self.version != version:
+                self.frame = rollup_frame(df, self.metrics)
+                self.version = version
+            return self.frame
+
+    def load(self, frame: pd.DataFrame, version: int) -> None:
+        with self._lock:
+            self.frame = frame[COLUMNS].reset_index(drop=True)
+            self.version = version
+
+    def advance(self, from_version: int, to_version: int, before: Optional[RowsIn], after: Optional[RowsIn]) -> bool:
+        with self._lock:
+            if self.version != from_version:
+                return False
+            self.frame = apply_delta(self.frame, rollup_delta(before, after, self.metrics))
+            self.version = to_version
+            return True
+
+    def series(self, metric: str, agg: str = "sum") -> pd.Series:
+        return monthly_series(self.frame, metric, agg)
+
+
+__all__ = [
+    "ROLLUP_METRICS",
+    "MonthlyRollup",
+    "rollup_frame",
+    "rollup_delta",
+    "apply_delta",
+    "monthly_series",
+    "monthly_stats",
+]
@@ -0,0 +1,287 @@
+# sampling.py
+# Muestreo estratificado para Analytics aproximado sobre datasets grandes
+# - stratified_sample(): muestra sin reemplazo con asignación proporcional por estrato
+#   (p.ej. created_ym o sex); cada fila lleva su peso N_h / n_h
+# - SampleStore: una muestra por versión del dataset (se reusa entre reruns/sesiones)
+# - describe_ci / percentiles_ci / outlier_counts_ci / correlation_ci: estimadores
+#   con intervalos de confianza (normal para la media, ajustado por curtosis para la
+#   desviación, CDF ponderada para cuantiles, Fisher z para correlaciones)
+# - Sample.scaled(): columnas multiplicadas por el peso, para que las sumas por
+#   periodo de las series estimen las del dataset completo
+#
+# Las llaves de salida son las de _MU (app.py); cada valor es (estimado, lo, hi).
+#
+# No depende de Streamlit.
+
+from __future__ import annotations
+
+import math
+import threading
+from statistics import NormalDist
+from typing import Any, Dict, Hashable, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+Estimate = Tuple[float, float, float]
+
+_NAN3: Estimate = (math.nan, math.nan, math.nan)
+
+
+def _z(conf: float) -> float:
+    return NormalDist().inv_cdf(0.5 + float(conf) / 2.0)
+
+
+class Sample:
+    """
+    Muestra estratificada: 'frame' son las filas elegidas (orden original), 'strata'
+    el código de estrato de cada una y 'weights' su peso N_h / n_h.
+    """
+
+    def __init__(self, frame: pd.DataFrame, strata: np.ndarray, pop_sizes: np.ndarray,
+                 sample_sizes: np.ndarray, population: int, by: Optional[str]) -> None:
+        self.frame = frame
+        self.strata = strata
+        self.pop_sizes = pop_sizes
+        self.sample_sizes = sample_sizes
+        self.population = int(population)
+        self.by = by
+        self.weights = (pop_sizes / np.maximum(sample_sizes, 1))[strata].astype("float64")
+
+    @property
+    def n(self) -> int:
+        return len(self.frame)
+
+    @property
+    def exact(self) -> bool:
+        return self.n >= self.population
+
+    def values(self, col: str) -> np.ndarray:
+        return pd.to_numeric(self.frame[col], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+
+    def scaled(self, cols: Sequence[str]) -> pd.DataFrame:
+        """Copia del frame con 'cols' multiplicadas por el peso (estimadores de suma)."""
+        out = self.frame.copy()
+        for c in cols:
+            if c in out.columns:
+                out[c] = self.values(c) * self.weights
+        return out
+
+
+def stratified_sample(df: pd.DataFrame, n: int, by: Optional[str] = None, seed: int = 0) -> Sample:
+    """
+    n filas sin reemplazo, repartidas en proporción al tamaño de cada estrato de 'by'
+    (NaN es un estrato más). Cada estrato aporta al menos min(2, N_h) filas para poder
+    estimar su varianza; los estratos cuya cuota proporcional no llega a 2 filas se
+    juntan en uno solo, así el total es siempre n. Sin 'by', muestreo aleatorio simple.
+    """
+    N = len(df)
+    if by is not None and by in df.columns:
+        codes, _ = pd.factorize(np.asarray(df[by], dtype=object), use_na_sentinel=False)
+        codes = codes.astype("int64", copy=False)
+    else:
+        by = None
+        codes = np.zeros(N, dtype="int64")
+    pop = np.bincount(codes, minlength=1).astype("int64")
+    n = int(n)
+    if n <= 0 or n >= N:
+        return Sample(df, codes, pop, pop.copy(), N, by)
+
+    # estratos chicos (cuota < 2 filas) -> un estrato combinado
+    small = n * pop / N < 2
+    if small.sum() > 1:
+        remap = np.cumsum(~small) - 1
+        remap[small] = int((~small).sum())
+        codes = remap[codes]
+        pop = np.bincount(codes).astype("int64")
+
+    # mínimo por estrato + el resto en proporción (mayor residuo); suma exactamente n
+    floor = np.minimum(pop, 2)
+    if int(floor.sum()) > n:
+        floor = np.zeros_like(pop)
+    room = pop - floor
+    share = (n - int(floor.sum())) * room / max(int(room.sum()), 1)
+    alloc = np.floor(share).astype("int64")
+    rest = n - int(floor.sum()) - int(alloc.sum())
+    if rest > 0:
+        alloc[np.argsort(-(share - alloc), kind="stable")[:rest]] += 1
+    alloc = np.minimum(room, alloc) + floor
+
+    # una clave aleatoria por fila: las primeras n_h de cada estrato
+    r = np.random.default_rng(seed).random(N)
+    order = np.lexsort((r, codes))
+    starts = np.concatenate([[0], np.cumsum(pop)[:-1]])
+    sc = codes[order]
+    take = np.sort(order[(np.arange(N) - starts[sc]) < alloc[sc]])
+    return Sample(df.iloc[take], codes[take], pop, alloc, N, by)
+
+
+class SampleStore:
+    """Última muestra por (versión, n, estrato, semilla); version=None no se cachea."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._key: Optional[Tuple[Hashable, ...]] = None
+        self._sample: Optional[Sample] = None
+
+    def get(self, version: Optional[int], df: pd.DataFrame, n: int,
+            by: Optional[str] = None, seed: int = 0) -> Sample:
+        if version is None:
+            return stratified_sample(df, n, by=by, seed=seed)
+        key = (version, int(n), by, seed)
+        with self._lock:
+            if self._key != key or self._sample is None:
+                self._sample = stratified_sample(df, n, by=by, seed=seed)
+                self._key = key
+            return self._sample
+
+
+# --------- estimadores ---------
+
+def _weighted_quantiles(v: np.ndarray, w: np.ndarray, qs: Sequence[float]) -> np.ndarray:
+    order = np.argsort(v, kind="stable")
+    cw = np.cumsum(w[order])
+    idx = np.searchsorted(cw, np.clip(np.asarray(qs, dtype=float), 0.0, 1.0) * cw[-1], side="left")
+    return v[order][np.minimum(idx, len(v) - 1)]
+
+
+def _n_eff(w: np.ndarray) -> float:
+    return float(w.sum() ** 2 / (w * w).sum()) if w.size else 0.0
+
+
+def _quantile_ci(v: np.ndarray, w: np.ndarray, q: float, zc: float) -> Estimate:
+    h = zc * math.sqrt(q * (1.0 - q) / max(_n_eff(w), 1.0))
+    est, lo, hi = _weighted_quantiles(v, w, [q, q - h, q + h])
+    return float(est), float(lo), float(hi)
+
+
+def _clean(sample: Sample, col: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    v = sample.values(col)
+    ok = ~np.isnan(v)
+    return v[ok], sample.weights[ok], sample.strata[ok]
+
+
+def _std_ci(v: np.ndarray, w: np.ndarray, mean: float, std: float, zc: float) -> Tuple[float, float]:
+    """
+    IC de la desviación sin suponer normalidad: Var(s²) ≈ (m4 - m2²·(n-3)/(n-1)) / n
+    con los momentos centrales ponderados (la curtosis entra por m4); el intervalo se
+    arma en escala log de s² y se vuelve a la raíz, así no cruza el cero.
+    """
+    ne = max(_n_eff(w), 2.0)
+    if std <= 0 or v.size < 2:
+        return std, std
+    d2 = (v - mean) ** 2
+    m2 = float((w * d2).sum() / w.sum())
+    m4 = float((w * d2 * d2).sum() / w.sum())
+    var_s2 = max(m4 - m2 * m2 * (ne - 3.0) / (ne - 1.0), 0.0) / ne
+    h = zc * math.sqrt(var_s2) / (std * std)
+    return std * math.exp(-h / 2.0), std * math.exp(h / 2.0)
+
+
+def describe_ci(sample: Sample, col: str, conf: float = 0.95) -> Dict[str, Estimate]:
+    """mean / median / std / sum con IC; la media usa el estimador estratificado."""
+    v, w, h = _clean(sample, col)
+    if v.size == 0:
+        return {"mean": _NAN3, "median": _NAN3, "std": _NAN3, "sum": _NAN3}
+    zc = _z(conf)
+    k = len(sample.pop_sizes)
+    n_h = np.bincount(h, minlength=k).astype(float)
+    s1 = np.bincount(h, weights=v, minlength=k)
+    s2 = np.bincount(h, weights=v * v, minlength=k)
+    has = n_h > 0
+    # tamaño poblacional no nulo estimado por estrato
+    N_h = np.where(has, sample.pop_sizes * n_h / np.maximum(sample.sample_sizes, 1), 0.0)
+    mean_h = np.where(has, s1 / np.maximum(n_h, 1), 0.0)
+    var_h = np.where(n_h > 1, (s2 - n_h * mean_h ** 2) / np.maximum(n_h - 1, 1), 0.0).clip(min=0)
+    Np = float(N_h.sum())
+    W = N_h / Np
+    mean = float((W * mean_h).sum())
+    fpc = np.where(has, 1.0 - n_h / np.maximum(N_h, 1), 0.0).clip(min=0)
+    se_mean = math.sqrt(float((W * W * fpc * var_h / np.maximum(n_h, 1)).sum()))
+
+    sw = float(w.sum())
+    var = float((w * (v - mean) ** 2).sum()) / max(sw - 1.0, 1.0) if v.size > 1 else 0.0
+    std = math.sqrt(var)
+    lo_std, hi_std = _std_ci(v, w, mean, std, zc) if not sample.exact else (std, std)
+
+    med = (float(np.median(v)),) * 3 if sample.exact else _quantile_ci(v, w, 0.5, zc)
+    return {
+        "mean": (mean, mean - zc * se_mean, mean + zc * se_mean),
+        "median": med,
+        "std": (std, lo_std, hi_std),
+        "sum": (Np * mean, Np * (mean - zc * se_mean), Np * (mean + zc * se_mean)),
+    }
+
+
+def percentiles_ci(sample: Sample, col: str, conf: float = 0.95) -> Dict[str, Estimate]:
+    """p25 / p50 / p75 con IC por rangos de la CDF ponderada; IQR con IC conservador."""
+    v, w, _ = _clean(sample, col)
+    if v.size == 0:
+        return {"p25": _NAN3, "p50": _NAN3, "p75": _NAN3, "iqr": _NAN3}
+    if sample.exact:
+        p = [float(x) for x in np.percentile(v, [25, 50, 75])]
+        return {"p25": (p[0],) * 3, "p50": (p[1],) * 3, "p75": (p[2],) * 3, "iqr": (p[2] - p[0],) * 3}
+    zc = _z(conf)
+    p25, p50, p75 = (_quantile_ci(v, w, q, zc) for q in (0.25, 0.5, 0.75))
+    iqr = (p75[0] - p25[0], max(0.0, p75[1] - p25[2]), p75[2] - p25[1])
+    return {"p25": p25, "p50": p50, "p75": p75, "iqr": iqr}
+
+
+def outlier_counts_ci(sample: Sample, col: str, z: float = 3.0, k: float = 1.5,
+                      conf: float = 0.95) -> Dict[str, Any]:
+    """Filas estimadas fuera de mean ± z·std y de las vallas de Tukey, con IC binomial."""
+    v = sample.values(col)
+    ok = ~np.isnan(v)
+    N = sample.population
+    d = describe_ci(sample, col, conf)
+    p = percentiles_ci(sample, col, conf)
+    mean, sd = d["mean"][0], d["std"][0]
+    q1, q3, iqr = p["p25"][0], p["p75"][0], p["iqr"][0]
+    flags = {
+        "z": ok & (np.abs(v - mean) > z * sd) if np.isfinite(sd) and sd != 0 else np.zeros(len(v), bool),
+        "iqr": ok & ((v < q1 - k * iqr) | (v > q3 + k * iqr)) if np.isfinite(iqr) else np.zeros(len(v), bool),
+    }
+    zc = _z(conf)
+    n_eff = max(_n_eff(sample.weights), 1.0)
+    out: Dict[str, Any] = {"total": N}
+    for name, f in flags.items():
+        est = float(sample.weights[f].sum())
+        if sample.exact:
+            out[name] = (est, est, est)
+            continue
+        pr = est / N if N else 0.0
+        h = zc * N * math.sqrt(pr * (1.0 - pr) / n_eff)
+        out[name] = (est, max(0.0, est - h), min(float(N), est + h))
+    return out
+
+
+def correlation_ci(corr: pd.DataFrame, n: int, method: str = "pearson",
+                   conf: float = 0.95) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    (lo, hi) por celda vía transformada de Fisher; errores estándar de Fieller et al.
+    para spearman (1.06/(n-3)) y kendall (0.437/(n-4)).
+    """
+    if method == "kendall":
+        se = math.sqrt(0.437 / max(n - 4, 1))
+    elif method == "spearman":
+        se = math.sqrt(1.06 / max(n - 3, 1))
+    else:
+        se = 1.0 / math.sqrt(max(n - 3, 1))
+    r = corr.to_numpy(dtype="float64").clip(-0.999999, 0.999999)
+    zr = np.arctanh(r)
+    h = _z(conf) * se
+    lo = pd.DataFrame(np.tanh(zr - h), index=corr.index, columns=corr.columns)
+    hi = pd.DataFrame(np.tanh(zr + h), index=corr.index, columns=corr.columns)
+    return lo, hi
+
+
+__all__ = [
+    "Sample",
+    "SampleStore",
+    "stratified_sample",
+    "describe_ci",
+    "percentiles_ci",
+    "outlier_counts_ci",
+    "correlation_ci",
+]
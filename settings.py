@@ -36,6 +36,9 @@ DEFAULT_ORDER_DIR = _getenv_str("DEFAULT_ORDER_DIR", "asc")  # asc|desc
 # ---------- Features ----------
 ENABLE_ANALYTICS   = _getenv_bool("ENABLE_ANALYTICS", True)     # habilita pestaña Analytics
 ENABLE_MONGO_SYNC  = _getenv_bool("ENABLE_MONGO_SYNC", True)    # escribe/borra también en Mongo
+MONGO_PUSHDOWN     = _getenv_bool("MONGO_PUSHDOWN", False)      # filtros/orden/páginas de Dashboard y Registros en Mongo
+MONGO_LIVE         = _getenv_bool("MONGO_LIVE", True)           # con Mongo como fuente: aplica cambios en vivo (change streams / polling)
+MONGO_LIVE_POLL_S  = _getenv_float("MONGO_LIVE_POLL_S", 2.0)    # intervalo del polling (standalone) y del auto-refresh de la UI
 
 
 # ---------- Heurísticas de tipos ----------
@@ -53,6 +56,12 @@ DATE_HINTS = tuple(
     ).replace(" ", "").split(",")
 )
 
+# Columnas de baja cardinalidad que se guardan como category (códigos + diccionario)
+CATEGORY_COLS = tuple(
+    _getenv_str("CATEGORY_COLS", "sex,job_title,created_ym").replace(" ", "").split(",")
+)
+CATEGORY_MAX_CARD = _getenv_int("CATEGORY_MAX_CARD", 5000)   # más valores distintos -> se queda como texto
+
 
 # ---------- Analytics ----------
 ANALYTICS_CORR_METHOD   = _getenv_str("ANALYTICS_CORR_METHOD", "pearson")  # pearson|spearman|kendall
@@ -65,6 +74,11 @@ QUANTILE_BUCKETS        = _getenv_int("QUANTILE_BUCKETS", 10)
 TIME_GROUPING_FREQ      = _getenv_str("TIME_GROUPING_FREQ", "M")           # D|W|M
 CACHE_TTL_SECONDS       = _getenv_int("CACHE_TTL_SECONDS", 60)             # cache de @st.cache_data
 ANALYTICS_MAX_ROWS      = _getenv_int("ANALYTICS_MAX_ROWS", 500_000)       # límite de filas para cálculos pesados
+ANALYTICS_BACKEND       = _getenv_str("ANALYTICS_BACKEND", "pandas")       # pandas|mongo (pipelines en el servidor)
+ANALYTICS_ONLINE_STATS  = _getenv_bool("ANALYTICS_ONLINE_STATS", True)     # KPIs desde acumuladores en línea (online_stats)
+ANALYTICS_SKETCH_ALPHA  = _getenv_float("ANALYTICS_SKETCH_ALPHA", 0.001)   # error relativo de percentiles/outliers aproximados
+ANALYTICS_SAMPLE_STRATA = _getenv_str("ANALYTICS_SAMPLE_STRATA", "created_ym")  # estrato del modo aproximado (si existe; si no, sex)
+ANALYTICS_CONFIDENCE    = _getenv_float("ANALYTICS_CONFIDENCE", 0.95)      # nivel de los intervalos del modo aproximado
 
 
 # ---------- Límites anti-OOM / integración con Spark ----------
@@ -82,5 +96,14 @@ SPARK_READ_LIMIT  = _getenv_int("SPARK_READ_LIMIT", 200_000)
 # ---------- Notas ----------
 # - La app también lee otras ENV fuera de este archivo:
 #   USE_SPARK, USE_SPARK_MONGO, USE_MONGO_PIPELINE,
+#   USE_MONGO_SOURCE (dataset desde Mongo), MONGO_LOADER (pymongo|spark),
 #   DATA_DIR, CSV_FILE, MONGO_URI, MONGO_DB, MONGO_COLL, DISABLE_MONGO.
+# - storage_config.py lee STORE_FORMAT (parquet|csv), STORE_FILE, PARQUET_COMPRESSION, CSV_CHUNK_ROWS y WAL_COMPACT_ROWS.
+# - mongo_sync.py lee MONGO_SYNC_WORKERS, MONGO_SYNC_BATCH_BYTES y MONGO_SYNC_RETRIES.
+# - mongo_backend.py lee:
+#   MONGO_SCAN_WORKERS, MONGO_SCAN_EXECUTOR (thread|process): lectura particionada;
+#   MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE, MONGO_MAX_IDLE_MS, MONGO_HEALTH_CHECK_S: pool de clientes;
+#   MONGO_ROLLUP, MONGO_ROLLUP_SUFFIX, MONGO_ROLLUP_REBUILD_S: rollup mensual (<coll>_monthly)
+#   y cada cuántos segundos se reconstruye completo para corregir deriva.
+# - rollup.py lee ROLLUP_METRICS (métricas del rollup mensual, por defecto balance).
 # - Todas pueden ir en tu .env en la raíz del proyecto.
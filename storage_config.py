@@ -2,6 +2,11 @@
 # Utilidades de almacenamiento local (y opcional S3) para tu CRUD.
 # - Administra DATA_DIR / CSV_FILE desde .env
 # - Lectura/Escritura robusta de CSV con backups y escritura atómica
+# - Ingesta por chunks (memoria acotada) con detección de encoding y progreso por bytes
+# - Store columnar Parquet (si pyarrow está disponible) como almacenamiento principal tipado;
+#   el CSV queda como ruta de importación/exportación
+# - Change log append-only (WAL JSONL) junto al archivo base: upserts/deletes por PK
+#   que se mezclan al leer y se compactan periódicamente en el archivo base
 # - Lock de archivo (si portalocker está disponible) para evitar corrupciones en concurrencia
 # - Helpers opcionales para S3 (si boto3 está instalado y se configuran credenciales)
 #
@@ -11,11 +16,15 @@ from __future__ import annotations
 
 import os
 import io
+import json
+import codecs
+import math
 import shutil
 import hashlib
-from datetime import datetime
-from typing import Optional, Tuple, List
+from datetime import datetime, date
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Tuple, List
 
+import numpy as np
 import pandas as pd
 from dotenv import load_dotenv
 
@@ -27,6 +36,17 @@ CSV_FILE = os.getenv("CSV_FILE", "people-1000000.csv")  # mismo default que app.
 BACKUP_ON_WRITE = os.getenv("BACKUP_ON_WRITE", "true").lower() == "true"
 BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", "7"))  # cuántos backups rotar
 
+# Store columnar: "parquet" (default) o "csv" para seguir usando solo el CSV
+STORE_FORMAT = os.getenv("STORE_FORMAT", "parquet").strip().lower()
+STORE_FILE = os.getenv("STORE_FILE", "")  # vacío -> <CSV_FILE sin extensión>.parquet
+PARQUET_COMPRESSION = os.getenv("PARQUET_COMPRESSION", "snappy")
+
+# Ingesta CSV por chunks (filas por chunk)
+CSV_CHUNK_ROWS = int(os.getenv("CSV_CHUNK_ROWS", "200000"))
+
+# Change log: compactar en el archivo base al superar este número de entradas
+WAL_COMPACT_ROWS = int(os.getenv("WAL_COMPACT_ROWS", "5000"))
+
 # Opcional S3
 USE_S3 = os.getenv("USE_S3", "false").lower() == "true"
 S3_BUCKET = os.getenv("S3_BUCKET", "")
@@ -42,6 +62,14 @@ except Exception:
     _HAS_PORTALOCKER = False
 
 
+# pyarrow es opcional: sin él seguimos trabajando solo con CSV.
+try:
+    import pyarrow  # type: ignore  # noqa: F401
+    _HAS_ARROW = True
+except Exception:
+    _HAS_ARROW = False
+
+
 class _NullLock:
     def __init__(self, *_a, **_kw): ...
     def __enter__(self): return self
@@ -76,6 +104,18 @@ def get_csv_path() -> str:
     return os.path.join(base, CSV_FILE)
 
 
+def columnar_enabled() -> bool:
+    """True si el store principal es Parquet (STORE_FORMAT=parquet y pyarrow instalado)."""
+    return STORE_FORMAT == "parquet" and _HAS_ARROW
+
+
+def get_store_path() -> str:
+    """Ruta absoluta del store columnar (Parquet)."""
+    base = ensure_data_dir()
+    name = STORE_FILE or f"{os.path.splitext(CSV_FILE)[0]}.parquet"
+    return os.path.join(base, name)
+
+
 def get_backup_dir() -> str:
     """Subcarpeta para backups dentro de DATA_DIR."""
     base = ensure_data_dir()
@@ -100,6 +140,25 @@ def sha256_file(path: str) -> Optional[str]:
         return None
 
 
+def file_fingerprint(*paths: str, strong: bool = False) -> Tuple:
+    """
+    Huella barata de uno o más archivos: (ruta, mtime_ns, tamaño) por archivo, o
+    (ruta, None, None) si no existe. Con strong=True usa sha256_file (lee todo).
+    """
+    out = []
+    for p in paths:
+        try:
+            st_ = os.stat(p)
+        except OSError:
+            out.append((p, None, None))
+            continue
+        if strong:
+            out.append((p, sha256_file(p), st_.st_size))
+        else:
+            out.append((p, st_.st_mtime_ns, st_.st_size))
+    return tuple(out)
+
+
 # ========= Backups =========
 
 def make_backup(path: str) -> Optional[str]:
@@ -118,17 +177,17 @@ def rotate_backups(keep: int = BACKUP_KEEP) -> None:
     bdir = get_backup_dir()
     try:
         files = [os.path.join(bdir, f) for f in os.listdir(bdir) if f.endswith(".bak")]
-        # Agrupar por base (todo antes del primer '.YYYYMMDD-...')
-        def _key(p: str) -> Tuple[str, float]:
-            return (os.path.basename(p).split(".")[0], os.path.getmtime(p))
+        # Agrupar por archivo base (todo antes de '.YYYYMMDD-HHMMSS.bak'),
+        # así 'x.csv' y 'x.parquet' rotan por separado
+        def _base(p: str) -> str:
+            return os.path.basename(p).rsplit(".", 2)[0]
         # Orden por base y por fecha descendente
-        files.sort(key=lambda p: (_key(p)[0], _key(p)[1]), reverse=True)
+        files.sort(key=lambda p: (_base(p), os.path.getmtime(p)), reverse=True)
 
         # Mantener por grupo
         seen = {}
         for p in files:
-            base = os.path.basename(p).split(".")[0]
-            seen.setdefault(base, []).append(p)
+            seen.setdefault(_base(p), []).append(p)
         for base, group in seen.items():
             for old in group[keep:]:
                 try:
@@ -154,8 +213,9 @@ def read_csv_resilient(path: Optional[str] = None) -> pd.DataFrame:
         pd.DataFrame().to_csv(path, index=False)
         return pd.DataFrame()
 
-    # Intentos de lectura
+    # Intentos de lectura: primero el encoding detectado (una sola pasada en el caso normal)
     attempts = [
+        dict(encoding=detect_encoding(path), engine="c"),
         dict(encoding="utf-8", engine="c"),
         dict(encoding="utf-8", engine="python"),
         dict(encoding="utf-8-sig", engine="c"),
@@ -172,6 +232,161 @@ def read_csv_resilient(path: Optional[str] = None) -> pd.DataFrame:
     return pd.DataFrame()
 
 
+# ========= Ingesta por chunks =========
+# Progreso: callback(bytes_leidos, bytes_totales, filas_leidas)
+ProgressFn = Callable[[int, int, int], None]
+
+
+def detect_encoding(path: str, sample_bytes: int = 1 << 16) -> str:
+    """
+    Detecta el encoding con una muestra de bytes (sin parsear el CSV):
+    utf-8-sig si hay BOM, utf-8 si decodifica, cp1252 si decodifica, si no latin-1.
+    """
+    try:
+        with open(path, "rb") as f:
+            sample = f.read(sample_bytes)
+    except Exception:
+        return "utf-8"
+    if sample.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    for enc in ("utf-8", "cp1252"):
+        try:
+            # decoder incremental: tolera un carácter multibyte cortado al final de la muestra
+            codecs.getincrementaldecoder(enc)().decode(sample, final=False)
+            return enc
+        except UnicodeDecodeError:
+            continue
+    return "latin-1"
+
+
+def iter_csv_chunks(
+    path: Optional[str] = None,
+    chunksize: int = CSV_CHUNK_ROWS,
+    dtype: Any = str,
+    encoding: Optional[str] = None,
+    progress: Optional[ProgressFn] = None,
+) -> Iterator[pd.DataFrame]:
+    """
+    Itera el CSV en chunks de 'chunksize' filas con un solo parser (engine C).
+    dtype=str por defecto: el esquema es estable entre chunks y la tipificación
+    queda a cargo del normalizador (y de restore_csv_dtypes sobre el total, para las
+    columnas que el normalizador deja como texto). 'progress' recibe bytes consumidos.
+    """
+    if path is None:
+        path = get_csv_path()
+    if not os.path.isfile(path):
+        return
+    total = os.path.getsize(path)
+    enc = encoding or detect_encoding(path)
+    rows = 0
+    with open(path, "rb") as fb:
+        try:
+            reader = pd.read_csv(fb, encoding=enc, engine="c", dtype=dtype, chunksize=int(max(1, chunksize)))
+        except pd.errors.EmptyDataError:
+            return
+        with reader:
+            for chunk in reader:
+                rows += len(chunk)
+                if progress is not None:
+                    progress(min(fb.tell(), total), total, rows)
+                yield chunk
+
+
+_BOOL_TEXT = {"True": True, "False": False, "TRUE": True, "FALSE": False, "true": True, "false": False}
+
+
+def restore_csv_dtypes(df: pd.DataFrame, keep_text: Iterable[str] = ()) -> pd.DataFrame:
+    """
+    Tipos que habría inferido pd.read_csv sobre el archivo completo, para las columnas
+    que quedaron como texto tras leer con dtype=str: todo numérico -> int64 (o float64
+    si hay nulos / decimales), todo True/False -> bool. 'keep_text' son las columnas que
+    el normalizador convierte a texto a propósito (no se tocan).
+    """
+    skip = set(keep_text)
+    for c in df.columns:
+        s = df[c]
+        if c in skip or not (s.dtype == object or pd.api.types.is_string_dtype(s.dtype)):
+            continue
+        present = s.notna()
+        if not present.any():
+            continue
+        vals = s[present]
+        if s.dtype == object and not vals.map(lambda v: isinstance(v, str)).all():
+            continue
+        # descarte barato con las primeras filas antes de convertir toda la columna
+        head = vals.iloc[:256]
+        if pd.to_numeric(head, errors="coerce").notna().all():
+            num = pd.to_numeric(s, errors="coerce")
+            if num[present].notna().all():
+                df[c] = num
+                continue
+        if present.all() and head.isin(list(_BOOL_TEXT)).all() and vals.isin(list(_BOOL_TEXT)).all():
+            df[c] = vals.map(_BOOL_TEXT).astype(bool)
+    return df
+
+
+def _fix_pk(df: pd.DataFrame, pk: str = "id") -> pd.DataFrame:
+    """
+    Regla de PK a nivel dataset: si falta, hay nulos o duplicados, renumera 1..n.
+    Se aplica una sola vez sobre el total (los chunks llegan con la PK sin arreglar).
+    """
+    if df.empty:
+        return df
+    ids = pd.to_numeric(df[pk], errors="coerce") if pk in df.columns else None
+    if ids is None or ids.isna().any() or ids.duplicated().any():
+        df[pk] = pd.RangeIndex(1, len(df) + 1)
+    elif pd.api.types.is_extension_array_dtype(ids.dtype):
+        # Int64 de los chunks (admite nulos) -> int64 como en una lectura completa
+        df[pk] = ids.to_numpy(dtype=ids.dtype.numpy_dtype)
+    return df
+
+
+def read_csv_chunked(
+    path: Optional[str] = None,
+    normalize: Optional[Callable[[pd.DataFrame], pd.DataFrame]] = None,
+    chunksize: int = CSV_CHUNK_ROWS,
+    progress: Optional[ProgressFn] = None,
+    pk: str = "id",
+    keep_text: Iterable[str] = (),
+) -> pd.DataFrame:
+    """
+    Lee y normaliza el CSV chunk a chunk: nunca hay en memoria el CSV crudo completo
+    junto con su versión normalizada. 'normalize' no debe aplicar la regla de PK (cada
+    chunk la aplicaría por su cuenta): va una sola vez al final sobre el total, junto
+    con restore_csv_dtypes para las columnas de texto que no son 'keep_text'.
+    """
+    parts = []
+    with file_lock(path or get_csv_path()):
+        for chunk in iter_csv_chunks(path, chunksize=chunksize, progress=progress):
+            parts.append(normalize(chunk) if normalize is not None else chunk)
+    if not parts:
+        return pd.DataFrame()
+    return _fix_pk(restore_csv_dtypes(concat_frames(parts), keep_text), pk)
+
+
+def concat_frames(parts: List[pd.DataFrame]) -> pd.DataFrame:
+    """
+    pd.concat que conserva las columnas category: une los diccionarios de todas las
+    partes antes de concatenar (si no, pandas cae a object al diferir categorías).
+    """
+    if len(parts) == 1:
+        return parts[0]
+    parts = list(parts)
+    cat_cols = {c for p in parts for c in p.columns if isinstance(p[c].dtype, pd.CategoricalDtype)}
+    for c in cat_cols:
+        cats = pd.Index([], dtype=object)
+        for p in parts:
+            if c in p.columns:
+                s = p[c]
+                vals = s.cat.categories if isinstance(s.dtype, pd.CategoricalDtype) else s.dropna().unique()
+                cats = cats.union(pd.Index(vals, dtype=object))
+        dtype = pd.CategoricalDtype(cats)
+        for i, p in enumerate(parts):
+            if c in p.columns and p[c].dtype != dtype:
+                parts[i] = p.assign(**{c: p[c].astype(dtype)})
+    return pd.concat(parts, ignore_index=True)
+
+
 def write_csv_atomic(df: pd.DataFrame, path: Optional[str] = None, backups: bool = BACKUP_ON_WRITE) -> str:
     """
     Escritura atómica de CSV:
@@ -183,8 +398,13 @@ def write_csv_atomic(df: pd.DataFrame, path: Optional[str] = None, backups: bool
     """
     if path is None:
         path = get_csv_path()
+    # utf-8 sin BOM para compatibilidad amplia
+    return _atomic_write(path, lambda tmp: df.to_csv(tmp, index=False, encoding="utf-8"), backups)
 
-    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+def _atomic_write(path: str, writer: Callable[[str], None], backups: bool) -> str:
+    """Lock + backup opcional + escritura a temporal + os.replace. Devuelve 'path'."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
     tmp = f"{path}.tmp"
 
     with file_lock(path):
@@ -194,8 +414,7 @@ def write_csv_atomic(df: pd.DataFrame, path: Optional[str] = None, backups: bool
             rotate_backups(BACKUP_KEEP)
 
         # Escribir temporal
-        # utf-8 sin BOM para compatibilidad amplia
-        df.to_csv(tmp, index=False, encoding="utf-8")
+        writer(tmp)
         # Reemplazo atómico (en Windows os.replace también sobreescribe)
         os.replace(tmp, path)
 
@@ -209,6 +428,457 @@ def df_to_csv_bytes(df: pd.DataFrame) -> bytes:
     return buf.getvalue().encode("utf-8")
 
 
+# ========= Store columnar (Parquet) =========
+
+def _arrow_safe(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Columnas object con tipos mezclados (p.ej. ObjectId, números y strings) no se
+    pueden escribir en Parquet: se pasan a string conservando los nulos.
+    """
+    out = df
+    for c in df.columns:
+        s = df[c]
+        if s.dtype != object:
+            continue
+        kind = pd.api.types.infer_dtype(s, skipna=True)
+        if kind in ("string", "empty", "floating", "integer", "boolean", "datetime", "date", "bytes"):
+            continue
+        if out is df:
+            out = df.copy()
+        out[c] = s.where(s.isna(), s.astype(str))
+    # Parquet exige nombres de columna string
+    if any(not isinstance(c, str) for c in out.columns):
+        out = out.rename(columns=str)
+    return out
+
+
+def store_is_stale(store_path: Optional[str] = None, csv_path: Optional[str] = None) -> bool:
+    """
+    True si hay que (re)importar el CSV: el store no existe o el CSV es más nuevo
+    (alguien dejó un CSV actualizado en DATA_DIR).
+    """
+    store_path = store_path or get_store_path()
+    csv_path = csv_path or get_csv_path()
+    if not os.path.isfile(store_path):
+        return True
+    if not os.path.isfile(csv_path):
+        return False
+    return os.path.getmtime(csv_path) > os.path.getmtime(store_path)
+
+
+def read_parquet_store(path: Optional[str] = None, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """Lee el store Parquet con tipos ya normalizados. DataFrame vacío si no existe."""
+    if path is None:
+        path = get_store_path()
+    if not os.path.isfile(path):
+        return pd.DataFrame()
+    with file_lock(path):
+        return pd.read_parquet(path, columns=columns)
+
+
+def write_parquet_atomic(df: pd.DataFrame, path: Optional[str] = None, backups: bool = BACKUP_ON_WRITE) -> str:
+    """
+    Escritura atómica del store Parquet, con la misma semántica que write_csv_atomic
+    (lock, backup rotado, temporal + os.replace). Devuelve la ruta final escrita.
+    """
+    if not _HAS_ARROW:
+        raise RuntimeError("pyarrow no está instalado. Instala con: pip install pyarrow")
+    if path is None:
+        path = get_store_path()
+    safe = _arrow_safe(df)
+    return _atomic_write(
+        path,
+        lambda tmp: safe.to_parquet(tmp, index=False, compression=PARQUET_COMPRESSION),
+        backups,
+    )
+
+
+def _stream_csv_to_parquet(
+    csv_path: str,
+    tmp: str,
+    normalize: Optional[Callable[[pd.DataFrame], pd.DataFrame]],
+    chunksize: int,
+    progress: Optional[ProgressFn],
+    pk: str,
+) -> Tuple[int, bool]:
+    """
+    Escribe el CSV normalizado a 'tmp' como Parquet, un row group por chunk.
+    Devuelve (filas, hay_que_renumerar_pk): falta la PK, hay nulos o se repite entre
+    chunks. Lanza excepción si el esquema cambia.
+    """
+    import pyarrow as pa  # type: ignore
+    import pyarrow.parquet as pq  # type: ignore
+
+    writer = None
+    schema = None
+    ids: List[np.ndarray] = []
+    bad_pk = False
+    rows = 0
+    try:
+        for chunk in iter_csv_chunks(csv_path, chunksize=chunksize, progress=progress):
+            if normalize is not None:
+                chunk = normalize(chunk)
+            if pk in chunk.columns:
+                k = pd.to_numeric(chunk[pk], errors="coerce")
+                bad_pk = bad_pk or bool(k.isna().any())
+                ids.append(k.to_numpy(dtype="float64", na_value=np.nan))
+            else:
+                bad_pk = True
+            table = pa.Table.from_pandas(_arrow_safe(chunk), preserve_index=False)
+            if writer is None:
+                # columnas vacías en el primer chunk (tipo null) -> string
+                # category -> diccionario con índices int32: cada chunk trae su propio
+                # diccionario y no debe desbordar el ancho de índice del primero
+                schema = pa.schema([
+                    f.with_type(pa.string()) if pa.types.is_null(f.type)
+                    else f.with_type(pa.dictionary(pa.int32(), f.type.value_type)) if pa.types.is_dictionary(f.type)
+                    else f
+                    for f in table.schema
+                ]).remove_metadata()
+                writer = pq.ParquetWriter(tmp, schema, compression=PARQUET_COMPRESSION)
+            writer.write_table(table.select(schema.names).cast(schema))
+            rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        raise ValueError("CSV sin filas")
+    if ids and not bad_pk:
+        all_ids = np.concatenate(ids)
+        bad_pk = len(np.unique(all_ids)) != len(all_ids)
+    return rows, bad_pk
+
+
+def import_csv_to_store(
+    csv_path: Optional[str] = None,
+    store_path: Optional[str] = None,
+    normalize: Optional[Callable[[pd.DataFrame], pd.DataFrame]] = None,
+    chunksize: int = CSV_CHUNK_ROWS,
+    progress: Optional[ProgressFn] = None,
+    pk: str = "id",
+    keep_text: Iterable[str] = (),
+) -> pd.DataFrame:
+    """
+    Importa el CSV al store Parquet en streaming: cada chunk se normaliza con
+    'normalize' y se escribe como row group, así la memoria pico es ~1 chunk y no
+    varias veces el archivo. Devuelve el DataFrame importado (leído del Parquet).
+    Si el esquema varía entre chunks, cae a la importación en memoria. Como en
+    read_csv_chunked, la regla de PK y restore_csv_dtypes se aplican sobre el total.
+    """
+    if not _HAS_ARROW:
+        raise RuntimeError("pyarrow no está instalado. Instala con: pip install pyarrow")
+    csv_path = csv_path or get_csv_path()
+    store_path = store_path or get_store_path()
+    if not os.path.isfile(csv_path):
+        return read_csv_resilient(csv_path)
+
+    result: Dict[str, Any] = {}
+
+    def _writer(tmp: str) -> None:
+        try:
+            with file_lock(csv_path):
+                result["rows"], result["bad_pk"] = _stream_csv_to_parquet(
+                    csv_path, tmp, normalize, chunksize, progress, pk
+                )
+        except Exception:
+            # Fallback: lectura completa con reintentos de encoding
+            pdf = read_csv_resilient(csv_path)
+            if not pdf.empty and normalize is not None:
+                pdf = normalize(pdf)
+            pdf = _fix_pk(pdf, pk)
+            result["rows"], result["bad_pk"] = len(pdf), False
+            _arrow_safe(pdf).to_parquet(tmp, index=False, compression=PARQUET_COMPRESSION)
+
+    # Sin backup: el CSV de origen ya es la copia de respaldo
+    _atomic_write(store_path, _writer, backups=False)
+    if not result.get("rows"):
+        return pd.DataFrame()
+
+    pdf = read_parquet_store(store_path)
+    dtypes = pdf.dtypes.copy()
+    pdf = _fix_pk(restore_csv_dtypes(pdf, keep_text), pk)
+    if result.get("bad_pk") or not pdf.dtypes.equals(dtypes):
+        # ids nulos/duplicados entre chunks o columnas que vuelven a su tipo: se
+        # reescribe una vez con el total ya corregido
+        write_parquet_atomic(pdf, store_path, backups=False)
+    return pdf
+
+
+def export_store_to_csv(csv_path: Optional[str] = None, store_path: Optional[str] = None) -> Optional[str]:
+    """Exporta el store Parquet a CSV (escritura atómica). None si no hay store."""
+    pdf = read_parquet_store(store_path)
+    if pdf.empty:
+        return None
+    return write_csv_atomic(pdf, csv_path)
+
+
+# ========= Change log (WAL) =========
+# Formato: una entrada JSON por línea
+#   {"op": "upsert", "pk": "id", "key": 15, "row": {...}}
+#   {"op": "delete", "pk": "id", "key": 15}
+# Las entradas son idempotentes por PK: re-aplicarlas sobre un base ya compactado
+# no cambia el resultado (por eso compactar = reescribir base y luego vaciar el WAL).
+
+def get_wal_path(base_path: Optional[str] = None) -> str:
+    """Ruta del change log asociado a un archivo base (CSV o Parquet)."""
+    if base_path is None:
+        base_path = get_store_path() if columnar_enabled() else get_csv_path()
+    return f"{base_path}.wal.jsonl"
+
+
+def _json_value(v: Any) -> Any:
+    """Convierte valores de pandas/numpy a algo serializable en JSON."""
+    if v is None:
+        return None
+    if isinstance(v, (pd.Timestamp, datetime, date)):
+        return None if pd.isna(v) else v.isoformat()
+    if hasattr(v, "item") and not isinstance(v, (str, bytes)):
+        try:
+            v = v.item()  # numpy escalares -> python
+        except Exception:
+            return str(v)
+    if isinstance(v, float) and not math.isfinite(v):
+        return None
+    if isinstance(v, (str, int, float, bool)):
+        return v
+    try:
+        if pd.isna(v):
+            return None
+    except Exception:
+        pass
+    return str(v)
+
+
+def _wal_key(v: Any) -> Any:
+    """
+    Forma canónica de una PK en el change log: los números enteros (6, 6.0, "6",
+    "6.0") quedan como int para que una misma fila no aparezca con dos llaves.
+    """
+    v = _json_value(v)
+    if isinstance(v, bool) or v is None:
+        return v
+    if isinstance(v, int):
+        return v
+    if isinstance(v, str):
+        s = v.strip()
+        if s.lstrip("+-").isdigit():
+            return int(s)
+        try:
+            f = float(s)
+        except ValueError:
+            return v
+    else:
+        f = v
+    if isinstance(f, float) and math.isfinite(f) and f.is_integer():
+        return int(f)
+    return v
+
+
+def wal_append(
+    upserts: Iterable[Dict[str, Any]] = (),
+    deletes: Iterable[Any] = (),
+    pk: str = "id",
+    base_path: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Agrega upserts (filas completas) y tombstones (PKs) al change log.
+    Costo O(filas cambiadas); no toca el archivo base. Devuelve las entradas escritas
+    (las mismas que leería wal_read, listas para merge_wal).
+    """
+    entries: List[Dict[str, Any]] = []
+    for row in upserts:
+        key = _wal_key(row.get(pk))
+        if key is None or key == "":
+            continue
+        payload = {str(k): _json_value(v) for k, v in row.items()}
+        payload[str(pk)] = key
+        entries.append({"op": "upsert", "pk": pk, "key": key, "row": payload})
+    for k in deletes:
+        key = _wal_key(k)
+        if key is None or key == "":
+            continue
+        entries.append({"op": "delete", "pk": pk, "key": key})
+    if not entries:
+        return entries
+    lines = [json.dumps(e, ensure_ascii=False) for e in entries]
+
+    path = get_wal_path(base_path)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with file_lock(path):
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+    return entries
+
+
+def wal_read(base_path: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Entradas del change log en orden de escritura (ignora líneas corruptas/truncadas)."""
+    path = get_wal_path(base_path)
+    if not os.path.isfile(path):
+        return []
+    out: List[Dict[str, Any]] = []
+    with file_lock(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    out.append(json.loads(line))
+                except Exception:
+                    # una escritura cortada a la mitad solo puede ser la última línea
+                    continue
+    return out
+
+
+def wal_count(base_path: Optional[str] = None) -> int:
+    """Número de entradas pendientes de compactar."""
+    path = get_wal_path(base_path)
+    if not os.path.isfile(path):
+        return 0
+    with open(path, "rb") as f:
+        return sum(chunk.count(b"\n") for chunk in iter(lambda: f.read(1024 * 1024), b""))
+
+
+def wal_clear(base_path: Optional[str] = None) -> None:
+    """Vacía el change log (llamar solo después de reescribir el archivo base)."""
+    path = get_wal_path(base_path)
+    with file_lock(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def merge_wal(
+    base: pd.DataFrame,
+    entries: List[Dict[str, Any]],
+    pk: str = "id",
+    normalize: Optional[Callable[[pd.DataFrame], pd.DataFrame]] = None,
+    locate: Optional[Callable[[List[str]], np.ndarray]] = None,
+) -> pd.DataFrame:
+    """
+    Aplica el change log sobre 'base': la última entrada por PK gana; los deletes
+    quitan la fila. 'normalize' se aplica solo a las filas del log (no al base).
+    'locate' (opcional, p.ej. PKIndex.positions) devuelve las posiciones en 'base'
+    de las PKs tocadas y evita el isin() sobre toda la columna.
+    """
+    if not entries:
+        return base
+
+    last: Dict[str, Dict[str, Any]] = {}
+    for e in entries:
+        if e.get("pk", pk) != pk:
+            continue
+        last[str(_wal_key(e.get("key")))] = e
+    if not last:
+        return base
+
+    rows = [e.get("row") or {} for e in last.values() if e.get("op") == "upsert"]
+    add = pd.DataFrame(rows) if rows else pd.DataFrame()
+    if not add.empty and normalize is not None:
+        add = normalize(add)
+
+    if base.empty or pk not in base.columns:
+        return add.reset_index(drop=True) if not add.empty else base
+
+    numeric_pk = pd.api.types.is_numeric_dtype(base[pk])
+    if numeric_pk and not add.empty and pk in add.columns:
+        add[pk] = pd.to_numeric(add[pk], errors="coerce")
+
+    touched = list(last.keys())
+    if locate is not None:
+        mask = np.zeros(len(base), dtype=bool)
+        mask[locate(touched)] = True
+    elif numeric_pk:
+        mask = base[pk].isin(pd.to_numeric(pd.Series(touched, dtype=object), errors="coerce")).to_numpy()
+    else:
+        mask = base[pk].astype(str).isin(touched).to_numpy()
+
+    was_sorted = base[pk].is_monotonic_increasing
+    out = base[~mask] if mask.any() else base
+    if not add.empty:
+        out = concat_frames([out, add])
+    if was_sorted and pk in out.columns and not out[pk].is_monotonic_increasing:
+        out = out.sort_values(pk, kind="stable")
+    return out.reset_index(drop=True)
+
+
+# ========= Huellas sincronizadas con Mongo (sidecar) =========
+# (key, hash) de cada fila tal como quedó en Mongo tras el último sync: permite
+# planear el diff sin leer las huellas de la colección.
+
+def get_fingerprint_path(base_path: Optional[str] = None, namespace: str = "mongo") -> str:
+    """Ruta del sidecar de huellas para un archivo base y un destino (p.ej. 'db.coll')."""
+    if base_path is None:
+        base_path = get_store_path() if columnar_enabled() else get_csv_path()
+    ext = "parquet" if _HAS_ARROW else "csv"
+    return f"{base_path}.{namespace}.fp.{ext}"
+
+
+def read_fingerprints(path: str) -> Optional[pd.DataFrame]:
+    """DataFrame (key, hash) o None si no hay sidecar legible."""
+    if not os.path.exists(path):
+        return None
+    try:
+        if path.endswith(".parquet"):
+            fp = pd.read_parquet(path)
+        else:
+            fp = pd.read_csv(path, dtype=str, keep_default_na=False)
+    except Exception:
+        return None
+    if not {"key", "hash"} <= set(fp.columns):
+        return None
+    return fp[["key", "hash"]].astype(object)
+
+
+def write_fingerprints(fp: pd.DataFrame, path: str) -> str:
+    """Escritura atómica del sidecar (sin backups: se regenera en cada sync)."""
+    out = fp[["key", "hash"]].astype(str)
+    if path.endswith(".parquet"):
+        return _atomic_write(path, lambda tmp: out.to_parquet(tmp, index=False), backups=False)
+    return _atomic_write(path, lambda tmp: out.to_csv(tmp, index=False, encoding="utf-8"), backups=False)
+
+
+# ========= Sidecar de rollup mensual =========
+
+_ROLLUP_COLS = ["created_ym", "metric", "count", "sum", "sumsq"]
+
+
+def get_rollup_path(base_path: Optional[str] = None) -> str:
+    """Ruta del rollup mensual materializado junto al archivo base."""
+    if base_path is None:
+        base_path = get_store_path() if columnar_enabled() else get_csv_path()
+    ext = "parquet" if _HAS_ARROW else "csv"
+    return f"{base_path}.rollup.{ext}"
+
+
+def read_rollup(path: str) -> Optional[Tuple[pd.DataFrame, str]]:
+    """(rollup, clave del dataset con que se escribió) o None si no hay sidecar legible."""
+    if not os.path.exists(path):
+        return None
+    try:
+        if path.endswith(".parquet"):
+            roll = pd.read_parquet(path)
+        else:
+            roll = pd.read_csv(path, dtype={"created_ym": str, "metric": str, "dataset_key": str})
+    except Exception:
+        return None
+    if not set(_ROLLUP_COLS + ["dataset_key"]) <= set(roll.columns) or roll.empty:
+        return None
+    key = str(roll["dataset_key"].iloc[0])
+    return roll[_ROLLUP_COLS].astype({"count": "int64", "sum": "float64", "sumsq": "float64"}), key
+
+
+def write_rollup(roll: pd.DataFrame, path: str, key: str) -> str:
+    """Escritura atómica; 'key' identifica el estado del dataset que resume."""
+    out = roll[_ROLLUP_COLS].assign(dataset_key=str(key))
+    if path.endswith(".parquet"):
+        return _atomic_write(path, lambda tmp: out.to_parquet(tmp, index=False), backups=False)
+    return _atomic_write(path, lambda tmp: out.to_csv(tmp, index=False, encoding="utf-8"), backups=False)
+
+
 # ========= S3 (opcional) =========
 
 def _get_s3_client():
@@ -292,10 +962,41 @@ __all__ = [
     "get_backup_dir",
     "read_csv_resilient",
     "write_csv_atomic",
+    # Ingesta por chunks
+    "CSV_CHUNK_ROWS",
+    "detect_encoding",
+    "iter_csv_chunks",
+    "restore_csv_dtypes",
+    "read_csv_chunked",
+    "concat_frames",
+    "get_fingerprint_path",
+    "read_fingerprints",
+    "write_fingerprints",
+    "get_rollup_path",
+    "read_rollup",
+    "write_rollup",
+    # Store columnar
+    "STORE_FORMAT",
+    "columnar_enabled",
+    "get_store_path",
+    "store_is_stale",
+    "read_parquet_store",
+    "write_parquet_atomic",
+    "import_csv_to_store",
+    "export_store_to_csv",
+    # Change log
+    "WAL_COMPACT_ROWS",
+    "get_wal_path",
+    "wal_append",
+    "wal_read",
+    "wal_count",
+    "wal_clear",
+    "merge_wal",
     "df_to_csv_bytes",
     "make_backup",
     "rotate_backups",
     "sha256_file",
+    "file_fingerprint",
     "file_lock",
     # S3 opcional
     "USE_S3",
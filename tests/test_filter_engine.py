@@ -0,0 +1,20 @@
+import pandas as pd
+import pytest
+
+from filter_engine import FilterEngine
+
+
+def _baseline(s, q):
+    # filtro original de app.py: astype(str) + contains sin distinguir mayúsculas
+    return s.astype(str).str.contains(q, case=False, na=False, regex=False).to_numpy(dtype=bool)
+
+
+@pytest.mark.parametrize("values", [
+    ["2024-01-05", None, "2024-02-01", "2023-12-31"],
+    ["2024-01-05 10:30:00", None, "2024-02-01 00:00:00", "2023-12-31 23:59:59"],
+])
+@pytest.mark.parametrize("q", ["2024", "-01", "00:00", "10:30", "12-31", "nat", " 2"])
+def test_contains_on_datetime_matches_baseline(values, q):
+    df = pd.DataFrame({"created_at": pd.to_datetime(values)})
+    got = FilterEngine(df).contains("created_at", q)
+    assert got.tolist() == _baseline(df["created_at"], q.strip()).tolist()
@@ -0,0 +1,21 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from math_kernels import ema
+
+
+@pytest.mark.parametrize("span", [2, 3, 7, 20])
+def test_ema_matches_pandas_ewm_with_gaps(span):
+    rng = np.random.default_rng(0)
+    y = rng.normal(size=(400, 3))
+    y[rng.random(y.shape) < 0.4] = np.nan
+    y[:5, 1] = np.nan  # serie que arranca con huecos
+    expected = pd.DataFrame(y).ewm(span=span, adjust=False, min_periods=1).mean().to_numpy()
+    np.testing.assert_allclose(ema(y, span), expected, rtol=1e-10, equal_nan=True)
+
+
+def test_ema_gap_example():
+    y = pd.Series([-1.32, np.nan, 1.049])
+    expected = y.ewm(span=3, adjust=False, min_periods=1).mean().to_numpy()
+    np.testing.assert_allclose(ema(y.to_numpy(), 3), expected)
@@ -0,0 +1,149 @@
+import pandas as pd
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+from mongo_backend import _batch_frame, load_frame, load_frame_partitioned  # noqa: E402
+
+
+HETERO = [
+    {"id": "1", "name": "a"},
+    {"id": "2", "name": "b", "balance": 5.0, "sex": "Male"},
+]
+
+
+def _coll(docs):
+    coll = mongomock.MongoClient().db.customers
+    coll.insert_many([dict(d, id_num=int(d["id"])) for d in docs])
+    return coll
+
+
+def test_batch_frame_uses_union_of_keys():
+    df = _batch_frame([dict(d) for d in HETERO])
+    assert list(df.columns) == ["id", "name", "balance", "sex"]
+    assert df["balance"].isna().tolist() == [True, False]
+    assert df.loc[1, "sex"] == "Male"
+
+
+@pytest.mark.parametrize("loader", ["plain", "partitioned"])
+def test_load_frame_keeps_fields_missing_in_first_doc(loader):
+    coll = _coll(HETERO)
+    if loader == "plain":
+        df = load_frame(coll, batch_size=10)
+    else:
+        df = load_frame_partitioned(coll, workers=2, partitions=2, batch_size=10)
+    assert {"id", "name", "balance", "sex", "_id"} <= set(df.columns)
+    row = df.set_index("id").loc["2"]
+    assert row["balance"] == 5.0 and row["sex"] == "Male"
+
+
+def _same(a, b):
+    if isinstance(a, float) and isinstance(b, float) and a != a and b != b:
+        return True
+    return type(a) is type(b) and a == b
+
+
+def test_frame_normalization_matches_normalize_document_with_missing_values():
+    from mongo_backend import iter_upsert_docs, normalize_document
+
+    docs = [
+        {"id": 1, "phone": 5551234, "balance": 10.5, "age": 30, "dob": "1990-01-02", "email": " A@X.COM "},
+        {"id": 2, "phone": None, "balance": float("nan"), "age": None, "dob": None, "email": None},
+        {"id": 3, "phone": 5559876, "balance": None, "age": 41, "dob": "1985-06-30", "email": "b@x.com"},
+        {"id": None, "phone": 1, "balance": 1.0, "age": 1, "dob": None, "email": "c@x.com"},
+        {"id": "4", "phone": "555", "balance": "7", "first_name": "Ana", "last_name": "Ruiz"},
+    ]
+    expected = [normalize_document(dict(d)) for d in docs]
+    expected = [d for d in expected if d["id"]]
+    got = list(iter_upsert_docs([dict(d) for d in docs], with_hash=False, chunk_rows=3))
+    assert len(got) == len(expected)
+    for g, e in zip(got, expected):
+        assert set(g) == set(e), (g, e)
+        for k in e:
+            assert _same(g[k], e[k]), (k, g[k], e[k])
+    assert [g["id"] for g in got] == ["1", "2", "3", "4"]
+    assert got[0]["phone"] == "5551234"
+
+
+def test_fingerprints_match_between_frame_and_dict_rows():
+    from mongo_backend import frame_fingerprints
+
+    df = pd.DataFrame({
+        "id": ["1", "2", "3"],
+        "index_original": [10, 11, 12],
+        "balance": [1.5, None, 3.0],
+        "name": ["a", "b", None],
+    })
+    from_frame = frame_fingerprints(df)
+    from_dicts = frame_fingerprints(df.to_dict("records"))
+    assert from_frame["hash"].tolist() == from_dicts["hash"].tolist()
+
+
+def test_partitioned_limit_fills_from_docs_without_numeric_id():
+    coll = mongomock.MongoClient().db.customers
+    coll.insert_many([{"id": str(i), "id_num": i} for i in range(1, 6)])
+    coll.insert_many([{"id": f"x{i}", "id_num": None} for i in range(3)])
+    df = load_frame_partitioned(coll, workers=2, limit=7)
+    assert len(df) == 7
+    assert df["id"].tolist()[:5] == ["1", "2", "3", "4", "5"]
+    assert len(load_frame_partitioned(coll, workers=2, limit=4)) == 4
+    assert len(load_frame_partitioned(coll, workers=2)) == 8
+
+
+class _FakeClient:
+    def __init__(self, uri, **opts):
+        self.closed = False
+        self.fail = False
+        self.admin = self
+
+    def command(self, name):
+        if self.fail:
+            raise ConnectionError("down")
+        return {"ok": 1}
+
+    def close(self):
+        self.closed = True
+
+
+def test_registry_evicts_without_closing_shared_client(monkeypatch):
+    import mongo_backend
+
+    monkeypatch.setattr(mongo_backend, "MongoClient", _FakeClient)
+    reg = mongo_backend.ClientRegistry(health_check_s=0)
+    client = reg.get("mongodb://x")
+    client.fail = True
+    with pytest.raises(ConnectionError):
+        reg.get("mongodb://x")
+    assert not client.closed
+    assert reg.get("mongodb://x", check=False) is not client
+
+
+def test_registry_options_are_validated(monkeypatch):
+    import mongo_backend
+
+    monkeypatch.setattr(mongo_backend, "MongoClient", _FakeClient)
+    reg = mongo_backend.ClientRegistry()
+    a = reg.get("mongodb://x", check=False, compressors=["zstd"], authMechanismProperties={"a": "1"})
+    assert reg.get("mongodb://x", check=False, compressors=["zstd"], authMechanismProperties={"a": "1"}) is a
+    with pytest.raises(TypeError, match="no es hashable"):
+        reg.get("mongodb://x", check=False, bad=bytearray(b"x"))
+
+
+def test_refresh_rollup_reconciles_drift():
+    from datetime import datetime, timedelta
+
+    from mongo_backend import ensure_rollup, load_rollup, refresh_rollup, rollup_collection
+
+    coll = mongomock.MongoClient().db.customers
+    coll.insert_many([
+        {"id": str(i), "balance": float(i), "created_at": datetime(2024, 1 + i % 2, 5)} for i in range(1, 7)
+    ])
+    ensure_rollup(coll)
+    good = load_rollup(coll).sort_values(["created_ym", "metric"]).reset_index(drop=True)
+    rc = rollup_collection(coll)
+    rc.update_many({"metric": "balance"}, {"$inc": {"count": 3, "sum": 100.0}})  # deriva simulada
+    assert refresh_rollup(coll)  # reciente: no se recalcula
+    assert not load_rollup(coll)["count"].equals(good["count"])
+    rc.update_one({"_id": "__meta__"}, {"$set": {"built_at": datetime.utcnow() - timedelta(hours=2)}})
+    assert refresh_rollup(coll, max_age_s=3600)
+    pd.testing.assert_frame_equal(load_rollup(coll).sort_values(["created_ym", "metric"]).reset_index(drop=True), good)
@@ -0,0 +1,48 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+from mongo_backend import UPDATED_AT_FIELD  # noqa: E402
+from mongo_live import ChangeFeed  # noqa: E402
+
+
+T0 = datetime(2024, 1, 1, 12, 0, 0)
+
+
+def _drain(feed, delivered):
+    """Polls hasta vaciar la cola (como _run_poll) y devuelve las keys entregadas."""
+    start = len(delivered)
+    while feed.poll_once() == feed.max_batch:
+        pass
+    return [e["key"] for e in delivered[start:]]
+
+
+def test_poll_does_not_stall_on_same_timestamp_batch():
+    coll = mongomock.MongoClient().db.customers
+    coll.insert_many([{"id": str(i), "name": "x", UPDATED_AT_FIELD: T0} for i in range(3)])
+    delivered = []
+    feed = ChangeFeed(coll, on_changes=delivered.extend, mode="poll", max_batch=2)
+
+    assert sorted(_drain(feed, delivered)) == ["0", "1", "2"]
+    assert _drain(feed, delivered) == []
+
+    coll.insert_one({"id": "3", "name": "y", UPDATED_AT_FIELD: T0 + timedelta(seconds=1)})
+    coll.update_one({"id": "1"}, {"$set": {"name": "z", UPDATED_AT_FIELD: T0 + timedelta(seconds=2)}})
+    assert _drain(feed, delivered) == ["3", "1"]
+    assert delivered[-1]["row"]["name"] == "z"
+    assert _drain(feed, delivered) == []
+
+
+def test_poll_picks_up_inserts_without_updated_at():
+    coll = mongomock.MongoClient().db.customers
+    coll.insert_many([{"id": str(i), UPDATED_AT_FIELD: T0} for i in range(3)])
+    delivered = []
+    feed = ChangeFeed(coll, on_changes=delivered.extend, mode="poll", max_batch=2)
+    feed._init_watermarks()
+
+    assert _drain(feed, delivered) == []
+    coll.insert_one({"id": "9"})
+    assert _drain(feed, delivered) == ["9"]
+    assert _drain(feed, delivered) == []
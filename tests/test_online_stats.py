@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+from online_stats import ColumnStats, QuantileSketch
+
+
+@pytest.mark.parametrize("exact_rows", [10_000, 0])
+def test_quantiles_interpolate_between_ranks(exact_rows):
+    s = QuantileSketch(exact_rows=exact_rows)
+    s.update(np.array([1.0, 2.0, 3.0, 4.0]))
+    assert s.quantiles([0.5])[0] == pytest.approx(2.5, rel=2e-3)
+    s = QuantileSketch(exact_rows=exact_rows)
+    s.update(np.array([-5.0, -1.0, 0.0, 0.0, 2.0, 7.0]))
+    assert s.quantiles([0.75])[0] == pytest.approx(1.5, rel=2e-3)
+
+
+def test_small_columns_are_exact_and_follow_deltas():
+    x = np.random.default_rng(0).lognormal(size=2_000)
+    cs = ColumnStats.from_series(x)
+    assert cs.sketch.exact
+    assert list(cs.percentiles_iqr().values())[:3] == list(np.percentile(x, [25, 50, 75]))
+    cs.apply_delta(x[:10], x[:10] * 2)
+    y = np.concatenate([x[10:], x[:10] * 2])
+    assert cs.describe()["median"] == np.median(y)
+    q1, q3 = np.percentile(y, [25, 75])
+    fences = (q1 - 1.5 * (q3 - q1), q3 + 1.5 * (q3 - q1))
+    assert cs.outlier_counts()["iqr"] == int(((y < fences[0]) | (y > fences[1])).sum())
+
+
+def test_large_columns_fall_back_to_sketch():
+    cs = ColumnStats.from_series(np.arange(20_000, dtype=float), exact_rows=10_000)
+    assert not cs.sketch.exact
+    assert cs.describe()["median"] == pytest.approx(9_999.5, rel=1e-3)
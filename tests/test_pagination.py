@@ -0,0 +1,42 @@
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+from mongo_query import count_matches  # noqa: E402
+from pagination import KeysetPager  # noqa: E402
+
+
+def _coll(with_num, without_num):
+    coll = mongomock.MongoClient().db.customers
+    coll.insert_many([{"id": str(i), "id_num": i, "sex": "M" if i % 2 else "F"} for i in range(with_num)])
+    if without_num:
+        coll.insert_many([{"id": f"x{i}", "sex": "M"} for i in range(without_num)])
+    return coll
+
+
+def _all_pages(pager):
+    out, n = [], 1
+    while True:
+        docs = pager.page(n)
+        if not docs:
+            return out
+        out.extend(d["id"] for d in docs)
+        n += 1
+
+
+@pytest.mark.parametrize("flt", [{}, {"sex": "M"}])
+def test_keyset_pages_cover_count_when_docs_lack_id_num(flt):
+    coll = _coll(7, 2)
+    pager = KeysetPager(coll, flt, page_size=3, projection={"id_num": 0})
+    ids = _all_pages(pager)
+    assert not pager.seekable
+    assert len(ids) == len(set(ids)) == count_matches(coll, flt)
+    assert "x0" in ids
+
+
+def test_keyset_seeks_when_every_doc_has_id_num():
+    coll = _coll(7, 0)
+    pager = KeysetPager(coll, {}, page_size=3, projection={"id_num": 0})
+    assert _all_pages(pager) == [str(i) for i in range(7)]
+    assert pager.seekable and pager._bounds[3] == 5
+    assert pager.page(2)[0] == {k: v for k, v in coll.find_one({"id_num": 3}).items() if k != "id_num"}
@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+
+from sampling import describe_ci, stratified_sample
+
+
+def test_stratified_sample_respects_n_with_many_strata():
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({"v": rng.normal(size=20_000), "g": rng.integers(0, 5_000, 20_000)})
+    s = stratified_sample(df, 1_000, by="g")
+    assert s.n == 1_000
+    assert s.weights.sum() == len(df)
+
+
+def test_stratified_sample_keeps_minimum_per_stratum():
+    df = pd.DataFrame({"v": np.arange(1_000.0), "g": ["a"] * 990 + ["b"] * 10})
+    s = stratified_sample(df, 50, by="g")
+    assert s.n == 50
+    assert (s.frame["g"] == "b").sum() == 2
+
+
+def test_std_interval_covers_heavy_tailed_data():
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({"v": rng.lognormal(0, 1, 100_000), "g": rng.integers(0, 12, 100_000)})
+    true = df["v"].std()
+    hits = 0
+    for seed in range(40):
+        _, lo, hi = describe_ci(stratified_sample(df, 1_000, by="g", seed=seed), "v")["std"]
+        hits += lo <= true <= hi
+    assert hits >= 28  # la IC normal (sin curtosis) cubría ~11 de 40
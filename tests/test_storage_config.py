@@ -0,0 +1,80 @@
+import pandas as pd
+import pytest
+
+from storage_config import merge_wal, wal_append, wal_read
+
+
+def test_wal_numeric_keys_are_canonical(tmp_path):
+    base = str(tmp_path / "customers.parquet")
+    wal_append([{"id": 6, "name": "a"}], base_path=base)
+    wal_append([{"id": 6.0, "name": "b"}], base_path=base)
+    wal_append([{"id": "6", "name": "c"}], deletes=["7.0"], base_path=base)
+    entries = wal_read(base)
+    assert [e["key"] for e in entries] == [6, 6, 6, 7]
+
+    frame = pd.DataFrame({"id": [6, 7, 8], "name": ["x", "y", "z"]})
+    out = merge_wal(frame, entries, pk="id")
+    assert out["id"].tolist() == [6, 8]
+    assert out.loc[out["id"] == 6, "name"].tolist() == ["c"]
+
+
+def test_merge_wal_dedupes_mixed_key_forms():
+    frame = pd.DataFrame({"id": [1, 2], "name": ["x", "y"]})
+    entries = [
+        {"op": "upsert", "pk": "id", "key": "2", "row": {"id": "2", "name": "live"}},
+        {"op": "upsert", "pk": "id", "key": 2.0, "row": {"id": 2.0, "name": "last"}},
+    ]
+    out = merge_wal(frame, entries, pk="id")
+    assert out["id"].tolist() == [1, 2]
+    assert out["name"].tolist() == ["x", "last"]
+
+
+def _chunk_normalize(pdf):
+    # como _normalize_customers_df(fix_pk=False): la PK solo pasa a número
+    pdf = pdf.copy()
+    pdf["id"] = pd.to_numeric(pdf["id"], errors="coerce").astype("Int64")
+    pdf["email"] = pdf["email"].astype(str).str.lower()
+    return pdf
+
+
+def _write_csv(tmp_path, ids):
+    n = len(ids)
+    path = tmp_path / "customers.csv"
+    pd.DataFrame({
+        "id": ids,
+        "index_original": range(n),
+        "score": [0.5 * i for i in range(n)],
+        "flag": [i % 2 == 0 for i in range(n)],
+        "email": [f"U{i}@X.COM" for i in range(n)],
+        "zip": ["0100" if i % 3 else "x" for i in range(n)],
+    }).to_csv(path, index=False)
+    return str(path)
+
+
+def _load(kind, tmp_path, path):
+    from storage_config import import_csv_to_store, read_csv_chunked
+
+    if kind == "chunked":
+        return read_csv_chunked(path, normalize=_chunk_normalize, chunksize=4, keep_text=("email",))
+    return import_csv_to_store(path, str(tmp_path / "customers.parquet"), normalize=_chunk_normalize,
+                               chunksize=4, keep_text=("email",))
+
+
+@pytest.mark.parametrize("kind", ["chunked", "store"])
+def test_chunked_csv_keeps_read_csv_dtypes(tmp_path, kind):
+    path = _write_csv(tmp_path, list(range(1, 11)))
+    out = _load(kind, tmp_path, path)
+    baseline = pd.read_csv(path, low_memory=False)
+    for c in ("id", "index_original", "score", "flag", "zip"):
+        assert out[c].dtype == baseline[c].dtype, c
+    assert out["index_original"].tolist() == baseline["index_original"].tolist()
+    assert out["email"].tolist() == baseline["email"].str.lower().tolist()
+
+
+@pytest.mark.parametrize("kind", ["chunked", "store"])
+def test_chunked_csv_applies_pk_rule_once(tmp_path, kind):
+    # el primer chunk trae una PK nula; los demás, ids que no chocan con 1..4
+    path = _write_csv(tmp_path, [1, None, 3, 4] + list(range(1000, 1006)))
+    out = _load(kind, tmp_path, path)
+    assert out["id"].tolist() == list(range(1, 11))
+    assert out["id"].dtype == "int64"
@@ -0,0 +1,103 @@
+# text_index.py
+# Índice invertido de trigramas para búsquedas "contiene" case-insensitive.
+# - Se construye una vez por columna y versión del dataset, 100% vectorizado con numpy
+#   (trigramas sobre los bytes UTF-8 del texto en minúsculas; en UTF-8 una subcadena
+#   de caracteres es también una subcadena de bytes)
+# - Consulta: intersecta las listas de posteo de los trigramas de la búsqueda (de la
+#   más corta a la más larga) y solo verifica las filas candidatas
+# - Búsquedas de menos de 3 bytes no usan el índice (el llamador hace el scan)
+#
+# No depende de Streamlit.
+
+from __future__ import annotations
+
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+
+NGRAM = 3
+
+
+def _trigram_codes(buf: np.ndarray) -> np.ndarray:
+    """Código entero de 24 bits por trigrama de bytes que empieza en cada posición."""
+    b = buf.astype(np.int32)
+    return (b[:-2] << 16) | (b[1:-1] << 8) | b[2:]
+
+
+class NgramIndex:
+    def __init__(self, lower: pd.Series) -> None:
+        """'lower': textos ya en minúsculas, índice 0..n-1 (ver FilterEngine.lower)."""
+        self.lower = lower
+        self.n = len(lower)
+        # Todo el texto en un buffer, separado por NUL (no aparece en texto normal)
+        joined = "\x00".join(lower.str.replace("\x00", "", regex=False).tolist()) + "\x00"
+        buf = np.frombuffer(joined.encode("utf-8"), dtype=np.uint8)
+        if len(buf) < NGRAM:
+            self._codes = np.empty(0, dtype=np.int32)
+            self._offsets = np.zeros(1, dtype=np.int64)
+            self._rows = np.empty(0, dtype=np.int32)
+            return
+        sep = buf == 0
+        row = np.cumsum(sep) - sep  # fila de cada byte (el NUL cierra su propia fila)
+        # trigramas válidos: ninguno de sus 3 bytes es separador
+        valid = ~(sep[:-2] | sep[1:-1] | sep[2:])
+        codes = _trigram_codes(buf)[valid]
+        rows = row[:-2][valid].astype(np.int32)
+        # orden estable por código: dentro de cada código las filas quedan crecientes
+        order = np.argsort(codes, kind="stable")
+        codes = codes[order]
+        rows = rows[order]
+        # quitar (código, fila) repetidos
+        keep = np.ones(len(codes), dtype=bool)
+        keep[1:] = (codes[1:] != codes[:-1]) | (rows[1:] != rows[:-1])
+        codes = codes[keep]
+        rows = rows[keep]
+        starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+        self._codes = codes[starts]
+        self._offsets = np.r_[starts, len(codes)].astype(np.int64)
+        self._rows = rows
+
+    def _postings(self, code: int) -> np.ndarray:
+        i = int(np.searchsorted(self._codes, code))
+        if i >= len(self._codes) or self._codes[i] != code:
+            return np.empty(0, dtype=np.int32)
+        return self._rows[self._offsets[i]:self._offsets[i + 1]]
+
+    def candidates(self, q: str) -> Optional[np.ndarray]:
+        """Filas que contienen todos los trigramas de 'q' (None si 'q' es muy corta)."""
+        qb = np.frombuffer(str(q).lower().encode("utf-8"), dtype=np.uint8)
+        if len(qb) < NGRAM:
+            return None
+        codes = np.unique(_trigram_codes(qb))
+        postings = sorted((self._postings(int(c)) for c in codes), key=len)
+        out = postings[0]
+        for p in postings[1:]:
+            if not len(out):
+                break
+            out = np.intersect1d(out, p, assume_unique=True)
+        return out
+
+    def search(self, q: str) -> Optional[np.ndarray]:
+        """Posiciones (ordenadas) cuyo texto contiene 'q'; None si 'q' es muy corta."""
+        cand = self.candidates(q)
+        if cand is None or not len(cand):
+            return cand
+        ql = str(q).lower()
+        hit = self.lower.take(cand).str.contains(ql, regex=False).to_numpy(dtype=bool, na_value=False)
+        return cand[hit].astype(np.int64)
+
+    def mask(self, q: str) -> Optional[np.ndarray]:
+        """Como search() pero en máscara booleana de largo n."""
+        pos = self.search(q)
+        if pos is None:
+            return None
+        m = np.zeros(self.n, dtype=bool)
+        m[pos] = True
+        return m
+
+
+__all__ = [
+    "NgramIndex",
+]